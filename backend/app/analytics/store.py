@@ -60,6 +60,15 @@ def record_query_event(
     retrieved_k: int,
     citations_count: int,
     model: str | None,
+    context_tokens: int | None = None,
+    context_tokens_raw: int | None = None,
+    prompt_tokens: int | None = None,
+    ttft_ms: int | None = None,
+    fallback_reason: str | None = None,
+    coalesced: bool = False,
+    degradation_tier: str | None = None,
+    route: str | None = None,
+    llm_backend: str | None = None,
 ) -> str:
     event_id = uuid.uuid4().hex
     query_hash = hashlib.sha256(query_text.strip().lower().encode("utf-8")).hexdigest()
@@ -79,6 +88,15 @@ def record_query_event(
             "retrieved_k": int(retrieved_k),
             "citations_count": int(citations_count),
             "model": model,
+            "context_tokens": context_tokens,
+            "context_tokens_raw": context_tokens_raw,
+            "prompt_tokens": prompt_tokens,
+            "ttft_ms": ttft_ms,
+            "fallback_reason": fallback_reason,
+            "coalesced": bool(coalesced),
+            "degradation_tier": degradation_tier,
+            "route": route,
+            "llm_backend": llm_backend,
         }
     )
 
@@ -149,8 +167,23 @@ def get_analytics_summary(city_id: str | None = None, days: int = 7) -> dict[str
         feedback_by_query[qid] = fb
 
     refused_count = sum(1 for q in query_events if q.get("refused"))
+    coalesced_count = sum(1 for q in query_events if q.get("coalesced"))
+    fallback_counter = Counter(str(q["fallback_reason"]) for q in query_events if q.get("fallback_reason"))
+    route_counter = Counter(str(q["route"]) for q in query_events if q.get("route"))
+    backend_counter = Counter(str(q["llm_backend"]) for q in query_events if q.get("llm_backend"))
+    tier_counter = Counter(str(q["degradation_tier"]) for q in query_events if q.get("degradation_tier"))
+    shed_by_city = Counter(str(q.get("city_id")) for q in query_events if q.get("fallback_reason") == "shed")
     latencies = [int(q.get("latency_ms", 0)) for q in query_events if isinstance(q.get("latency_ms"), int)]
     retrieved_ks = [int(q.get("retrieved_k", 0)) for q in query_events if isinstance(q.get("retrieved_k"), int)]
+    ttfts = [int(q["ttft_ms"]) for q in query_events if isinstance(q.get("ttft_ms"), int)]
+    prompt_tokens = [int(q["prompt_tokens"]) for q in query_events if isinstance(q.get("prompt_tokens"), int)]
+    context_ratios = [
+        q["context_tokens"] / q["context_tokens_raw"]
+        for q in query_events
+        if isinstance(q.get("context_tokens"), int)
+        and isinstance(q.get("context_tokens_raw"), int)
+        and q["context_tokens_raw"] > 0
+    ]
 
     helpful_count = sum(1 for f in feedback_events if f.get("helpful") is True)
     escalation_count = sum(1 for f in feedback_events if f.get("escalation_requested") is True)
@@ -169,7 +202,17 @@ def get_analytics_summary(city_id: str | None = None, days: int = 7) -> dict[str
             "total": total_queries,
             "refusal_rate": round(refused_count / total_queries, 4) if total_queries else 0.0,
             "median_latency_ms": median(latencies) if latencies else 0,
+            "coalesced_rate": round(coalesced_count / total_queries, 4) if total_queries else 0.0,
             "avg_retrieved_k": round(sum(retrieved_ks) / len(retrieved_ks), 2) if retrieved_ks else 0.0,
+            "median_ttft_ms": median(ttfts) if ttfts else 0,
+            "avg_prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens), 1) if prompt_tokens else 0.0,
+            "fallback_reasons": dict(fallback_counter),
+            "shed_by_city": dict(shed_by_city),
+            "degradation_tiers": dict(tier_counter),
+            "routes": dict(route_counter),
+            "llm_calls_saved": route_counter.get("extractive", 0),
+            "llm_backends": dict(backend_counter),
+            "avg_context_ratio": round(sum(context_ratios) / len(context_ratios), 4) if context_ratios else 0.0,
         },
         "feedback": {
             "total": total_feedback,
@@ -1,12 +1,13 @@
 from pathlib import Path
+from typing import Literal
 
-import yaml
 from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
 
 from backend.app.analytics.store import get_analytics_summary
+from backend.app.cities import City, get_registry
 from backend.app.config import get_settings
-from backend.app.ingestion.sync import sync_city
 from backend.app.vector.qdrant import collection_health
 
 router = APIRouter()
@@ -28,76 +29,211 @@ def require_admin_key(x_admin_api_key: str | None = Header(default=None)) -> Non
         raise HTTPException(status_code=401, detail="invalid admin key")
 
 
-def _city_path(city_id: str) -> Path:
-    return settings.city_dir / city_id
-
-
-@router.post("/cities", dependencies=[Depends(require_admin_key)])
-def create_city(req: CityCreateRequest) -> dict:
-    city_path = _city_path(req.city_id)
-    city_path.mkdir(parents=True, exist_ok=True)
+def _city(city_id: str) -> City:
+    city = get_registry().get(city_id)
+    if city is None:
+        raise HTTPException(status_code=404, detail="city not found")
+    return city
 
-    city_yaml = city_path / "city.yaml"
-    sources_yaml = city_path / "sources.yaml"
 
-    if city_yaml.exists():
-        raise HTTPException(status_code=409, detail="city already exists")
+@router.get("/cities", dependencies=[Depends(require_admin_key)])
+def list_cities() -> dict:
+    registry = get_registry()
+    cities = [registry.get(city_id) for city_id in registry.ids()]
+    return {
+        "cities": [
+            {"city_id": c.city_id, "name": c.name, "sources": len(c.sources), "overrides": c.overrides}
+            for c in cities
+            if c is not None
+        ],
+        "registry": registry.stats(),
+    }
 
-    city_yaml.write_text(
-        yaml.safe_dump({"city_id": req.city_id, "name": req.name}, sort_keys=False),
-        encoding="utf-8",
-    )
 
-    if not sources_yaml.exists():
-        sources_yaml.write_text(yaml.safe_dump({"sources": []}, sort_keys=False), encoding="utf-8")
+@router.post("/cities", dependencies=[Depends(require_admin_key)])
+def create_city(req: CityCreateRequest) -> dict:
+    try:
+        get_registry().create(req.city_id, req.name)
+    except FileExistsError as exc:
+        raise HTTPException(status_code=409, detail="city already exists") from exc
 
     return {"status": "created", "city_id": req.city_id}
 
 
 @router.post("/sources", dependencies=[Depends(require_admin_key)])
 def add_sources(req: SourceAddRequest) -> dict:
-    city_path = _city_path(req.city_id)
-    sources_yaml = city_path / "sources.yaml"
-
-    if not city_path.exists() or not sources_yaml.exists():
-        raise HTTPException(status_code=404, detail="city not found")
-
-    data = yaml.safe_load(sources_yaml.read_text(encoding="utf-8")) or {"sources": []}
-    existing = {item["uri"] for item in data.get("sources", []) if isinstance(item, dict) and "uri" in item}
+    sources = list(_city(req.city_id).sources)
+    existing = {item["uri"] for item in sources if isinstance(item, dict) and "uri" in item}
 
     for uri in req.sources:
         if uri not in existing:
-            data.setdefault("sources", []).append({"type": "url", "uri": uri})
+            sources.append({"type": "url", "uri": uri})
+            existing.add(uri)
 
-    sources_yaml.write_text(yaml.safe_dump(data, sort_keys=False), encoding="utf-8")
+    city = get_registry().write_sources(req.city_id, sources)
 
-    return {"status": "updated", "city_id": req.city_id, "sources": len(data.get("sources", []))}
+    return {"status": "updated", "city_id": req.city_id, "sources": len(city.sources)}
 
 
 @router.post("/sync", dependencies=[Depends(require_admin_key)])
 def sync(city_id: str) -> dict:
-    if not _city_path(city_id).exists():
-        raise HTTPException(status_code=404, detail="city not found")
-    return sync_city(city_id)
+    _city(city_id)
+    # Ingestion dependencies (bs4/lxml, crawler) load only on workers that actually sync.
+    from backend.app.ingestion.state import SyncInProgress
+    from backend.app.ingestion.sync import sync_city
+
+    try:
+        return sync_city(city_id)
+    except SyncInProgress as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+
+@router.post("/sync/enqueue", dependencies=[Depends(require_admin_key)])
+def sync_enqueue(city_id: str) -> dict:
+    """Queues the city's sources for standalone sync workers instead of syncing in-process."""
+    city = _city(city_id)
+    from backend.app.db.jobs import enqueue_city
+
+    return enqueue_city(city_id, city.name, city.sources)
+
+
+@router.get("/sync/jobs", dependencies=[Depends(require_admin_key)])
+def sync_jobs(city_id: str | None = None) -> dict:
+    from backend.app.db.jobs import job_stats
+
+    return job_stats(city_id)
+
+
+@router.post("/reindex", dependencies=[Depends(require_admin_key)])
+def reindex(city_id: str) -> dict:
+    _city(city_id)
+    from backend.app.ingestion.state import SyncInProgress
+    from backend.app.ingestion.sync import reindex_city_from_catalog
+
+    try:
+        return reindex_city_from_catalog(city_id)
+    except SyncInProgress as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+
+@router.get("/crawl", dependencies=[Depends(require_admin_key)])
+def crawl(city_id: str) -> dict:
+    _city(city_id)
+    from backend.app.ingestion.crawl import crawl_status
+
+    return crawl_status(city_id)
+
+
+@router.get("/index", dependencies=[Depends(require_admin_key)])
+def index() -> dict:
+    from backend.app.ingestion.rebuild import index_status
+
+    return index_status()
+
+
+@router.post("/index/rebuild", dependencies=[Depends(require_admin_key)])
+def index_rebuild(source: Literal["catalog", "crawl"] = "catalog") -> dict:
+    from backend.app.ingestion.rebuild import RebuildInProgress, start_rebuild
+    from backend.app.vector.qdrant import UnversionedCollection
+
+    try:
+        return start_rebuild(source)
+    except (RebuildInProgress, UnversionedCollection) as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+
+@router.post("/index/rollback", dependencies=[Depends(require_admin_key)])
+def index_rollback() -> dict:
+    from backend.app.ingestion.rebuild import RebuildInProgress, rollback
+    from backend.app.vector.qdrant import UnversionedCollection
+
+    try:
+        return rollback()
+    except (RebuildInProgress, UnversionedCollection) as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+
+
+def _bundle_path(name: str) -> Path:
+    path = settings.bundle_dir / name
+    if path.name != name or not name.endswith(".ocb"):
+        raise HTTPException(status_code=400, detail="invalid bundle name")
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="bundle not found")
+    return path
+
+
+@router.get("/bundles", dependencies=[Depends(require_admin_key)])
+def bundles() -> dict:
+    from backend.app.ingestion.bundle import list_bundles
+
+    return {"bundles": list_bundles()}
+
+
+@router.post("/bundles/export", dependencies=[Depends(require_admin_key)])
+def bundle_export(city_id: str, dtype: Literal["float32", "int8"] | None = None) -> dict:
+    _city(city_id)
+    from backend.app.ingestion.bundle import export_bundle
+    from backend.app.ingestion.state import SyncInProgress
+
+    try:
+        info = export_bundle(city_id, dtype=dtype)
+    except SyncInProgress as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    info["name"] = Path(info.pop("path")).name
+    return info
+
+
+@router.get("/bundles/{name}", dependencies=[Depends(require_admin_key)])
+def bundle_download(name: str) -> FileResponse:
+    return FileResponse(_bundle_path(name), media_type="application/octet-stream", filename=name)
+
+
+@router.post("/bundles/import", dependencies=[Depends(require_admin_key)])
+def bundle_import(name: str, verify: bool = True) -> dict:
+    """Loads a bundle from the bundle directory; copy it there from another node's download endpoint."""
+    path = _bundle_path(name)
+    from backend.app.ingestion.bundle import BundleError, BundleMismatch, import_bundle
+    from backend.app.ingestion.state import SyncInProgress
+
+    try:
+        return import_bundle(path, verify=verify)
+    except (SyncInProgress, BundleMismatch) as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except BundleError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.get("/chunks", dependencies=[Depends(require_admin_key)])
+def chunks(
+    city_id: str,
+    uri: str | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0),
+) -> dict:
+    from backend.app.db.catalog import list_chunks
+
+    return {"city_id": city_id, "chunks": list_chunks(city_id, uri=uri, limit=limit, offset=offset)}
 
 
 @router.get("/status", dependencies=[Depends(require_admin_key)])
 def status(city_id: str) -> dict:
-    city_path = _city_path(city_id)
-    if not city_path.exists():
-        raise HTTPException(status_code=404, detail="city not found")
-
-    sources_yaml = city_path / "sources.yaml"
-    source_count = 0
-    if sources_yaml.exists():
-        data = yaml.safe_load(sources_yaml.read_text(encoding="utf-8")) or {}
-        source_count = len(data.get("sources", []))
+    city = _city(city_id)
 
-    return {
+    out = {
         "city_id": city_id,
-        "sources": source_count,
+        "sources": len(city.sources),
+        "overrides": city.overrides,
         "vector_collection": collection_health(),
     }
+    if settings.embedding_workers > 0:
+        from backend.app.embedding.pool import get_pool
+
+        out["embedding_pool"] = get_pool().stats()
+    return out
 
 
 @router.get("/analytics", dependencies=[Depends(require_admin_key)])
@@ -105,4 +241,18 @@ def analytics(
     city_id: str | None = Query(default=None, min_length=2),
     days: int = Query(default=7, ge=1, le=90),
 ) -> dict:
-    return get_analytics_summary(city_id=city_id, days=days)
+    out = get_analytics_summary(city_id=city_id, days=days)
+    if settings.scheduler_enabled:
+        from backend.app.rag.scheduler import get_scheduler
+
+        # Live, since process start: per-city queue depth, running slots and shed counts.
+        out["scheduler"] = get_scheduler().stats(city_id)
+    from backend.app.rag.llm_backends import get_backends
+
+    # Live, since process start: health, breaker state, load, errors and latency per backend.
+    out["llm_backends"] = get_backends().stats()
+    if settings.session_enabled:
+        from backend.app.rag.sessions import get_session_store
+
+        out["sessions"] = get_session_store().stats()
+    return out
@@ -1,16 +1,22 @@
+import json
 import time
 import uuid
 from typing import Literal
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from backend.app.analytics.store import record_feedback_event, record_query_event
-from backend.app.rag.pipeline import run_rag
+from backend.app.api.admin import require_admin_key
+from backend.app.cities import get_registry
+from backend.app.config import get_settings
+from backend.app.rag.pipeline import run_rag, run_rag_batch
+from backend.app.rag.sse import format_sse
 from backend.app.rag.stream import stream_answer
 
 router = APIRouter()
+settings = get_settings()
 FeedbackReason = Literal["missing_info", "incorrect", "unclear", "outdated", "other"]
 
 
@@ -18,6 +24,18 @@ class QueryRequest(BaseModel):
     city_id: str = Field(min_length=2)
     query: str = Field(min_length=2)
     session_id: str | None = None
+    deadline_ms: int | None = Field(default=None, ge=500, le=120_000)
+
+
+class BatchQueryItem(BaseModel):
+    city_id: str = Field(min_length=2)
+    query: str = Field(min_length=2)
+
+
+class BatchQueryRequest(BaseModel):
+    items: list[BatchQueryItem] = Field(min_length=1)
+    concurrency: int | None = Field(default=None, ge=1, le=16)
+    record_analytics: bool = False
 
 
 class FeedbackRequest(BaseModel):
@@ -30,40 +48,85 @@ class FeedbackRequest(BaseModel):
     session_id: str | None = None
 
 
-@router.post("/query")
-def query(req: QueryRequest) -> dict:
-    query_id = uuid.uuid4().hex
-    started = time.perf_counter()
-
-    result = run_rag(city_id=req.city_id, query=req.query, session_id=req.session_id)
+def _require_city(city_id: str) -> None:
+    # A dict lookup, so a mistyped city never costs an embedding and an empty search.
+    if city_id not in get_registry():
+        raise HTTPException(status_code=404, detail=f"unknown city_id: {city_id}")
 
-    latency_ms = int((time.perf_counter() - started) * 1000)
-    meta = result.setdefault("meta", {})
-    meta["query_id"] = query_id
-    meta["latency_ms"] = latency_ms
 
+def _record(city_id: str, query_text: str, session_id: str | None, result: dict) -> None:
+    meta = result["meta"]
     try:
         record_query_event(
-            city_id=req.city_id,
-            query_id=query_id,
-            query_text=req.query,
-            session_id=req.session_id,
-            latency_ms=latency_ms,
+            city_id=city_id,
+            query_id=meta["query_id"],
+            query_text=query_text,
+            session_id=session_id,
+            latency_ms=meta["latency_ms"],
             refused=bool(meta.get("refused", False)),
             refusal_reason=str(meta.get("reason")) if meta.get("reason") else None,
             retrieved_k=int(meta.get("retrieved_k", 0)),
             citations_count=len(result.get("citations", [])),
             model=str(meta.get("model")) if meta.get("model") else None,
+            context_tokens=meta.get("context_tokens"),
+            context_tokens_raw=meta.get("context_tokens_raw"),
+            prompt_tokens=meta.get("prompt_tokens"),
+            ttft_ms=meta.get("ttft_ms"),
+            fallback_reason=meta.get("fallback_reason"),
+            coalesced=bool(meta.get("coalesced", False)),
+            degradation_tier=meta.get("degradation_tier"),
+            route=meta.get("route"),
+            llm_backend=meta.get("llm_backend"),
         )
     except Exception:  # noqa: BLE001
         # Keep query path available even if analytics storage is temporarily unavailable.
         meta["analytics_logged"] = False
 
+
+@router.post("/query")
+def query(req: QueryRequest) -> dict:
+    _require_city(req.city_id)
+    query_id = uuid.uuid4().hex
+    started = time.perf_counter()
+
+    result = run_rag(city_id=req.city_id, query=req.query, session_id=req.session_id, deadline_ms=req.deadline_ms)
+
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    meta = result.setdefault("meta", {})
+    meta["query_id"] = query_id
+    meta["latency_ms"] = latency_ms
+
+    _record(req.city_id, req.query, req.session_id, result)
     return result
 
 
+@router.post("/query/batch", dependencies=[Depends(require_admin_key)])
+def query_batch(req: BatchQueryRequest) -> StreamingResponse:
+    if len(req.items) > settings.batch_max_items:
+        raise HTTPException(status_code=422, detail=f"at most {settings.batch_max_items} items per batch")
+
+    registry = get_registry()
+    unknown = sorted({item.city_id for item in req.items if item.city_id not in registry})
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"unknown city_id: {', '.join(unknown)}")
+    items = [(item.city_id, item.query) for item in req.items]
+
+    def _lines():
+        started = time.perf_counter()
+        for result in run_rag_batch(items, concurrency=req.concurrency):
+            meta = result.setdefault("meta", {})
+            meta["query_id"] = uuid.uuid4().hex
+            meta["latency_ms"] = int((time.perf_counter() - started) * 1000)
+            if req.record_analytics:
+                _record(meta["city_id"], result["query"], None, result)
+            yield json.dumps(result, ensure_ascii=True) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
 @router.post("/feedback")
 def feedback(req: FeedbackRequest) -> dict:
+    _require_city(req.city_id)
     feedback_id = record_feedback_event(
         city_id=req.city_id,
         query_id=req.query_id,
@@ -82,6 +145,9 @@ async def query_stream(req: Request) -> StreamingResponse:
     city_id = str(body.get("city_id", "")).strip()
     query = str(body.get("query", "")).strip()
     session_id = body.get("session_id")
+    deadline_ms = body.get("deadline_ms")
+    if not isinstance(deadline_ms, int) or not 500 <= deadline_ms <= 120_000:
+        deadline_ms = None
 
     if not city_id or not query:
         def _bad_request():
@@ -89,7 +155,19 @@ async def query_stream(req: Request) -> StreamingResponse:
 
         return StreamingResponse(_bad_request(), media_type="text/event-stream")
 
+    if city_id not in get_registry():
+        def _unknown_city():
+            yield format_sse("error", {"error": f"unknown city_id: {city_id}"})
+
+        return StreamingResponse(_unknown_city(), media_type="text/event-stream")
+
     return StreamingResponse(
-        stream_answer(city_id=city_id, query=query, session_id=session_id),
+        stream_answer(
+            city_id=city_id,
+            query=query,
+            session_id=session_id,
+            gzip_meta=bool(body.get("gzip_meta")),
+            deadline_ms=deadline_ms,
+        ),
         media_type="text/event-stream",
     )
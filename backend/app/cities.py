@@ -0,0 +1,215 @@
+"""In-memory registry of configured cities, mirrored from ``cities/<city_id>/{city,sources}.yaml``.
+
+Requests look cities up in a dict instead of parsing YAML, so an unknown ``city_id`` is rejected
+before any embedding or search. A daemon thread polls the files' mtimes every
+``CITY_REGISTRY_POLL_SEC`` and reparses only the cities that changed. Writes made through the
+registry go to a temp file that is renamed into place and are visible immediately.
+
+``city.yaml`` may carry per-city overrides of a few settings::
+
+    city_id: san_francisco
+    name: San Francisco
+    settings:
+      retrieval_top_k: 12
+      similarity_threshold: 0.4
+      ollama_model: llama3.1:8b
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+from pydantic import TypeAdapter, ValidationError
+
+from backend.app.config import Settings, get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CITY_OVERRIDES = (
+    "retrieval_top_k",
+    "similarity_threshold",
+    "coverage_threshold",
+    "min_keyword_count",
+    "answer_coverage_threshold",
+    "groundedness_threshold",
+    "route_extractive_enabled",
+    "route_confidence_threshold",
+    "ollama_model",
+)
+
+_Stamp = tuple[int, int, int, int]
+
+
+@dataclass(frozen=True)
+class City:
+    city_id: str
+    name: str
+    sources: list[dict]
+    overrides: dict
+    # Global settings with the overrides applied; the global object itself when there are none.
+    settings: Settings = field(repr=False)
+
+
+def _stamp(path: Path) -> _Stamp | None:
+    try:
+        city = (path / "city.yaml").stat()
+    except FileNotFoundError:
+        return None
+    try:
+        src = (path / "sources.yaml").stat()
+        src_stamp = (src.st_mtime_ns, src.st_size)
+    except FileNotFoundError:
+        src_stamp = (0, -1)
+    return (city.st_mtime_ns, city.st_size, *src_stamp)
+
+
+def _overrides(city_id: str, raw) -> dict:
+    if not isinstance(raw, dict):
+        return {}
+    out = {}
+    for key, value in raw.items():
+        if key not in CITY_OVERRIDES:
+            logger.warning("city %s: ignoring unknown setting override %r", city_id, key)
+            continue
+        try:
+            out[key] = TypeAdapter(Settings.model_fields[key].annotation).validate_python(value)
+        except ValidationError as exc:
+            logger.warning("city %s: invalid value for %s: %s", city_id, key, exc.errors()[0]["msg"])
+    return out
+
+
+def _parse(city_id: str, path: Path) -> City:
+    meta = yaml.safe_load((path / "city.yaml").read_text(encoding="utf-8"))
+    if not isinstance(meta, dict):
+        meta = {}
+    sources_yaml = path / "sources.yaml"
+    data = yaml.safe_load(sources_yaml.read_text(encoding="utf-8")) if sources_yaml.exists() else None
+    if not isinstance(data, dict):
+        data = {}
+    overrides = _overrides(city_id, meta.get("settings"))
+    return City(
+        city_id=city_id,
+        name=str(meta.get("name") or city_id),
+        sources=list(data.get("sources") or []),
+        overrides=overrides,
+        settings=settings.model_copy(update=overrides) if overrides else settings,
+    )
+
+
+def _atomic_write(path: Path, data: dict) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yaml.safe_dump(data, f, sort_keys=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class CityRegistry:
+    def __init__(self) -> None:
+        self._cities: dict[str, City] = {}
+        self._stamps: dict[str, _Stamp] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.reloads = 0
+        self.errors = 0
+
+    def __contains__(self, city_id: str) -> bool:
+        return city_id in self._cities
+
+    def get(self, city_id: str) -> City | None:
+        return self._cities.get(city_id)
+
+    def ids(self) -> list[str]:
+        return sorted(self._cities)
+
+    def refresh(self) -> list[str]:
+        """Reparses cities whose files changed and drops removed ones; returns the changed ids."""
+        with self._lock:
+            root = settings.city_dir
+            stamps = {}
+            if root.exists():
+                for path in root.iterdir():
+                    stamp = _stamp(path) if path.is_dir() else None
+                    if stamp is not None:
+                        stamps[path.name] = stamp
+            cities = {cid: city for cid, city in self._cities.items() if cid in stamps}
+            changed = [cid for cid in self._cities if cid not in stamps]
+            for city_id, stamp in stamps.items():
+                if self._stamps.get(city_id) == stamp:
+                    continue
+                try:
+                    cities[city_id] = _parse(city_id, root / city_id)
+                except (OSError, yaml.YAMLError) as exc:
+                    # Keep serving the last good version; the file is retried once it changes again.
+                    self.errors += 1
+                    logger.warning("city %s: could not load config: %s", city_id, exc)
+                    continue
+                changed.append(city_id)
+                self.reloads += 1
+            self._stamps = stamps
+            # Readers never lock: they see either the old dict or the new one.
+            self._cities = cities
+        return changed
+
+    def create(self, city_id: str, name: str) -> City:
+        path = settings.city_dir / city_id
+        path.mkdir(parents=True, exist_ok=True)
+        if (path / "city.yaml").exists():
+            raise FileExistsError(f"city {city_id} already exists")
+        if not (path / "sources.yaml").exists():
+            _atomic_write(path / "sources.yaml", {"sources": []})
+        _atomic_write(path / "city.yaml", {"city_id": city_id, "name": name})
+        self.refresh()
+        return self._cities[city_id]
+
+    def write_sources(self, city_id: str, sources: list[dict]) -> City:
+        if city_id not in self._cities:
+            raise KeyError(city_id)
+        _atomic_write(settings.city_dir / city_id / "sources.yaml", {"sources": sources})
+        self.refresh()
+        return self._cities[city_id]
+
+    def _poll(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("city registry refresh failed: %s", exc)
+
+    def start(self, interval: float) -> None:
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._poll, args=(interval,), name="city-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {"cities": len(self._cities), "reloads": self.reloads, "errors": self.errors}
+
+
+@lru_cache(maxsize=1)
+def get_registry() -> CityRegistry:
+    registry = CityRegistry()
+    registry.refresh()
+    registry.start(settings.city_registry_poll_sec)
+    return registry
+
+
+def city_settings(city_id: str) -> Settings:
+    """Settings for serving ``city_id``: the global ones plus the city's overrides, if any."""
+    city = get_registry().get(city_id)
+    return city.settings if city is not None else settings
@@ -0,0 +1,147 @@
+import json
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+
+from qdrant_client.models import PointStruct
+from sqlalchemy import delete, insert, select
+
+from backend.app.config import get_settings
+from backend.app.db.models import Chunk
+from backend.app.db.postgres import SessionLocal, engine, init_db
+
+settings = get_settings()
+
+_COLUMNS = (
+    "chunk_id",
+    "city_id",
+    "doc_id",
+    "uri",
+    "chunk_index",
+    "point_id",
+    "content_hash",
+    "text",
+    "metadata_json",
+    "updated_at",
+)
+# Payload keys that have their own column; everything else (title, keywords, ...) goes to metadata_json.
+_PAYLOAD_COLUMNS = {"city_id", "doc_id", "chunk_id", "chunk_index", "uri", "text", "content_hash", "updated_at"}
+
+
+def _row(point_id: str, p: dict) -> dict:
+    return {
+        "chunk_id": p["chunk_id"],
+        "city_id": p["city_id"],
+        "doc_id": p["doc_id"],
+        "uri": p["uri"],
+        "chunk_index": int(p.get("chunk_index", 0)),
+        "point_id": point_id,
+        "content_hash": p.get("content_hash", ""),
+        "text": p.get("text", ""),
+        "metadata_json": {k: v for k, v in p.items() if k not in _PAYLOAD_COLUMNS},
+        "updated_at": datetime.fromisoformat(p["updated_at"]) if p.get("updated_at") else None,
+    }
+
+
+def row_payload(row: dict) -> dict:
+    return {
+        **(row.get("metadata_json") or {}),
+        **{k: row[k] for k in _PAYLOAD_COLUMNS if k in row},
+    }
+
+
+class ChunkCatalogWriter:
+    """Buffers a sync's chunks and writes them to Postgres in bulk.
+
+    Each flush replaces every buffered source's rows in one transaction, streaming new
+    rows with ``COPY`` on Postgres (``executemany`` on other dialects).
+    """
+
+    def __init__(self, city_id: str, batch_rows: int | None = None) -> None:
+        init_db()
+        self.city_id = city_id
+        self.batch_rows = batch_rows or settings.chunk_catalog_batch_rows
+        self._uris: list[str] = []
+        self._rows: list[dict] = []
+
+    def add(self, uri: str, points: list[PointStruct]) -> None:
+        self._uris.append(uri)
+        self._rows.extend(_row(str(p.id), p.payload or {}) for p in points)
+
+    @property
+    def full(self) -> bool:
+        return len(self._rows) >= self.batch_rows
+
+    def flush(self) -> int:
+        if not self._uris:
+            return 0
+        with engine.begin() as conn:
+            conn.execute(delete(Chunk).where(Chunk.city_id == self.city_id, Chunk.uri.in_(self._uris)))
+            _write_rows(conn, self._rows)
+        written = len(self._rows)
+        self._uris.clear()
+        self._rows.clear()
+        return written
+
+
+def _write_rows(conn, rows: list[dict]) -> None:
+    if rows and conn.dialect.name == "postgresql":
+        cursor = conn.connection.driver_connection.cursor()
+        with cursor.copy(f"COPY {Chunk.__tablename__} ({', '.join(_COLUMNS)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row([json.dumps(row[c]) if c == "metadata_json" else row[c] for c in _COLUMNS])
+    elif rows:
+        conn.execute(insert(Chunk), rows)
+
+
+def replace_city_rows(city_id: str, items: Iterable[list[tuple[str, dict]]]) -> int:
+    """Swaps a city's whole catalog for batches of (point_id, payload) in one transaction."""
+    init_db()
+    written = 0
+    with engine.begin() as conn:
+        conn.execute(delete(Chunk).where(Chunk.city_id == city_id))
+        for batch in items:
+            rows = [_row(point_id, payload) for point_id, payload in batch]
+            _write_rows(conn, rows)
+            written += len(rows)
+    return written
+
+
+def source_hash(city_id: str, uri: str) -> str | None:
+    """Content hash a source was last indexed with, shared by every sync worker."""
+    init_db()
+    stmt = select(Chunk.content_hash).where(Chunk.city_id == city_id, Chunk.uri == uri).limit(1)
+    with engine.connect() as conn:
+        return conn.scalar(stmt)
+
+
+def list_chunks(city_id: str, uri: str | None = None, limit: int = 100, offset: int = 0) -> list[dict]:
+    init_db()
+    stmt = select(Chunk).where(Chunk.city_id == city_id)
+    if uri:
+        stmt = stmt.where(Chunk.uri == uri)
+    stmt = stmt.order_by(Chunk.uri, Chunk.chunk_index).limit(limit).offset(offset)
+    with SessionLocal() as session:
+        return [
+            {
+                "chunk_id": c.chunk_id,
+                "uri": c.uri,
+                "chunk_index": c.chunk_index,
+                "title": (c.metadata_json or {}).get("title", "Untitled"),
+                "content_hash": c.content_hash,
+                "updated_at": c.updated_at.isoformat() if c.updated_at else None,
+                "text": c.text,
+            }
+            for c in session.scalars(stmt)
+        ]
+
+
+def iter_city_rows(city_id: str, batch: int = 256) -> Iterator[list[dict]]:
+    init_db()
+    stmt = select(*(getattr(Chunk, c) for c in _COLUMNS)).where(Chunk.city_id == city_id)
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch).execute(stmt)
+        for part in result.mappings().partitions(batch):
+            yield [
+                {**r, "updated_at": r["updated_at"].isoformat() if r["updated_at"] else None}
+                for r in (dict(m) for m in part)
+            ]
@@ -0,0 +1,211 @@
+"""Postgres-backed queue of per-source sync work for standalone sync workers.
+
+Workers claim jobs with ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent claimers on any
+number of nodes never block on or receive the same row. A claimed job carries a lease that the
+worker extends with heartbeats; a job whose lease runs out (worker crashed or partitioned) is
+claimable again. Failures are retried with exponential backoff up to ``max_attempts``.
+
+All timestamps come from the workers' clocks, which are assumed to be NTP-synced; leases are
+long compared to any realistic skew.
+"""
+
+import hashlib
+import random
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from backend.app.config import get_settings
+from backend.app.db.models import City, Source, SyncJob
+from backend.app.db.postgres import SessionLocal, engine, init_db
+
+settings = get_settings()
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_MAX_BACKOFF_SEC = 3600
+
+
+def _utc_now() -> datetime:
+    return datetime.now(UTC)
+
+
+def source_id(city_id: str, uri: str) -> str:
+    return hashlib.sha1(f"{city_id}\n{uri}".encode("utf-8")).hexdigest()
+
+
+def _insert(dialect: str):
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+
+def enqueue_city(city_id: str, name: str, sources: list[dict]) -> dict:
+    """Mirrors a city's sources.yaml into ``sources`` and queues one job per enabled source.
+
+    Sources that already have a queued or running job are left alone.
+    """
+    init_db()
+    now = _utc_now()
+    batch_id = uuid.uuid4().hex
+    wanted = {}
+    for src in sources:
+        uri = (src.get("uri") or "").strip()
+        if uri:
+            wanted[source_id(city_id, uri)] = src
+
+    with SessionLocal() as session:
+        session.merge(City(city_id=city_id, name=name))
+        for sid, src in wanted.items():
+            session.merge(
+                Source(id=sid, city_id=city_id, type=src.get("type", "url"), uri=src["uri"].strip(), enabled=True)
+            )
+        # Sources dropped from sources.yaml stop being synced.
+        stale = update(Source).where(Source.city_id == city_id).values(enabled=False)
+        if wanted:
+            stale = stale.where(Source.id.not_in(list(wanted)))
+        session.execute(stale)
+        session.commit()
+
+    rows = [
+        {
+            "batch_id": batch_id,
+            "city_id": city_id,
+            "source_id": sid,
+            "source_type": src.get("type", "url"),
+            "uri": src["uri"].strip(),
+            "options_json": {k: v for k, v in src.items() if k not in ("type", "uri")},
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": settings.sync_job_max_attempts,
+            "run_after": now,
+            "created_at": now,
+            "result_json": {},
+        }
+        for sid, src in wanted.items()
+    ]
+    queued = 0
+    if rows:
+        with engine.begin() as conn:
+            # The partial unique index turns a duplicate active job into a no-op.
+            stmt = _insert(conn.dialect.name)(SyncJob).on_conflict_do_nothing().returning(SyncJob.id)
+            queued = len(conn.execute(stmt, rows).all())
+    return {"city_id": city_id, "batch_id": batch_id, "sources": len(rows), "queued": queued}
+
+
+def claim_jobs(worker_id: str, limit: int = 1, city_id: str | None = None) -> list[dict]:
+    """Leases up to ``limit`` runnable jobs: queued and due, or running with an expired lease."""
+    init_db()
+    now = _utc_now()
+    with engine.begin() as conn:
+        # Jobs whose workers keep dying must not be re-leased forever.
+        conn.execute(
+            update(SyncJob)
+            .where(SyncJob.status == RUNNING, SyncJob.lease_until < now, SyncJob.attempts >= SyncJob.max_attempts)
+            .values(status=FAILED, last_error="lease expired", finished_at=now, lease_until=None)
+        )
+        runnable = or_(
+            and_(SyncJob.status == QUEUED, SyncJob.run_after <= now),
+            and_(SyncJob.status == RUNNING, SyncJob.lease_until < now),
+        )
+        stmt = select(SyncJob.id).where(runnable)
+        if city_id:
+            stmt = stmt.where(SyncJob.city_id == city_id)
+        stmt = stmt.order_by(SyncJob.run_after, SyncJob.id).limit(limit).with_for_update(skip_locked=True)
+        ids = list(conn.scalars(stmt))
+        if not ids:
+            return []
+        claimed = conn.execute(
+            update(SyncJob)
+            .where(SyncJob.id.in_(ids))
+            .values(
+                status=RUNNING,
+                worker_id=worker_id,
+                attempts=SyncJob.attempts + 1,
+                lease_until=now + timedelta(seconds=settings.sync_job_lease_sec),
+                heartbeat_at=now,
+            )
+            .returning(
+                SyncJob.id,
+                SyncJob.city_id,
+                SyncJob.source_type,
+                SyncJob.uri,
+                SyncJob.options_json,
+                SyncJob.attempts,
+                SyncJob.max_attempts,
+            )
+        )
+        return [dict(r) for r in claimed.mappings()]
+
+
+def heartbeat(job_id: int, worker_id: str) -> bool:
+    """Extends the lease; False means another worker has taken the job over."""
+    now = _utc_now()
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(SyncJob)
+            .where(SyncJob.id == job_id, SyncJob.worker_id == worker_id, SyncJob.status == RUNNING)
+            .values(lease_until=now + timedelta(seconds=settings.sync_job_lease_sec), heartbeat_at=now)
+        )
+    return result.rowcount > 0
+
+
+def complete_job(job_id: int, worker_id: str, result: dict) -> bool:
+    now = _utc_now()
+    with engine.begin() as conn:
+        updated = conn.execute(
+            update(SyncJob)
+            .where(SyncJob.id == job_id, SyncJob.worker_id == worker_id, SyncJob.status == RUNNING)
+            .values(status=DONE, finished_at=now, lease_until=None, result_json=result, last_error=None)
+        )
+    return updated.rowcount > 0
+
+
+def fail_job(job_id: int, worker_id: str, error: str, attempts: int, max_attempts: int) -> str:
+    """Re-queues the job with exponential backoff and jitter, or fails it for good."""
+    now = _utc_now()
+    if attempts >= max_attempts:
+        values = {"status": FAILED, "finished_at": now}
+    else:
+        delay = min(_MAX_BACKOFF_SEC, settings.sync_job_backoff_sec * 2 ** (attempts - 1))
+        delay *= random.uniform(0.75, 1.25)
+        values = {"status": QUEUED, "run_after": now + timedelta(seconds=delay)}
+    with engine.begin() as conn:
+        conn.execute(
+            update(SyncJob)
+            .where(SyncJob.id == job_id, SyncJob.worker_id == worker_id, SyncJob.status == RUNNING)
+            .values(lease_until=None, last_error=error[:2000], **values)
+        )
+    return values["status"]
+
+
+def job_stats(city_id: str | None = None) -> dict:
+    init_db()
+    now = _utc_now()
+    scope = [SyncJob.city_id == city_id] if city_id else []
+    with engine.connect() as conn:
+        by_status = dict(
+            conn.execute(select(SyncJob.status, func.count()).where(*scope).group_by(SyncJob.status)).all()
+        )
+        workers = conn.scalar(
+            select(func.count(func.distinct(SyncJob.worker_id))).where(
+                *scope, SyncJob.status == RUNNING, SyncJob.lease_until >= now
+            )
+        )
+        oldest = conn.scalar(select(func.min(SyncJob.run_after)).where(*scope, SyncJob.status == QUEUED))
+        window = timedelta(minutes=5)
+        done_recent = conn.scalar(
+            select(func.count()).where(*scope, SyncJob.status == DONE, SyncJob.finished_at >= now - window)
+        )
+    if oldest is not None and oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=UTC)
+    return {
+        "city_id": city_id,
+        "jobs": {s: by_status.get(s, 0) for s in (QUEUED, RUNNING, DONE, FAILED)},
+        "active_workers": workers or 0,
+        "oldest_queued_sec": round(max(0.0, (now - oldest).total_seconds()), 1) if oldest else 0.0,
+        "done_per_min_5m": round(done_recent / window.total_seconds() * 60, 2),
+    }
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import JSON, Boolean, DateTime, ForeignKey, String, Text
+from sqlalchemy import JSON, Boolean, DateTime, ForeignKey, Index, Integer, String, Text, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -28,10 +28,52 @@ class Source(Base):
 
 class Chunk(Base):
     __tablename__ = "chunks"
+    __table_args__ = (Index("ix_chunks_city_uri", "city_id", "uri"),)
 
+    # chunk_id is "<uri>#<index>", so two cities indexing the same page share it.
+    city_id: Mapped[str] = mapped_column(String(120), primary_key=True)
     chunk_id: Mapped[str] = mapped_column(String(255), primary_key=True)
-    city_id: Mapped[str] = mapped_column(String(120), index=True)
     doc_id: Mapped[str] = mapped_column(String(255), index=True)
+    uri: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    chunk_index: Mapped[int] = mapped_column(Integer, default=0)
+    point_id: Mapped[str] = mapped_column(String(64), nullable=False, default="")
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False, default="")
     text: Mapped[str] = mapped_column(Text, nullable=False)
     metadata_json: Mapped[dict] = mapped_column(JSON, default={})
     updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class SyncJob(Base):
+    """One source to fetch and index, claimed by a sync worker under a lease."""
+
+    __tablename__ = "sync_jobs"
+    __table_args__ = (
+        Index("ix_sync_jobs_claim", "status", "run_after"),
+        # At most one queued or running job per source, so re-enqueueing a city never doubles work.
+        Index(
+            "uq_sync_jobs_active_source",
+            "source_id",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    batch_id: Mapped[str] = mapped_column(String(64), index=True)
+    city_id: Mapped[str] = mapped_column(String(120), index=True)
+    source_id: Mapped[str] = mapped_column(ForeignKey("sources.id"))
+    source_type: Mapped[str] = mapped_column(String(40), default="url")
+    uri: Mapped[str] = mapped_column(Text, nullable=False)
+    options_json: Mapped[dict] = mapped_column(JSON, default={})
+    status: Mapped[str] = mapped_column(String(16), default="queued")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=5)
+    run_after: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    worker_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    lease_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    result_json: Mapped[dict] = mapped_column(JSON, default={})
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1 @@
+"""Out-of-process embedding workers shared by query and ingestion paths."""
@@ -0,0 +1,192 @@
+import atexit
+import functools
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from backend.app.config import get_settings
+
+settings = get_settings()
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITIES = {"interactive": INTERACTIVE, "bulk": BULK}
+
+
+def fastembed_factory(model_name: str, threads: int):
+    from fastembed import TextEmbedding
+
+    return TextEmbedding(model_name=model_name, threads=threads)
+
+
+def _worker_main(factory: Callable, threads: int, jobs: mp.Queue, results: mp.Queue, slot: int) -> None:
+    model = factory(threads)
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, texts = job
+        try:
+            vecs = np.stack(list(model.embed(texts, batch_size=len(texts)))).astype(np.float32)
+            results.put((slot, job_id, vecs.tobytes(), vecs.shape, None))
+        except Exception as exc:  # noqa: BLE001
+            results.put((slot, job_id, None, None, str(exc)[:500]))
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    texts: list[str] = field(compare=False)
+    future: Future = field(compare=False)
+
+
+class _Worker:
+    def __init__(self, ctx, factory: Callable, threads: int, results: mp.Queue, slot: int) -> None:
+        self.jobs: mp.Queue = ctx.Queue()
+        self.process = ctx.Process(
+            target=_worker_main, args=(factory, threads, self.jobs, results, slot), daemon=True
+        )
+        self.process.start()
+        self.job: _Job | None = None
+
+
+class EmbeddingPool:
+    """Local process pool owning one ONNX session per worker.
+
+    Requests are split into small sub-batches and dispatched by priority, and bulk work
+    never occupies the workers reserved for interactive queries, so a large sync cannot
+    push query embeddings behind it.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        factory: Callable,
+        threads: int = 1,
+        sub_batch: int = 32,
+        reserved_interactive: int = 1,
+    ) -> None:
+        self._ctx = mp.get_context("spawn")
+        self._factory = factory
+        self._threads = threads
+        self._sub_batch = max(1, sub_batch)
+        self._reserved = min(max(0, reserved_interactive), max(0, workers - 1))
+        self._results: mp.Queue = self._ctx.Queue()
+        self._pending: queue.PriorityQueue[_Job] = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [self._spawn(slot) for slot in range(max(1, workers))]
+        self._in_flight: dict[int, _Job] = {}
+
+        threading.Thread(target=self._dispatch_loop, name="embed-dispatch", daemon=True).start()
+        threading.Thread(target=self._result_loop, name="embed-results", daemon=True).start()
+
+    def _spawn(self, slot: int) -> _Worker:
+        return _Worker(self._ctx, self._factory, self._threads, self._results, slot)
+
+    def embed(self, texts: list[str], priority: str = "interactive", timeout: float | None = None) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, settings.vector_size), dtype=np.float32)
+        level = PRIORITIES[priority]
+        futures = []
+        with self._cond:
+            for i in range(0, len(texts), self._sub_batch):
+                job = _Job(level, next(self._seq), texts[i : i + self._sub_batch], Future())
+                self._pending.put(job)
+                futures.append(job.future)
+            self._cond.notify_all()
+        return np.concatenate([f.result(timeout=timeout) for f in futures])
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = list(self._pending.queue)
+        return {
+            "workers": len(self._workers),
+            "busy": sum(1 for w in self._workers if w.job is not None),
+            "pending_interactive": sum(1 for j in pending if j.priority == INTERACTIVE),
+            "pending_bulk": sum(1 for j in pending if j.priority == BULK),
+        }
+
+    def _next_assignment(self) -> tuple[_Worker, _Job] | None:
+        idle = [w for w in self._workers if w.job is None]
+        if not idle or self._pending.empty():
+            return None
+        job = self._pending.queue[0]
+        if job.priority == BULK and len(idle) <= self._reserved:
+            return None
+        return idle[0], self._pending.get_nowait()
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                self._reap_dead_workers()
+                assignment = self._next_assignment()
+                if assignment is None:
+                    self._cond.wait(timeout=1.0)
+                    continue
+                worker, job = assignment
+                worker.job = job
+                self._in_flight[job.seq] = job
+            worker.jobs.put((job.seq, job.texts))
+
+    def _reap_dead_workers(self) -> None:
+        for slot, worker in enumerate(self._workers):
+            if worker.process.is_alive():
+                continue
+            if worker.job is not None:
+                self._in_flight.pop(worker.job.seq, None)
+                worker.job.future.set_exception(RuntimeError("embedding worker exited"))
+            self._workers[slot] = self._spawn(slot)
+
+    def _result_loop(self) -> None:
+        while True:
+            try:
+                item = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if self._closed:
+                    return
+                continue
+            slot, seq, raw, shape, error = item
+            with self._cond:
+                job = self._in_flight.pop(seq, None)
+                if self._workers[slot].job is job:
+                    self._workers[slot].job = None
+                self._cond.notify_all()
+            if job is None:
+                continue
+            if error is not None:
+                job.future.set_exception(RuntimeError(error))
+            else:
+                job.future.set_result(np.frombuffer(raw, dtype=np.float32).reshape(shape))
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.jobs.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+
+
+@functools.lru_cache(maxsize=1)
+def get_pool() -> EmbeddingPool:
+    pool = EmbeddingPool(
+        workers=settings.embedding_workers,
+        factory=functools.partial(fastembed_factory, settings.embedding_model),
+        threads=settings.embedding_worker_threads,
+        sub_batch=settings.embedding_sub_batch,
+        reserved_interactive=settings.embedding_reserved_interactive,
+    )
+    atexit.register(pool.close)
+    return pool
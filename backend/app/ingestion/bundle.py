@@ -0,0 +1,401 @@
+"""Portable city index bundles: export a city's vectors, payloads and sync state to one file,
+import it on another node without crawling or embedding.
+
+    python -m backend.app.ingestion.bundle export san_francisco --dtype int8
+    python -m backend.app.ingestion.bundle import backend/data/bundles/san_francisco-20260101000000.ocb
+    python -m backend.app.ingestion.bundle info backend/data/bundles/san_francisco-20260101000000.ocb
+
+Layout (little-endian, every section 64-byte aligned so it can be memory-mapped in place)::
+
+    preamble   magic "OCBUNDLE", uint32 format version, uint32 flags, uint64 header length
+    header     JSON: city, embedding model, vector size/dtype, point count, section offsets + CRC32
+    ids        16-byte point UUIDs, one per point
+    vectors    float32[count, vector_size], or int8[count, vector_size] when quantized
+    scales     float32[count] per-vector scale (int8 only; vector ~= q * scale)
+    offsets    uint64[count + 1] into payloads
+    payloads   concatenated UTF-8 JSON payloads
+    state      JSON {uri: {content_hash, chunk_count}} for the sync state store
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+import uuid
+import zlib
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import BinaryIO, Literal
+
+import numpy as np
+
+from backend.app.config import get_settings
+from backend.app.ingestion.state import SyncStateStore
+from backend.app.vector.qdrant import (
+    city_point_ids,
+    count_city_points,
+    delete_points,
+    ensure_collection,
+    iter_city_points,
+    stored_payloads,
+    upload_arrays,
+)
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+VectorDtype = Literal["float32", "int8"]
+
+MAGIC = b"OCBUNDLE"
+FORMAT_VERSION = 1
+SUFFIX = ".ocb"
+_PREAMBLE = struct.Struct("<8sIIQ")
+_ALIGN = 64
+_SECTIONS = ("ids", "vectors", "scales", "offsets", "payloads", "state")
+_CRC_CHUNK = 16 << 20
+
+
+class BundleError(ValueError):
+    pass
+
+
+class BundleMismatch(BundleError):
+    """The bundle was built with a different embedding model than this node queries with."""
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+def _quantize(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Symmetric per-vector int8: 4x smaller, and cosine ranking is all but unchanged.
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+class _Section:
+    def __init__(self, directory: str, name: str) -> None:
+        self.name = name
+        self.file: BinaryIO = open(Path(directory) / name, "w+b")  # noqa: SIM115
+        self.length = 0
+        self.crc = 0
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.length += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+
+class BundleWriter:
+    """Streams points into per-section temp files, then assembles the bundle and renames it into place."""
+
+    def __init__(self, path: Path, city_id: str, dtype: VectorDtype = "float32") -> None:
+        self.path = path
+        self.city_id = city_id
+        self.dtype = dtype
+        self.count = 0
+        self._uris: dict[str, dict] = {}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = tempfile.TemporaryDirectory(dir=path.parent, prefix=".bundle-")
+        self._sections = {name: _Section(self._tmp.name, name) for name in _SECTIONS}
+        self._payload_bytes = 0
+        self._sections["offsets"].write(struct.pack("<Q", 0))
+
+    def add(self, ids: list[str], vectors: np.ndarray, payloads: list[dict]) -> None:
+        if not ids:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(ids), settings.vector_size):
+            raise BundleError(f"expected {len(ids)} vectors of size {settings.vector_size}, got {vectors.shape}")
+        try:
+            self._sections["ids"].write(b"".join(uuid.UUID(str(i)).bytes for i in ids))
+        except ValueError as exc:
+            raise BundleError(f"bundles need UUID point ids: {exc}") from exc
+        if self.dtype == "int8":
+            q, scales = _quantize(vectors)
+            self._sections["vectors"].write(q.tobytes())
+            self._sections["scales"].write(scales.tobytes())
+        else:
+            self._sections["vectors"].write(vectors.tobytes())
+        ends = []
+        blob = bytearray()
+        for payload in payloads:
+            blob += json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            ends.append(self._payload_bytes + len(blob))
+            uri = payload.get("uri", "")
+            entry = self._uris.setdefault(uri, {"content_hash": payload.get("content_hash", ""), "chunk_count": 0})
+            entry["chunk_count"] += 1
+        self._payload_bytes += len(blob)
+        self._sections["payloads"].write(bytes(blob))
+        self._sections["offsets"].write(np.asarray(ends, dtype="<u8").tobytes())
+        self.count += len(ids)
+
+    def finish(self, state: dict[str, dict] | None = None) -> dict:
+        """Writes the bundle. ``state`` wins over hashes derived from payloads (it also covers empty sources)."""
+        state = {**self._uris, **(state or {})}
+        self._sections["state"].write(json.dumps(state).encode("utf-8"))
+        header = {
+            "format": FORMAT_VERSION,
+            "city_id": self.city_id,
+            "created_at": datetime.now(UTC).isoformat(),
+            "embedding_model": settings.embedding_model,
+            "vector_size": settings.vector_size,
+            "distance": "cosine",
+            "dtype": self.dtype,
+            "count": self.count,
+            "sources": len(state),
+            "sections": {},
+        }
+        # Section offsets depend on the header's own length; repeat until it stops moving them.
+        start = 0
+        while True:
+            header_bytes = json.dumps(header).encode("utf-8")
+            offset = _PREAMBLE.size + len(header_bytes)
+            offset += _pad(offset)
+            if offset == start:
+                break
+            start = offset
+            for name in _SECTIONS:
+                section = self._sections[name]
+                header["sections"][name] = {"offset": offset, "length": section.length, "crc32": section.crc}
+                offset += section.length + _pad(section.length)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp_path, "wb") as out:
+            out.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header_bytes)))
+            out.write(header_bytes)
+            for name in _SECTIONS:
+                out.write(b"\0" * (header["sections"][name]["offset"] - out.tell()))
+                src = self._sections[name].file
+                src.seek(0)
+                while chunk := src.read(_CRC_CHUNK):
+                    out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.path)
+        return {**header, "path": str(self.path), "bytes": self.path.stat().st_size}
+
+    def close(self) -> None:
+        for section in self._sections.values():
+            section.file.close()
+        self._tmp.cleanup()
+
+    def __enter__(self) -> "BundleWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_header(path: Path) -> dict:
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise BundleError(f"{path} is not a city bundle")
+        magic, version, _, header_len = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise BundleError(f"{path} is not a city bundle")
+        if version != FORMAT_VERSION:
+            raise BundleError(f"{path} has bundle format {version}, this node reads {FORMAT_VERSION}")
+        return json.loads(f.read(header_len))
+
+
+class CityBundle:
+    """Read-only, memory-mapped view of a bundle; slices are decoded on demand."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.header = read_header(path)
+        self.city_id: str = self.header["city_id"]
+        self.count: int = self.header["count"]
+        self._file = open(path, "rb")  # noqa: SIM115
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        end = max(s["offset"] + s["length"] for s in self.header["sections"].values())
+        if len(self._mm) < end:
+            raise BundleError(f"{path} is truncated")
+
+    def _view(self, name: str) -> memoryview:
+        section = self.header["sections"][name]
+        return memoryview(self._mm)[section["offset"] : section["offset"] + section["length"]]
+
+    def verify(self) -> None:
+        for name, section in self.header["sections"].items():
+            with self._view(name) as view:
+                crc = 0
+                for start in range(0, len(view), _CRC_CHUNK):
+                    crc = zlib.crc32(view[start : start + _CRC_CHUNK], crc)
+            if crc != section["crc32"]:
+                raise BundleError(f"{self.path}: section {name} is corrupt")
+
+    def check_compatible(self) -> None:
+        model, size = self.header["embedding_model"], self.header["vector_size"]
+        if model != settings.embedding_model or size != settings.vector_size:
+            raise BundleMismatch(
+                f"bundle was embedded with {model} ({size}d), "
+                f"this node uses {settings.embedding_model} ({settings.vector_size}d)"
+            )
+
+    def ids(self, start: int, stop: int) -> list[str]:
+        with self._view("ids") as view:
+            raw = bytes(view[start * 16 : stop * 16])
+        return [str(uuid.UUID(bytes=raw[i : i + 16])) for i in range(0, len(raw), 16)]
+
+    def vectors(self, start: int, stop: int) -> np.ndarray:
+        dim = self.header["vector_size"]
+        # Results are always copies so no array outlives the mapping.
+        if self.header["dtype"] == "int8":
+            q = np.frombuffer(self._mm, np.int8, (stop - start) * dim, self._offset("vectors") + start * dim)
+            scales = np.frombuffer(self._mm, "<f4", stop - start, self._offset("scales") + start * 4)
+            return q.reshape(-1, dim).astype(np.float32) * scales[:, None]
+        raw = np.frombuffer(self._mm, "<f4", (stop - start) * dim, self._offset("vectors") + start * dim * 4)
+        return raw.reshape(-1, dim).copy()
+
+    def payloads(self, start: int, stop: int) -> list[dict]:
+        ends = np.frombuffer(self._mm, "<u8", stop - start + 1, self._offset("offsets") + start * 8).tolist()
+        base = self._offset("payloads")
+        return [json.loads(self._mm[base + a : base + b]) for a, b in zip(ends, ends[1:])]
+
+    def state(self) -> dict[str, dict]:
+        with self._view("state") as view:
+            return json.loads(bytes(view))
+
+    def _offset(self, name: str) -> int:
+        return self.header["sections"][name]["offset"]
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "CityBundle":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _default_path(city_id: str) -> Path:
+    return settings.bundle_dir / f"{city_id}-{datetime.now(UTC).strftime('%Y%m%d%H%M%S')}{SUFFIX}"
+
+
+def export_bundle(city_id: str, path: Path | None = None, dtype: VectorDtype | None = None) -> dict:
+    """Writes everything this node has indexed for the city, read back from Qdrant."""
+    started = time.perf_counter()
+    path = path or _default_path(city_id)
+    ensure_collection()
+    store = SyncStateStore()
+    # The city lock keeps a sync from changing the city halfway through the scroll.
+    with store.city_lock(city_id), BundleWriter(path, city_id, dtype or settings.bundle_vector_dtype) as writer:
+        for records in iter_city_points(city_id):
+            writer.add(
+                [str(r.id) for r in records],
+                np.asarray([r.vector for r in records], dtype=np.float32),
+                [r.payload or {} for r in records],
+            )
+        if writer.count == 0:
+            raise LookupError(f"nothing indexed for {city_id}")
+        info = writer.finish(store.entries(city_id))
+    info.pop("sections")
+    info["seconds"] = round(time.perf_counter() - started, 2)
+    return info
+
+
+def import_bundle(path: Path, verify: bool = True) -> dict:
+    """Replaces the bundle's city in the live collection, chunk catalog and sync state.
+
+    Vectors stream from the mapped file to Qdrant in one parallel, unwaited upload that
+    overwrites points in place, so the city keeps answering from old or new points throughout.
+    Only then are points missing from the bundle deleted. The import returns once every point
+    is counted, so the city is immediately queryable.
+    """
+    started = time.perf_counter()
+    with CityBundle(path) as bundle:
+        if verify:
+            bundle.verify()
+        bundle.check_compatible()
+        city_id, count = bundle.city_id, bundle.count
+        batch = settings.qdrant_rebuild_batch_size * max(1, settings.qdrant_rebuild_parallel)
+        spans = [(start, min(count, start + batch)) for start in range(0, count, batch)]
+        ensure_collection()
+        store = SyncStateStore()
+        with store.city_lock(city_id):
+            stale = city_point_ids(city_id)
+            # The mapped file is read once per stream; qdrant-client zips them batch by batch.
+            upload_arrays(
+                (pid for span in spans for pid in bundle.ids(*span)),
+                (row for span in spans for row in bundle.vectors(*span).tolist()),
+                (p for span in spans for p in stored_payloads(bundle.ids(*span), bundle.payloads(*span))),
+                settings.qdrant_collection,
+            )
+            stale.difference_update(bundle.ids(0, count))
+            delete_points(sorted(stale))
+            deadline = time.monotonic() + settings.qdrant_green_timeout_sec
+            while count_city_points(city_id) < count:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{city_id} is missing points after {settings.qdrant_green_timeout_sec}s")
+                time.sleep(0.5)
+            loaded_sec = time.perf_counter() - started
+            catalog_rows = 0
+            if settings.chunk_catalog_enabled:
+                from backend.app.db.catalog import replace_city_rows
+
+                catalog_rows = replace_city_rows(
+                    city_id, (list(zip(bundle.ids(*span), bundle.payloads(*span))) for span in spans)
+                )
+            # With the hashes in place the next sync only re-embeds what changed since the export.
+            store.replace_city(city_id, bundle.state())
+        header = bundle.header
+    return {
+        "city_id": city_id,
+        "points": count,
+        "dtype": header["dtype"],
+        "embedding_model": header["embedding_model"],
+        "exported_at": header["created_at"],
+        "catalog_rows": catalog_rows,
+        "points_per_sec": round(count / loaded_sec, 1) if loaded_sec else 0.0,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def list_bundles() -> list[dict]:
+    out = []
+    for path in sorted(settings.bundle_dir.glob(f"*{SUFFIX}")):
+        try:
+            header = read_header(path)
+        except (BundleError, ValueError):
+            continue
+        header.pop("sections")
+        out.append({"name": path.name, "bytes": path.stat().st_size, **header})
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write a city's index to a bundle")
+    exp.add_argument("city_id")
+    exp.add_argument("--out", type=Path, default=None, help=f"default: {settings.bundle_dir}/<city>-<time>{SUFFIX}")
+    exp.add_argument("--dtype", choices=["float32", "int8"], default=None)
+    imp = sub.add_parser("import", help="load a bundle into the live collection")
+    imp.add_argument("path", type=Path)
+    imp.add_argument("--no-verify", action="store_true", help="skip the CRC check")
+    info = sub.add_parser("info", help="print a bundle's header")
+    info.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    if args.command == "export":
+        result = export_bundle(args.city_id, args.out, args.dtype)
+    elif args.command == "import":
+        result = import_bundle(args.path, verify=not args.no_verify)
+    else:
+        result = read_header(args.path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
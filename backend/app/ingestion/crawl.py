@@ -1,4 +1,44 @@
+"""Fetching, plus the link-following crawler behind ``type: crawl`` sources.
+
+A crawl source names a seed page; the crawler reads the site's sitemaps, follows links within
+the allowed domains up to ``max_depth`` and ``max_pages``, honours robots.txt and yields each
+fetched page to the sync pipeline. The frontier persists between runs, so a fresh run only
+fetches pages whose sitemap ``lastmod`` moved on (or that have no lastmod at all), and an
+interrupted run picks up where it stopped.
+"""
+
+import gzip
+import logging
+import posixpath
+import time
+import xml.etree.ElementTree as ET
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
 import requests
+from bs4 import BeautifulSoup
+
+from backend.app.config import get_settings
+from backend.app.ingestion.frontier import (
+    STATUS_BLOCKED,
+    STATUS_ERROR,
+    STATUS_FETCHED,
+    CrawlFrontier,
+    url_key,
+)
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "mc_cid", "mc_eid", "_ga")
+_SKIP_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".zip", ".gz",
+    ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".mp3", ".mp4", ".mov", ".avi", ".ics", ".xml",
+)
+_FRONTIER_BATCH = 64
 
 
 def fetch_url(uri: str, timeout_sec: int = 20) -> tuple[bytes, str]:
@@ -6,3 +46,307 @@ def fetch_url(uri: str, timeout_sec: int = 20) -> tuple[bytes, str]:
     r.raise_for_status()
     content_type = r.headers.get("content-type", "text/plain")
     return r.content, content_type
+
+
+def canonicalize_url(url: str) -> str | None:
+    """Normalizes a URL for dedup; returns None for anything that is not http(s)."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if parts.port and not (scheme == "http" and parts.port == 80 or scheme == "https" and parts.port == 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    normalized = posixpath.normpath(path)
+    # normpath drops a trailing slash and collapses a leading "//", both of which matter here.
+    path = "/" + normalized.lstrip("/") if normalized != "." else "/"
+    if parts.path.endswith("/") and not path.endswith("/"):
+        path += "/"
+    query = urlencode(
+        sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith(_TRACKING_PARAMS))
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def _parse_lastmod(value: str | None) -> str | None:
+    """Sitemap lastmod as a UTC ISO timestamp, so values compare correctly as strings."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    return dt.astimezone(UTC).isoformat()
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_sitemap(raw: bytes) -> tuple[list[tuple[str, str | None]], list[str]]:
+    """Returns ((url, lastmod) entries, nested sitemap URLs) from a sitemap or sitemap index."""
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    root = ET.fromstring(raw)
+    entries: list[tuple[str, str | None]] = []
+    nested: list[str] = []
+    for node in root:
+        fields = {_local(child.tag): (child.text or "").strip() for child in node}
+        loc = fields.get("loc")
+        if not loc:
+            continue
+        if _local(node.tag) == "sitemap":
+            nested.append(loc)
+        else:
+            entries.append((loc, _parse_lastmod(fields.get("lastmod"))))
+    return entries, nested
+
+
+def extract_links(base_url: str, raw: bytes) -> tuple[list[str], str | None]:
+    """Absolute hrefs on an HTML page, plus its ``rel=canonical`` URL if it declares one."""
+    soup = BeautifulSoup(raw, "lxml")
+    base = soup.find("base", href=True)
+    if base is not None:
+        base_url = urljoin(base_url, base["href"])
+    links = []
+    for a in soup.find_all("a", href=True):
+        if "nofollow" in (a.get("rel") or []):
+            continue
+        links.append(urljoin(base_url, a["href"]))
+    canonical = soup.find("link", rel="canonical", href=True)
+    return links, urljoin(base_url, canonical["href"]) if canonical is not None else None
+
+
+@dataclass
+class CrawledPage:
+    uri: str
+    # The frontier entry that was fetched; differs from ``uri`` after redirects or rel=canonical.
+    url: str
+    raw: bytes
+    content_type: str
+
+
+class RobotsCache:
+    """robots.txt rules per host, fetched once per crawl. Unreachable robots.txt allows everything."""
+
+    def __init__(self, session: requests.Session) -> None:
+        self.session = session
+        self._parsers: dict[str, RobotFileParser | None] = {}
+
+    def _parser(self, url: str) -> RobotFileParser | None:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self._parsers:
+            parser: RobotFileParser | None = None
+            try:
+                r = self.session.get(f"{origin}/robots.txt", timeout=settings.crawl_timeout_sec)
+                if r.status_code in (401, 403):
+                    parser = RobotFileParser()
+                    parser.disallow_all = True
+                elif r.ok:
+                    parser = RobotFileParser()
+                    parser.parse(r.text.splitlines())
+            except requests.RequestException:
+                parser = None
+            self._parsers[origin] = parser
+        return self._parsers[origin]
+
+    def allowed(self, url: str) -> bool:
+        parser = self._parser(url)
+        return parser is None or parser.can_fetch(settings.crawl_user_agent, url)
+
+    def crawl_delay(self, url: str) -> float:
+        parser = self._parser(url)
+        delay = parser.crawl_delay(settings.crawl_user_agent) if parser is not None else None
+        return float(delay or 0.0)
+
+    def sitemaps(self, url: str) -> list[str]:
+        parser = self._parser(url)
+        return list(parser.site_maps() or []) if parser is not None else []
+
+
+class SiteCrawler:
+    """Crawls one ``type: crawl`` source for one city and yields the pages it fetched.
+
+    Source options (all optional besides ``uri``): ``allowed_domains`` (defaults to the seed's
+    host; subdomains are included), ``max_depth``, ``max_pages``, ``sitemap`` (``false`` to
+    skip sitemaps, or explicit sitemap URLs).
+    """
+
+    def __init__(
+        self, city_id: str, source: dict, frontier: CrawlFrontier, resumed: bool = False, force: bool = False
+    ) -> None:
+        seed = canonicalize_url(source["uri"])
+        if seed is None:
+            raise ValueError(f"not an http(s) URL: {source['uri']}")
+        self.city_id = city_id
+        self.seed = seed
+        self.frontier = frontier
+        self.resumed = resumed
+        # Full rebuilds need every page again, not just the ones whose lastmod changed.
+        self.force = force
+        self.max_depth = int(source.get("max_depth", settings.crawl_max_depth))
+        self.max_pages = int(source.get("max_pages", settings.crawl_max_pages))
+        domains = source.get("allowed_domains") or [urlsplit(seed).hostname]
+        self.allowed_domains = [d.lower().lstrip(".") for d in domains]
+        self.sitemap = source.get("sitemap", True)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = settings.crawl_user_agent
+        self.robots = RobotsCache(self.session)
+        self._seen: set[int] = set()
+        self._size = 0
+        self._last_fetch: dict[str, float] = {}
+        self._started = time.monotonic()
+        self.counters = {
+            "pages_fetched": 0,
+            "pages_yielded": 0,
+            "links_discovered": 0,
+            "sitemap_urls": 0,
+            "robots_blocked": 0,
+            "duplicates": 0,
+            "errors": 0,
+        }
+
+    def in_scope(self, url: str) -> bool:
+        host = urlsplit(url).hostname or ""
+        if not any(host == d or host.endswith("." + d) for d in self.allowed_domains):
+            return False
+        return not urlsplit(url).path.lower().endswith(_SKIP_EXTENSIONS)
+
+    def _enqueue(self, urls: list[tuple[str, int, str | None]]) -> None:
+        """Adds new in-scope URLs up to the page limit; lastmod updates always go through."""
+        entries = []
+        for raw_url, depth, lastmod in urls:
+            url = canonicalize_url(raw_url)
+            if url is None or depth > self.max_depth or not self.in_scope(url):
+                continue
+            key = url_key(url)
+            if key in self._seen:
+                if lastmod is not None:
+                    entries.append((url, depth, lastmod))
+                continue
+            if self._size >= self.max_pages:
+                continue
+            self._seen.add(key)
+            self._size += 1
+            entries.append((url, depth, lastmod))
+        if entries:
+            self.frontier.add(self.city_id, self.seed, entries)
+
+    def _fetch(self, url: str) -> requests.Response:
+        host = urlsplit(url).netloc
+        delay = max(settings.crawl_delay_ms / 1000, self.robots.crawl_delay(url))
+        wait = self._last_fetch.get(host, 0.0) + delay - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            return self.session.get(url, timeout=settings.crawl_timeout_sec)
+        finally:
+            self._last_fetch[host] = time.monotonic()
+
+    def _read_sitemaps(self) -> None:
+        if self.sitemap is False:
+            return
+        if isinstance(self.sitemap, (list, str)):
+            pending = [self.sitemap] if isinstance(self.sitemap, str) else list(self.sitemap)
+        else:
+            origin = "{0.scheme}://{0.netloc}".format(urlsplit(self.seed))
+            pending = self.robots.sitemaps(self.seed) or [f"{origin}/sitemap.xml"]
+        read = 0
+        while pending and read < settings.crawl_max_sitemaps:
+            url = pending.pop(0)
+            read += 1
+            try:
+                r = self._fetch(url)
+                if not r.ok:
+                    continue
+                entries, nested = parse_sitemap(r.content)
+            except (requests.RequestException, ET.ParseError, OSError) as exc:
+                logger.info("skipping sitemap %s: %s", url, exc)
+                continue
+            pending.extend(nested)
+            self.counters["sitemap_urls"] += len(entries)
+            # Newest first, so the page limit keeps the most recently changed pages.
+            entries.sort(key=lambda e: e[1] or "", reverse=True)
+            self._enqueue([(loc, 0, lastmod) for loc, lastmod in entries])
+
+    def pages(self) -> Iterator[CrawledPage]:
+        self._seen = self.frontier.seen_keys(self.city_id)
+        self._size = self.frontier.size(self.city_id, self.seed)
+        if not self.resumed:
+            self.frontier.start_run(self.city_id, self.seed, requeue_all=self.force)
+        self._enqueue([(self.seed, 0, None)])
+        self._read_sitemaps()
+        _active[(self.city_id, self.seed)] = self
+        try:
+            while batch := self.frontier.next_batch(self.city_id, self.seed, _FRONTIER_BATCH):
+                for url, depth in batch:
+                    page = self._crawl_one(url, depth)
+                    if page is not None:
+                        self.counters["pages_yielded"] += 1
+                        yield page
+        finally:
+            _active.pop((self.city_id, self.seed), None)
+            self.session.close()
+
+    def _crawl_one(self, url: str, depth: int) -> CrawledPage | None:
+        if not self.robots.allowed(url):
+            self.counters["robots_blocked"] += 1
+            self.frontier.mark(self.city_id, url, STATUS_BLOCKED)
+            return None
+        try:
+            r = self._fetch(url)
+            r.raise_for_status()
+        except requests.RequestException as exc:
+            self.counters["errors"] += 1
+            self.frontier.mark(self.city_id, url, STATUS_ERROR, str(exc)[:500])
+            return None
+        self.counters["pages_fetched"] += 1
+        self.frontier.mark(self.city_id, url, STATUS_FETCHED)
+
+        content_type = r.headers.get("content-type", "text/plain")
+        final = canonicalize_url(r.url) or url
+        if final != url and not self.in_scope(final):
+            return None
+        uri = final
+        if "html" in content_type.lower():
+            links, canonical = extract_links(r.url, r.content)
+            if depth < self.max_depth:
+                self.counters["links_discovered"] += len(links)
+                self._enqueue([(link, depth + 1, None) for link in links])
+            canonical = canonicalize_url(canonical) if canonical else None
+            if canonical and canonical != url and self.in_scope(canonical):
+                if url_key(canonical) in self._seen and canonical != final:
+                    # The canonical page is (or will be) crawled under its own URL.
+                    self.counters["duplicates"] += 1
+                    return None
+                self._seen.add(url_key(canonical))
+                uri = canonical
+        elif not content_type.lower().startswith("text/"):
+            return None
+        return CrawledPage(uri=uri, url=url, raw=r.content, content_type=content_type)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        return {
+            "seed": self.seed,
+            **self.counters,
+            "pages_per_sec": round(self.counters["pages_fetched"] / elapsed, 2) if elapsed > 0 else 0.0,
+            "frontier_size": self._size,
+            "frontier_queued": self.frontier.queued(self.city_id, self.seed),
+        }
+
+
+# Crawls running in this process, for live status.
+_active: dict[tuple[str, str], SiteCrawler] = {}
+
+
+def crawl_status(city_id: str) -> dict:
+    return {
+        "city_id": city_id,
+        "frontier": CrawlFrontier().stats(city_id),
+        "running": [c.stats() for (cid, _), c in list(_active.items()) if cid == city_id],
+    }
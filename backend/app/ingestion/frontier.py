@@ -0,0 +1,150 @@
+import hashlib
+import sqlite3
+from datetime import UTC, datetime
+from pathlib import Path
+
+from backend.app.config import get_settings
+
+settings = get_settings()
+
+STATUS_QUEUED = "queued"
+STATUS_FETCHED = "fetched"
+STATUS_UNCHANGED = "unchanged"
+STATUS_BLOCKED = "blocked"
+STATUS_ERROR = "error"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_frontier (
+    city_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    lastmod TEXT,
+    indexed_lastmod TEXT,
+    discovered_at TEXT NOT NULL,
+    fetched_at TEXT,
+    error TEXT,
+    PRIMARY KEY (city_id, url)
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_frontier_queue ON crawl_frontier (city_id, seed, status);
+"""
+
+# Sitemap entries re-queue a page only when their lastmod is newer than the one it was indexed at.
+_UPSERT = (
+    "INSERT INTO crawl_frontier (city_id, url, seed, depth, status, lastmod, discovered_at) "
+    "VALUES (?, ?, ?, ?, 'queued', ?, ?) "
+    "ON CONFLICT (city_id, url) DO UPDATE SET "
+    "depth = MIN(depth, excluded.depth), "
+    "lastmod = COALESCE(excluded.lastmod, lastmod), "
+    "status = CASE WHEN excluded.lastmod IS NOT NULL AND status != 'queued' "
+    "AND (indexed_lastmod IS NULL OR excluded.lastmod > indexed_lastmod) THEN 'queued' ELSE status END"
+)
+
+
+def _utc_now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+def url_key(url: str) -> int:
+    """64-bit fingerprint used for the in-memory seen set."""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class CrawlFrontier:
+    """Persistent per-city URL frontier in SQLite (WAL).
+
+    Every URL ever discovered keeps a row, so the table doubles as the seen set across runs and
+    an interrupted crawl resumes from whatever is still queued.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        settings.state_dir.mkdir(parents=True, exist_ok=True)
+        self.path = path or settings.state_dir / "crawl_frontier.db"
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def seen_keys(self, city_id: str) -> set[int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT url FROM crawl_frontier WHERE city_id = ?", (city_id,)).fetchall()
+        return {url_key(r[0]) for r in rows}
+
+    def size(self, city_id: str, seed: str) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM crawl_frontier WHERE city_id = ? AND seed = ?", (city_id, seed)
+            ).fetchone()
+        return row[0]
+
+    def queued(self, city_id: str, seed: str) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM crawl_frontier WHERE city_id = ? AND seed = ? AND status = 'queued'",
+                (city_id, seed),
+            ).fetchone()
+        return row[0]
+
+    def add(self, city_id: str, seed: str, entries: list[tuple[str, int, str | None]]) -> None:
+        """Adds (url, depth, lastmod) entries; known URLs keep their state unless lastmod moved on."""
+        now = _utc_now()
+        with self._connect() as conn:
+            conn.executemany(_UPSERT, [(city_id, url, seed, depth, lastmod, now) for url, depth, lastmod in entries])
+
+    def start_run(self, city_id: str, seed: str, requeue_all: bool = False) -> None:
+        """Re-queues pages for a fresh crawl, except those whose sitemap lastmod has not changed."""
+        with self._connect() as conn:
+            if requeue_all:
+                conn.execute(
+                    "UPDATE crawl_frontier SET status = 'queued', error = NULL WHERE city_id = ? AND seed = ?",
+                    (city_id, seed),
+                )
+                return
+            conn.execute(
+                "UPDATE crawl_frontier SET status = CASE "
+                "WHEN lastmod IS NOT NULL AND indexed_lastmod IS NOT NULL AND lastmod <= indexed_lastmod "
+                "THEN 'unchanged' ELSE 'queued' END, error = NULL "
+                "WHERE city_id = ? AND seed = ?",
+                (city_id, seed),
+            )
+
+    def next_batch(self, city_id: str, seed: str, limit: int) -> list[tuple[str, int]]:
+        """Queued (url, depth) pairs, most recently modified first, then shallowest."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT url, depth FROM crawl_frontier WHERE city_id = ? AND seed = ? AND status = 'queued' "
+                "ORDER BY lastmod IS NULL, lastmod DESC, depth, discovered_at LIMIT ?",
+                (city_id, seed, limit),
+            ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def mark(self, city_id: str, url: str, status: str, error: str | None = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE crawl_frontier SET status = ?, fetched_at = ?, error = ? WHERE city_id = ? AND url = ?",
+                (status, _utc_now(), error, city_id, url),
+            )
+
+    def mark_indexed(self, city_id: str, urls: list[str]) -> None:
+        """Called once a page's chunks are committed; its current lastmod becomes the baseline."""
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE crawl_frontier SET indexed_lastmod = lastmod WHERE city_id = ? AND url = ?",
+                [(city_id, url) for url in urls],
+            )
+
+    def stats(self, city_id: str) -> dict[str, dict[str, int]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seed, status, COUNT(*) FROM crawl_frontier WHERE city_id = ? GROUP BY seed, status",
+                (city_id,),
+            ).fetchall()
+        out: dict[str, dict[str, int]] = {}
+        for seed, status, count in rows:
+            out.setdefault(seed, {})[status] = count
+        return out
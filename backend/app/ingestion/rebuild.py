@@ -0,0 +1,186 @@
+"""Blue/green rebuilds of the vector index.
+
+A rebuild loads every city into a fresh versioned collection while queries keep hitting the
+alias, then swaps the alias in one step. The previous version is kept for rollback.
+
+Deployments from before versioning have a real collection under the alias name. Move it
+behind the alias once, with syncs stopped, before the first rebuild:
+
+    python -m backend.app.ingestion.rebuild migrate
+"""
+
+import argparse
+import json
+import logging
+import threading
+import uuid
+from collections.abc import Iterator
+from contextlib import ExitStack
+from datetime import UTC, datetime
+from typing import Literal
+
+from qdrant_client.models import PointStruct
+
+from backend.app.cities import get_registry
+from backend.app.config import get_settings
+from backend.app.db.catalog import iter_city_rows, replace_city_rows, row_payload
+from backend.app.ingestion.state import SyncStateStore
+from backend.app.ingestion.sync import _sync_city
+from backend.app.rag.retrieve import embed_texts
+from backend.app.vector.qdrant import (
+    alias_target,
+    client,
+    create_versioned_collection,
+    ensure_collection,
+    finish_bulk_load,
+    iter_city_points,
+    list_versions,
+    migrate_unversioned,
+    prune_versions,
+    require_versioned,
+    swap_alias,
+    upload_points,
+)
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+RebuildSource = Literal["catalog", "crawl"]
+
+
+class RebuildInProgress(RuntimeError):
+    pass
+
+
+_lock = threading.Lock()
+_job: dict | None = None
+
+
+def _city_ids() -> list[str]:
+    return get_registry().ids()
+
+
+def _catalog_points(job: dict) -> Iterator[PointStruct]:
+    """Every city's catalog rows, re-embedded, as one stream; counts land in ``job["points"]``."""
+    for city_id in job["cities"]:
+        job["points"][city_id] = 0
+        for rows in iter_city_rows(city_id):
+            vectors = embed_texts([r["text"] for r in rows])
+            job["points"][city_id] += len(rows)
+            yield from (PointStruct(id=r["point_id"], vector=v, payload=row_payload(r)) for r, v in zip(rows, vectors))
+
+
+def _refill_catalog(city_id: str) -> None:
+    """Replaces the city's catalog rows with what the (now live) collection holds."""
+    batches = iter_city_points(city_id, with_vectors=False)
+    replace_city_rows(city_id, ([(str(r.id), r.payload or {}) for r in records] for records in batches))
+
+
+def _run(job: dict, source: RebuildSource) -> None:
+    store = SyncStateStore()
+    staged: dict[str, dict[str, dict]] = {}
+    try:
+        # City locks are held until the swap so no sync writes into the outgoing version meanwhile.
+        with ExitStack() as locks:
+            for city_id in job["cities"]:
+                locks.enter_context(store.city_lock(city_id))
+            collection = create_versioned_collection(bulk=True)
+            job["collection"] = collection
+            if source == "catalog":
+                # One upload for all cities: qdrant-client starts a new worker pool per call.
+                upload_points(_catalog_points(job), collection)
+            else:
+                for city_id in job["cities"]:
+                    stats = _sync_city(store, city_id, collection=collection, force=True)
+                    staged[city_id] = stats.pop("staged_state")
+                    job["points"][city_id] = stats["chunks_upserted"]
+                    job["errors"].extend(stats["errors"])
+            expected = sum(job["points"].values())
+            job["status"] = "indexing"
+            # Crawl rebuilds overwrite point ids in place, so only the catalog path has an exact count.
+            finish_bulk_load(collection, expected_points=expected if source == "catalog" else None)
+            job["previous"] = swap_alias(collection)
+            # Only now does the crawled content describe the live index.
+            for city_id, entries in staged.items():
+                store.replace_city(city_id, entries)
+                if settings.chunk_catalog_enabled:
+                    try:
+                        _refill_catalog(city_id)
+                    except Exception as exc:  # noqa: BLE001
+                        job["errors"].append({"city_id": city_id, "error": f"catalog refill failed: {exc}"[:500]})
+        job["pruned"] = prune_versions()
+        job["status"] = "done"
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("index rebuild %s failed", job["job_id"])
+        job["status"] = "failed"
+        job["error"] = str(exc)[:500]
+        if job["collection"] and job["collection"] != alias_target():
+            client.delete_collection(job["collection"])
+    finally:
+        job["finished_at"] = datetime.now(UTC).isoformat()
+
+
+def start_rebuild(source: RebuildSource = "catalog") -> dict:
+    """Starts a background rebuild. `catalog` re-embeds stored chunks (model change); `crawl` re-chunks."""
+    global _job
+    with _lock:
+        if _job is not None and _job["status"] in ("running", "indexing"):
+            raise RebuildInProgress(f"rebuild {_job['job_id']} is still running")
+        ensure_collection()
+        require_versioned()
+        _job = {
+            "job_id": uuid.uuid4().hex,
+            "source": source,
+            "status": "running",
+            "started_at": datetime.now(UTC).isoformat(),
+            "finished_at": None,
+            "cities": _city_ids(),
+            "collection": None,
+            "previous": None,
+            "points": {},
+            "pruned": [],
+            "errors": [],
+            "error": None,
+        }
+        threading.Thread(target=_run, args=(_job, source), name="index-rebuild", daemon=True).start()
+        return dict(_job)
+
+
+def index_status() -> dict:
+    return {
+        "alias": settings.qdrant_collection,
+        "live": alias_target(),
+        "versions": list_versions(),
+        "rebuild": dict(_job) if _job else None,
+    }
+
+
+def rollback() -> dict:
+    with _lock:
+        if _job is not None and _job["status"] in ("running", "indexing"):
+            raise RebuildInProgress(f"rebuild {_job['job_id']} is still running")
+        current = alias_target()
+        older = [v for v in list_versions() if current is None or v < current]
+        if not older:
+            raise LookupError("no previous index version to roll back to")
+        swap_alias(older[-1])
+        return {"from": current, "to": older[-1]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="copy an unversioned collection into a version behind the alias")
+    sub.add_parser("status", help="print the live version, retained versions and rebuild state")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    if args.command == "migrate":
+        result = {"alias": settings.qdrant_collection, "migrated_to": migrate_unversioned()}
+    else:
+        result = index_status()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
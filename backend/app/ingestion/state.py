@@ -0,0 +1,156 @@
+import fcntl
+import json
+import os
+import sqlite3
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from pathlib import Path
+
+from backend.app.config import get_settings
+
+settings = get_settings()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_state (
+    city_id TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    run_id TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (city_id, uri)
+);
+CREATE INDEX IF NOT EXISTS idx_source_state_hash ON source_state (city_id, content_hash);
+CREATE TABLE IF NOT EXISTS sync_runs (
+    run_id TEXT PRIMARY KEY,
+    city_id TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sync_runs_open ON sync_runs (city_id, finished_at);
+"""
+
+
+class SyncInProgress(RuntimeError):
+    pass
+
+
+def _utc_now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+class SyncStateStore:
+    """Per-source sync progress in SQLite (WAL), committed as each source finishes.
+
+    A sync interrupted midway leaves its run open; the next run for that city reuses it
+    and skips every source the interrupted run already committed.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        settings.state_dir.mkdir(parents=True, exist_ok=True)
+        self.path = path or settings.state_dir / "sync_state.db"
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def city_lock(self, city_id: str) -> Iterator[None]:
+        # flock is released by the OS if the process dies, so a crash never leaves a stale lock.
+        lock_path = self.path.parent / f"{city_id}.sync.lock"
+        fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError as exc:
+                raise SyncInProgress(f"sync already running for {city_id}") from exc
+            yield
+        finally:
+            os.close(fd)
+
+    def begin_run(self, city_id: str) -> tuple[str, bool]:
+        self._migrate_json(city_id)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT run_id FROM sync_runs WHERE city_id = ? AND finished_at IS NULL "
+                "ORDER BY started_at DESC LIMIT 1",
+                (city_id,),
+            ).fetchone()
+            if row:
+                return row[0], True
+            run_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO sync_runs (run_id, city_id, started_at) VALUES (?, ?, ?)",
+                (run_id, city_id, _utc_now()),
+            )
+            return run_id, False
+
+    def finish_run(self, run_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE sync_runs SET finished_at = ? WHERE run_id = ?", (_utc_now(), run_id))
+
+    def get(self, city_id: str, uri: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT content_hash, chunk_count, run_id, updated_at FROM source_state WHERE city_id = ? AND uri = ?",
+                (city_id, uri),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"content_hash": row[0], "chunk_count": row[1], "run_id": row[2], "updated_at": row[3]}
+
+    def record(self, city_id: str, uri: str, content_hash: str, chunk_count: int, run_id: str | None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO source_state (city_id, uri, content_hash, chunk_count, run_id, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (city_id, uri) DO UPDATE SET content_hash = excluded.content_hash, "
+                "chunk_count = excluded.chunk_count, run_id = excluded.run_id, updated_at = excluded.updated_at",
+                (city_id, uri, content_hash, chunk_count, run_id, _utc_now()),
+            )
+
+    def mark_seen(self, city_id: str, uri: str, run_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE source_state SET run_id = ? WHERE city_id = ? AND uri = ?",
+                (run_id, city_id, uri),
+            )
+
+    def entries(self, city_id: str) -> dict[str, dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT uri, content_hash, chunk_count FROM source_state WHERE city_id = ?", (city_id,)
+            ).fetchall()
+        return {uri: {"content_hash": h, "chunk_count": n} for uri, h, n in rows}
+
+    def replace_city(self, city_id: str, entries: dict[str, dict]) -> None:
+        """Replaces a city's source state wholesale, e.g. with the state shipped in a bundle."""
+        now = _utc_now()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM source_state WHERE city_id = ?", (city_id,))
+            conn.executemany(
+                "INSERT INTO source_state (city_id, uri, content_hash, chunk_count, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(city_id, uri, e["content_hash"], int(e.get("chunk_count", 0)), now) for uri, e in entries.items()],
+            )
+
+    def _migrate_json(self, city_id: str) -> None:
+        legacy = self.path.parent / f"{city_id}.json"
+        if not legacy.exists():
+            return
+        try:
+            data = json.loads(legacy.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            data = {}
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO source_state (city_id, uri, content_hash, chunk_count, updated_at) "
+                "VALUES (?, ?, ?, 0, ?)",
+                [(city_id, uri, h, _utc_now()) for uri, h in data.items() if isinstance(h, str)],
+            )
+        legacy.rename(legacy.with_suffix(".json.migrated"))
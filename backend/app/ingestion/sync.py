@@ -1,120 +1,228 @@
 import hashlib
-import json
+import logging
 import uuid
 from datetime import UTC, datetime
-from pathlib import Path
 
-import yaml
 from qdrant_client.models import PointStruct
 
+from backend.app.cities import get_registry
 from backend.app.config import get_settings
+from backend.app.db.catalog import ChunkCatalogWriter, iter_city_rows, row_payload
 from backend.app.ingestion.chunk import chunk_text
-from backend.app.ingestion.crawl import fetch_url
+from backend.app.ingestion.crawl import SiteCrawler, fetch_url
+from backend.app.ingestion.frontier import CrawlFrontier
 from backend.app.ingestion.parse import extract_text
-from backend.app.rag.retrieve import embed_text
-from backend.app.vector.qdrant import delete_city_uri_points, ensure_collection, upsert_points
+from backend.app.ingestion.state import SyncStateStore
+from backend.app.rag.guardrails import chunk_keywords
+from backend.app.rag.retrieve import embed_texts
+from backend.app.vector.qdrant import BulkWriter, delete_city_uri_points, ensure_collection
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 
 def _hash_bytes(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
 
-def _state_file(city_id: str) -> Path:
-    settings.state_dir.mkdir(parents=True, exist_ok=True)
-    return settings.state_dir / f"{city_id}.json"
-
-
-def _load_state(city_id: str) -> dict:
-    p = _state_file(city_id)
-    if not p.exists():
-        return {}
+def city_sources(city_id: str) -> list[dict]:
+    city = get_registry().get(city_id)
+    return list(city.sources) if city is not None else []
+
+
+def build_points(
+    city_id: str,
+    uri: str,
+    title: str,
+    chunks: list[str],
+    content_hash: str,
+    updated_at: str,
+) -> list[PointStruct]:
+    doc_id = hashlib.sha1(uri.encode("utf-8")).hexdigest()
+    points: list[PointStruct] = []
+    for idx, (chunk, vec) in enumerate(zip(chunks, embed_texts(chunks))):
+        point_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{city_id}:{uri}:{idx}"))
+        points.append(
+            PointStruct(
+                id=point_id,
+                vector=vec,
+                payload={
+                    "city_id": city_id,
+                    "doc_id": doc_id,
+                    "chunk_id": f"{uri}#{idx}",
+                    "chunk_index": idx,
+                    "uri": uri,
+                    "title": title,
+                    "text": chunk,
+                    "keywords": chunk_keywords(chunk),
+                    "content_hash": content_hash,
+                    "updated_at": updated_at,
+                },
+            )
+        )
+    return points
+
+
+def _catalog_writer(city_id: str, stats: dict) -> ChunkCatalogWriter | None:
+    if not settings.chunk_catalog_enabled:
+        return None
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
-    except json.JSONDecodeError:
-        return {}
+        return ChunkCatalogWriter(city_id)
+    except Exception as exc:  # noqa: BLE001
+        # The catalog is a secondary copy; a sync only needs Qdrant and the local state store.
+        logger.warning("chunk catalog unavailable, syncing %s without it: %s", city_id, exc)
+        stats["catalog"] = "unavailable"
+        return None
 
 
-def _save_state(city_id: str, state: dict) -> None:
-    _state_file(city_id).write_text(json.dumps(state, indent=2), encoding="utf-8")
-
+def sync_city(city_id: str) -> dict:
+    ensure_collection()
+    store = SyncStateStore()
+    with store.city_lock(city_id):
+        return _sync_city(store, city_id)
 
-def _city_sources(city_id: str) -> list[dict]:
-    source_file = settings.city_dir / city_id / "sources.yaml"
-    if not source_file.exists():
-        return []
-    data = yaml.safe_load(source_file.read_text(encoding="utf-8")) or {}
-    return data.get("sources", [])
 
+def _sync_city(store: SyncStateStore, city_id: str, collection: str | None = None, force: bool = False) -> dict:
+    """`collection` and `force` are used by full rebuilds: write every source into a new collection.
 
-def sync_city(city_id: str) -> dict:
-    ensure_collection()
-    state = _load_state(city_id)
-    sources = _city_sources(city_id)
+    A rebuild's collection is not live yet, so its content hashes must not reach the sync state,
+    the chunk catalog or the crawl frontier: were the rebuild to fail, later syncs would skip pages
+    the live collection never got. They are returned as ``stats["staged_state"]`` instead.
+    """
+    run_id, resumed = store.begin_run(city_id)
+    sources = city_sources(city_id)
 
     stats = {
         "city_id": city_id,
+        "run_id": run_id,
+        "resumed": resumed,
         "sources_total": len(sources),
         "sources_updated": 0,
         "sources_skipped": 0,
+        "sources_resumed": 0,
         "chunks_upserted": 0,
         "errors": [],
     }
 
     now = datetime.now(UTC).isoformat()
+    writer = BulkWriter(collection)
+    staged: dict[str, dict] | None = {} if collection is not None else None
+    catalog = _catalog_writer(city_id, stats) if staged is None else None
+    frontier = CrawlFrontier() if any(src.get("type") == "crawl" for src in sources) else None
+    # Crawled pages indexed under a different URI than their frontier entry (redirect, rel=canonical).
+    frontier_urls: dict[str, str] = {}
+    # Sources are only marked done in the state store once their points are confirmed in Qdrant
+    # and their chunks are in the catalog.
+    pending: list[tuple[str, str, int]] = []
+
+    def _commit_pending() -> None:
+        try:
+            writer.barrier()
+            if catalog is not None:
+                catalog.flush()
+        except Exception as exc:  # noqa: BLE001
+            stats["errors"].extend({"uri": uri, "error": str(exc)[:500]} for uri, _, _ in pending)
+            pending.clear()
+            return
+        for uri, content_hash, count in pending:
+            if staged is not None:
+                staged[uri] = {"content_hash": content_hash, "chunk_count": count}
+            else:
+                store.record(city_id, uri, content_hash, count, run_id)
+        if frontier is not None and staged is None:
+            frontier.mark_indexed(city_id, [frontier_urls.pop(uri, uri) for uri, _, _ in pending])
+        pending.clear()
+
+    def _done(uri: str, content_hash: str, points: list[PointStruct]) -> None:
+        if catalog is not None:
+            catalog.add(uri, points)
+        pending.append((uri, content_hash, len(points)))
+        if catalog.full if catalog is not None else sum(c for _, _, c in pending) >= settings.chunk_catalog_batch_rows:
+            _commit_pending()
+
+    def _ingest(uri: str, raw: bytes, content_type: str, prior: dict | None) -> None:
+        content_hash = _hash_bytes(raw)
+
+        if not force and prior and prior["content_hash"] == content_hash:
+            store.mark_seen(city_id, uri, run_id)
+            if frontier is not None:
+                frontier.mark_indexed(city_id, [frontier_urls.pop(uri, uri)])
+            stats["sources_skipped"] += 1
+            return
+
+        title, text = extract_text(uri, raw, content_type)
+        chunks = chunk_text(text)
+        if not chunks:
+            stats["sources_skipped"] += 1
+            _done(uri, content_hash, [])
+            return
+
+        delete_city_uri_points(city_id=city_id, uri=uri, collection=collection)
+
+        points = build_points(city_id, uri, title, chunks, content_hash, now)
+        writer.add(points)
+        _done(uri, content_hash, points)
+        stats["sources_updated"] += 1
+        stats["chunks_upserted"] += len(points)
 
     for src in sources:
         uri = src.get("uri", "").strip()
         if not uri:
             continue
 
-        try:
-            raw, content_type = fetch_url(uri)
-            content_hash = _hash_bytes(raw)
-
-            if state.get(uri) == content_hash:
-                stats["sources_skipped"] += 1
-                continue
-
-            title, text = extract_text(uri, raw, content_type)
-            chunks = chunk_text(text)
-            if not chunks:
-                stats["sources_skipped"] += 1
-                state[uri] = content_hash
+        if src.get("type") == "crawl":
+            # Discovered pages go through the same hash check and indexing as listed sources.
+            try:
+                crawler = SiteCrawler(city_id, src, frontier, resumed=resumed and not force, force=force)
+                for page in crawler.pages():
+                    if page.uri != page.url:
+                        frontier_urls[page.uri] = page.url
+                    try:
+                        _ingest(page.uri, page.raw, page.content_type, store.get(city_id, page.uri))
+                    except Exception as exc:  # noqa: BLE001
+                        stats["errors"].append({"uri": page.uri, "error": str(exc)[:500]})
+            except Exception as exc:  # noqa: BLE001
+                stats["errors"].append({"uri": uri, "error": str(exc)[:500]})
                 continue
+            stats.setdefault("crawl", []).append(crawler.stats())
+            continue
 
-            delete_city_uri_points(city_id=city_id, uri=uri)
-
-            points: list[PointStruct] = []
-            for idx, chunk in enumerate(chunks):
-                vec = embed_text(chunk)
-                point_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{city_id}:{uri}:{idx}"))
-                points.append(
-                    PointStruct(
-                        id=point_id,
-                        vector=vec,
-                        payload={
-                            "city_id": city_id,
-                            "doc_id": hashlib.sha1(uri.encode("utf-8")).hexdigest(),
-                            "chunk_id": f"{uri}#{idx}",
-                            "chunk_index": idx,
-                            "uri": uri,
-                            "title": title,
-                            "text": chunk,
-                            "content_hash": content_hash,
-                            "updated_at": now,
-                        },
-                    )
-                )
-
-            upsert_points(points)
-            state[uri] = content_hash
-            stats["sources_updated"] += 1
-            stats["chunks_upserted"] += len(points)
+        prior = store.get(city_id, uri)
+        if resumed and not force and prior and prior["run_id"] == run_id:
+            # Already committed by the interrupted run; no need to fetch again.
+            stats["sources_resumed"] += 1
+            continue
 
+        try:
+            raw, content_type = fetch_url(uri)
+            _ingest(uri, raw, content_type, prior)
         except Exception as exc:  # noqa: BLE001
             stats["errors"].append({"uri": uri, "error": str(exc)[:500]})
 
-    _save_state(city_id, state)
+    _commit_pending()
+    writer.close()
+    stats.update(writer.stats())
+    store.finish_run(run_id)
+    if staged is not None:
+        stats["staged_state"] = staged
+    return stats
+
+
+def reindex_city_from_catalog(city_id: str) -> dict:
+    """Re-embeds and re-upserts a city's chunks from the Postgres catalog, without crawling."""
+    ensure_collection()
+    stats = {"city_id": city_id, "chunks_upserted": 0}
+    writer = BulkWriter()
+    with SyncStateStore().city_lock(city_id):
+        try:
+            for rows in iter_city_rows(city_id):
+                vectors = embed_texts([r["text"] for r in rows])
+                writer.add(
+                    [PointStruct(id=r["point_id"], vector=v, payload=row_payload(r)) for r, v in zip(rows, vectors)]
+                )
+                stats["chunks_upserted"] += len(rows)
+            writer.barrier()
+        finally:
+            writer.close()
+    stats.update(writer.stats())
     return stats
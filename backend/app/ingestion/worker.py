@@ -0,0 +1,204 @@
+"""Standalone sync worker: claims per-source jobs from Postgres and fetches, embeds and indexes them.
+
+Run any number of these on any number of nodes; ``POST /v1/admin/sync/enqueue`` fills the queue.
+
+    python -m backend.app.ingestion.worker
+    python -m backend.app.ingestion.worker --city san_francisco --once
+
+Unlike the in-process ``/v1/admin/sync``, workers share state only through Postgres and
+Qdrant: a source is skipped when its fetched content hash matches the one in the chunk
+catalog. Pages without chunks have no catalog rows, and the catalog may be disabled, so the
+node's sync state store is checked as a fallback and records every hash a job indexes.
+``type: crawl`` sources run as one job; their frontier lives on the worker that ran it.
+Workers refuse to start with ``QDRANT_PAYLOAD_MODE=slim``: its chunk text is stored in a local
+SQLite file on the writing node, where API nodes cannot hydrate search hits from it.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import UTC, datetime
+
+from backend.app.config import get_settings
+from backend.app.db.catalog import ChunkCatalogWriter, source_hash
+from backend.app.db.jobs import claim_jobs, complete_job, fail_job, heartbeat
+from backend.app.ingestion.chunk import chunk_text
+from backend.app.ingestion.crawl import SiteCrawler, fetch_url
+from backend.app.ingestion.frontier import CrawlFrontier
+from backend.app.ingestion.parse import extract_text
+from backend.app.ingestion.state import SyncStateStore
+from backend.app.ingestion.sync import build_points
+from backend.app.vector.qdrant import BulkWriter, delete_city_uri_points, ensure_collection
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(RuntimeError):
+    pass
+
+
+class _Heartbeat:
+    """Extends a job's lease in the background until stopped."""
+
+    def __init__(self, job_id: int, worker_id: str) -> None:
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"heartbeat-{job_id}", daemon=True)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(settings.sync_job_heartbeat_sec):
+            try:
+                if not heartbeat(self.job_id, self.worker_id):
+                    self.lost = True
+                    return
+            except Exception as exc:  # noqa: BLE001
+                # A missed beat is fine as long as the next one lands before the lease runs out.
+                logger.warning("heartbeat for job %s failed: %s", self.job_id, exc)
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class SyncWorker:
+    def __init__(self, worker_id: str | None = None, city_id: str | None = None) -> None:
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.city_id = city_id
+        self.stopping = threading.Event()
+        self.stats = {"jobs_done": 0, "jobs_failed": 0, "chunks_upserted": 0}
+        self._writer: BulkWriter | None = None
+        self._state = SyncStateStore()
+
+    def run(self, once: bool = False) -> dict:
+        """Processes jobs until stopped; with ``once`` it returns as soon as the queue is drained."""
+        if settings.qdrant_payload_mode == "slim":
+            raise RuntimeError(
+                "sync workers need QDRANT_PAYLOAD_MODE=full: slim mode keeps chunk text in a node-local "
+                "SQLite store that API nodes on other hosts cannot read"
+            )
+        ensure_collection()
+        self._writer = BulkWriter()
+        try:
+            while not self.stopping.is_set():
+                jobs = claim_jobs(self.worker_id, limit=1, city_id=self.city_id)
+                if not jobs:
+                    if once:
+                        break
+                    self.stopping.wait(settings.sync_worker_poll_sec)
+                    continue
+                self._run_job(jobs[0])
+        finally:
+            self._writer.close()
+        return {**self.stats, **self._writer.stats()}
+
+    def _run_job(self, job: dict) -> None:
+        started = time.perf_counter()
+        with _Heartbeat(job["id"], self.worker_id) as beat:
+            try:
+                result = self._process(job, beat)
+            except Exception as exc:  # noqa: BLE001
+                # Points buffered for the failed job must not be flushed with the next one.
+                self._writer.discard()
+                status = fail_job(job["id"], self.worker_id, str(exc), job["attempts"], job["max_attempts"])
+                self.stats["jobs_failed"] += 1
+                logger.warning("job %s (%s) failed, now %s: %s", job["id"], job["uri"], status, exc)
+                return
+        result["ms"] = int((time.perf_counter() - started) * 1000)
+        if complete_job(job["id"], self.worker_id, result):
+            self.stats["jobs_done"] += 1
+            self.stats["chunks_upserted"] += result["chunks_upserted"]
+        else:
+            logger.warning("job %s finished after its lease was taken over", job["id"])
+
+    def _process(self, job: dict, beat: _Heartbeat) -> dict:
+        city_id = job["city_id"]
+        result = {"pages": 0, "pages_updated": 0, "pages_skipped": 0, "chunks_upserted": 0}
+        catalog = ChunkCatalogWriter(city_id) if settings.chunk_catalog_enabled else None
+        now = datetime.now(UTC).isoformat()
+        frontier: CrawlFrontier | None = None
+        # Frontier URLs of crawled pages handled by this job, marked indexed once they are committed.
+        crawled: list[str] = []
+        # (uri, content hash, chunk count) of updated pages, recorded once their points are committed.
+        indexed: list[tuple[str, str, int]] = []
+
+        def _known_hash(uri: str) -> str | None:
+            known = source_hash(city_id, uri) if catalog is not None else None
+            if known is None:
+                prior = self._state.get(city_id, uri)
+                known = prior["content_hash"] if prior else None
+            return known
+
+        def _page(uri: str, raw: bytes, content_type: str, url: str | None = None) -> None:
+            if beat.lost:
+                raise LeaseLost(f"lease on job {job['id']} was taken over")
+            result["pages"] += 1
+            if url is not None:
+                # A redirect or rel=canonical can index a page under another URI than its frontier entry.
+                crawled.append(url)
+            content_hash = hashlib.sha256(raw).hexdigest()
+            if _known_hash(uri) == content_hash:
+                result["pages_skipped"] += 1
+                return
+            title, text = extract_text(uri, raw, content_type)
+            chunks = chunk_text(text)
+            delete_city_uri_points(city_id=city_id, uri=uri)
+            points = build_points(city_id, uri, title, chunks, content_hash, now) if chunks else []
+            self._writer.add(points)
+            if catalog is not None:
+                catalog.add(uri, points)
+            indexed.append((uri, content_hash, len(points)))
+            result["pages_updated"] += 1
+            result["chunks_upserted"] += len(points)
+
+        if job["source_type"] == "crawl":
+            frontier = CrawlFrontier()
+            crawler = SiteCrawler(city_id, {"uri": job["uri"], **(job["options_json"] or {})}, frontier)
+            for page in crawler.pages():
+                _page(page.uri, page.raw, page.content_type, page.url)
+            result["crawl"] = crawler.stats()
+        else:
+            raw, content_type = fetch_url(job["uri"])
+            _page(job["uri"], raw, content_type)
+
+        # Points are confirmed in Qdrant before the catalog records the new hash.
+        self._writer.barrier()
+        if catalog is not None:
+            catalog.flush()
+        for uri, content_hash, count in indexed:
+            self._state.record(city_id, uri, content_hash, count, None)
+        if frontier is not None:
+            # Their lastmod becomes the baseline, so the next crawl skips pages the sitemap says are unchanged.
+            frontier.mark_indexed(city_id, crawled)
+        return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--city", default=None, help="only claim jobs for this city")
+    parser.add_argument("--once", action="store_true", help="exit when no job is runnable")
+    parser.add_argument("--worker-id", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    worker = SyncWorker(worker_id=args.worker_id, city_id=args.city)
+    # Finish the current job on SIGTERM/SIGINT; an unfinished one is re-leased after its lease.
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: worker.stopping.set())
+    stats = worker.run(once=args.once)
+    logger.info("worker %s stopped: %s", worker.worker_id, stats)
+
+
+if __name__ == "__main__":
+    main()
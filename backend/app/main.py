@@ -1,16 +1,75 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from backend.app.api.admin import router as admin_router
 from backend.app.api.query import router as query_router
+from backend.app.cities import get_registry
 from backend.app.config import get_settings
+from backend.app.rag.generate import warm_up_model
+from backend.app.rag.retrieve import warm_up_embedder
+from backend.app.vector.qdrant import ensure_collection
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Queries cannot be served without these; the LLM is optional because of the extractive fallback.
+_REQUIRED_COMPONENTS = ("embedder", "vector_store")
+
+
+async def _preload(app: FastAPI, name: str, fn: Callable[[], dict | None], retry: bool) -> None:
+    delay = 1.0
+    while True:
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.to_thread(fn)
+        except Exception as exc:  # noqa: BLE001
+            app.state.readiness[name] = {"status": "error", "error": str(exc)[:200]}
+            logger.warning("preload of %s failed: %s", name, exc)
+            if not retry:
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+            continue
+        app.state.readiness[name] = {
+            "status": "ready",
+            "ms": int((time.perf_counter() - started) * 1000),
+            **(detail or {}),
+        }
+        logger.info("preloaded %s: %s", name, app.state.readiness[name])
+        return
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Loaded before serving so the first request can already validate its city.
+    get_registry()
+    steps: dict[str, tuple[Callable[[], dict | None], bool]] = {}
+    if settings.preload_on_startup:
+        steps["embedder"] = (warm_up_embedder, True)
+        steps["vector_store"] = (ensure_collection, True)
+    if settings.ollama_warmup_on_startup:
+        # Ollama may still be pulling the model; the first query will load it instead.
+        steps["llm"] = (warm_up_model, False)
+
+    app.state.readiness = {name: {"status": "pending"} for name in steps}
+    tasks = [asyncio.create_task(_preload(app, name, fn, retry)) for name, (fn, retry) in steps.items()]
+    yield
+    for task in tasks:
+        task.cancel()
+
 
 app = FastAPI(
     title="OpenCity AI",
     version="0.1.0",
     description="Multi-tenant civic knowledge retrieval API.",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -28,3 +87,13 @@ app.include_router(admin_router, prefix="/v1/admin", tags=["admin"])
 @app.get("/")
 def root() -> dict[str, str]:
     return {"status": "ok", "service": settings.app_name}
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    components = getattr(app.state, "readiness", {})
+    is_ready = all(components.get(name, {"status": "ready"})["status"] == "ready" for name in _REQUIRED_COMPONENTS)
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "components": components},
+    )
@@ -0,0 +1,87 @@
+import re
+
+from backend.app.config import get_settings
+from backend.app.rag.guardrails import _keywords, query_keywords
+
+settings = get_settings()
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_MAX_SENTENCE_WORDS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    # Llama/phi tokenizers average roughly 1.3 tokens per English word.
+    return int(len(text.split()) * 1.3 + 0.5)
+
+
+def _split_sentences(text: str) -> list[str]:
+    out: list[str] = []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        words = sentence.split()
+        # Scraped pages often lack punctuation; window long runs so extraction stays selective.
+        for i in range(0, len(words), _MAX_SENTENCE_WORDS):
+            piece = " ".join(words[i : i + _MAX_SENTENCE_WORDS])
+            if piece:
+                out.append(piece)
+    return out
+
+
+def _overlap(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def assemble_context(query: str, chunks: list[dict], budget: int | None = None) -> tuple[list[dict], dict]:
+    budget = settings.context_token_budget if budget is None else budget
+    terms = query_keywords(query)
+
+    raw_tokens = sum(estimate_tokens(c.get("text", "")) for c in chunks)
+    # Each chunk keeps its retrieval rank: it is the [n] the prompt numbers it with and citations use.
+    candidates = [
+        {**c, "rank": i}
+        for i, c in enumerate(chunks)
+        if i == 0 or float(c.get("score", 0.0)) >= settings.context_min_score
+    ]
+
+    seen: list[set[str]] = []
+    used = 0
+    out: list[dict] = []
+
+    for rank, c in enumerate(candidates):
+        if used >= budget:
+            break
+
+        kept: list[str] = []
+        kept_terms: set[str] = set()
+        for sentence in _split_sentences(c.get("text", "")):
+            kw = _keywords(sentence)
+            if terms and not (kw & terms):
+                continue
+            if any(_overlap(kw, prev) >= settings.context_dedup_threshold for prev in seen):
+                continue
+            cost = estimate_tokens(sentence)
+            if used + cost > budget:
+                break
+            kept.append(sentence)
+            kept_terms |= kw
+            seen.append(kw)
+            used += cost
+
+        if not kept and rank == 0:
+            # Always give the model something from the best hit, even without keyword overlap.
+            lead = _split_sentences(c.get("text", ""))[:2]
+            kept = lead
+            kept_terms = _keywords(" ".join(lead))
+            used += sum(estimate_tokens(s) for s in lead)
+
+        if kept:
+            out.append({**c, "text": " ".join(kept), "keywords": kept_terms})
+
+    stats = {
+        "context_chunks_in": len(chunks),
+        "context_chunks_out": len(out),
+        "context_tokens_raw": raw_tokens,
+        "context_tokens": used,
+    }
+    return out, stats
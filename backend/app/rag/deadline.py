@@ -0,0 +1,55 @@
+import math
+import time
+
+from backend.app.config import get_settings
+
+settings = get_settings()
+
+TIER_FULL = "full"
+TIER_REDUCED_CONTEXT = "reduced_context"
+TIER_EXTRACTIVE = "extractive"
+
+
+class Deadline:
+    """End-to-end latency budget for one request, started when the request arrives.
+
+    Stages ask for the remaining time to bound their own timeouts, and ``tier()`` tells
+    generation how much work still fits: the full context, a shrunken one, or none at all
+    (straight to the extractive answer).
+    """
+
+    def __init__(self, budget_ms: int | None = None) -> None:
+        self.budget_ms = budget_ms or settings.request_deadline_ms
+        self._expires = time.monotonic() + self.budget_ms / 1000
+
+    def remaining_sec(self) -> float:
+        return max(0.0, self._expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining_sec() <= 0
+
+    def timeout(self, cap: float) -> float:
+        return max(0.1, min(cap, self.remaining_sec()))
+
+    def timeout_whole_sec(self, cap: float) -> int:
+        # Qdrant's server-side timeout is in whole seconds.
+        return max(1, math.ceil(self.timeout(cap)))
+
+    def queue_budget(self, cap: float | None) -> float:
+        """How long generation may wait for a slot and still leave time to generate."""
+        room = self.remaining_sec() - settings.deadline_min_generate_ms / 1000
+        return max(0.0, room if cap is None else min(cap, room))
+
+    def tier(self) -> str:
+        remaining_ms = self.remaining_sec() * 1000
+        if remaining_ms >= settings.deadline_full_context_ms:
+            return TIER_FULL
+        if remaining_ms >= settings.deadline_min_generate_ms:
+            return TIER_REDUCED_CONTEXT
+        return TIER_EXTRACTIVE
+
+    def context_budget(self, tier: str) -> int | None:
+        if tier == TIER_REDUCED_CONTEXT:
+            return max(1, int(settings.context_token_budget * settings.deadline_reduced_context_ratio))
+        return None
@@ -0,0 +1,55 @@
+from backend.app.config import get_settings
+from backend.app.rag.context import _overlap, _split_sentences
+from backend.app.rag.guardrails import _keywords, query_keywords
+
+settings = get_settings()
+
+_MIN_SENTENCE_WORDS = 5
+_DUPLICATE_OVERLAP = 0.7
+# Supporting sentences must score at least this fraction of the best one.
+_RELATIVE_CUTOFF = 0.5
+
+
+def extractive_answer(query: str, chunks: list[dict]) -> str:
+    """Picks the sentences that best match the query across the top chunks, with citations.
+
+    Sentences are scored by query-term coverage weighted by their chunk's retrieval score,
+    near-duplicates are dropped, and the winners are returned in source order with ``[n]``
+    markers that line up with the response citations.
+    """
+    terms = query_keywords(query)
+    candidates: list[tuple[float, int, int, str, set[str]]] = []
+    for rank, chunk in enumerate(chunks[: settings.extractive_source_chunks]):
+        weight = max(0.0, float(chunk.get("score", 0.0)))
+        for pos, sentence in enumerate(_split_sentences(chunk.get("text", "").strip())):
+            if len(sentence.split()) < _MIN_SENTENCE_WORDS:
+                continue
+            sent_terms = _keywords(sentence)
+            hits = len(terms & sent_terms) / len(terms) if terms else 0.0
+            # Earlier sentences in higher-ranked chunks win ties.
+            score = hits * weight - 0.001 * pos
+            candidates.append((score, rank, pos, sentence, sent_terms))
+
+    if not candidates:
+        return "I don't know based on current city documents."
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    best = candidates[0][0]
+    chosen: list[tuple[int, int, str]] = []
+    chosen_terms: list[set[str]] = []
+    used = 0
+    for score, rank, pos, sentence, sent_terms in candidates:
+        if len(chosen) >= settings.extractive_max_sentences:
+            break
+        if chosen and (score <= 0 or score < best * _RELATIVE_CUTOFF):
+            break
+        if any(_overlap(sent_terms, t) >= _DUPLICATE_OVERLAP for t in chosen_terms):
+            continue
+        if chosen and used + len(sentence) > settings.extractive_max_chars:
+            continue
+        chosen.append((rank, pos, sentence[: settings.extractive_max_chars]))
+        chosen_terms.append(sent_terms)
+        used += len(sentence)
+
+    chosen.sort()
+    return " ".join(f"{sentence.rstrip()} [{rank + 1}]" for rank, _, sentence in chosen)
@@ -1,30 +1,95 @@
+import json
+import time
+
 import requests
 
-from backend.app.config import get_settings
-from backend.app.rag.guardrails import answer_coverage, groundedness_score
+from backend.app.config import Settings, get_settings
+from backend.app.rag.context import assemble_context
+from backend.app.rag.deadline import TIER_EXTRACTIVE, TIER_FULL, Deadline
+from backend.app.rag.extractive import extractive_answer
+from backend.app.rag.guardrails import StreamGuard
+from backend.app.rag.llm_backends import get_backends, is_failover_error
+from backend.app.rag.sessions import followup_query, history_block
 
 settings = get_settings()
 
 
-def build_prompt(query: str, chunks: list[dict]) -> str:
+SYSTEM_PROMPT = (
+    "You are a municipal information assistant. Use only the provided sources. "
+    "If the answer is not supported by sources, reply exactly: I don't know based on current city documents."
+)
+
+# System prompt and instructions stay byte-identical across requests and come before anything
+# query-specific, so Ollama can reuse the cached KV prefix instead of re-running prefill.
+INSTRUCTIONS = (
+    "Answer the question at the end in 2-4 short sentences using only the sources below. "
+    "Use citations like [1]. "
+    "If sources do not support the answer, say: I don't know based on current city documents.\n\n"
+)
+
+STOP_SEQUENCES = ["Sources:", "Statement", "Question:"]
+
+
+def build_prompt(query: str, chunks: list[dict], history: list[dict] | None = None) -> str:
     context = "\n\n".join(
         [
-            f"[Source {i + 1}] title={c.get('title', 'Untitled')} uri={c.get('uri', '')}\n{c.get('text', '')}"
+            f"[Source {c.get('rank', i) + 1}] title={c.get('title', 'Untitled')} uri={c.get('uri', '')}\n"
+            f"{c.get('text', '')}"
             for i, c in enumerate(chunks)
         ]
     )
+    turns = history_block(history)
+    conversation = f"Earlier in this conversation:\n{turns}\n\n" if turns else ""
+
+    return f"{INSTRUCTIONS}Sources:\n{context}\n\n{conversation}Question:\n{query}\n\nAnswer:"
 
-    return (
-        "Question:\n"
-        f"{query}\n\n"
-        "Sources:\n"
-        f"{context}\n\n"
-        "Answer in 2-4 short sentences. Use citations like [1]. "
-        "If sources do not support the answer, say: I don't know based on current city documents."
-    )
 
+def ollama_payload(prompt: str, *, stream: bool, num_predict: int = 120, model: str | None = None) -> dict:
+    return {
+        "model": model or settings.ollama_model,
+        "system": SYSTEM_PROMPT,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": settings.ollama_keep_alive,
+        "options": {
+            "temperature": 0.1,
+            "num_predict": num_predict,
+            # A fixed context size avoids model reloads caused by differing num_ctx values.
+            "num_ctx": settings.ollama_num_ctx,
+            "stop": STOP_SEQUENCES,
+        },
+    }
 
-def fallback_extractive(chunks: list[dict]) -> str:
+
+def warm_up_model() -> dict:
+    """Loads the model on every configured backend; fails only if none of them answered."""
+    out: dict = {}
+    errors: dict[str, str] = {}
+    for backend in get_backends().backends:
+        started = time.perf_counter()
+        try:
+            r = requests.post(
+                f"{backend.url}/api/generate",
+                json=ollama_payload(INSTRUCTIONS, stream=False, num_predict=1),
+                timeout=settings.ollama_timeout_sec,
+            )
+            r.raise_for_status()
+        except requests.RequestException as exc:
+            errors[backend.url] = str(exc)[:200]
+            continue
+        stats = _generation_stats(r.json())
+        stats["wall_ms"] = int((time.perf_counter() - started) * 1000)
+        out.setdefault("backends", {})[backend.url] = stats
+    if not out:
+        raise RuntimeError(f"no LLM backend could be warmed up: {errors}")
+    if errors:
+        out["errors"] = errors
+    return out
+
+
+def fallback_extractive(chunks: list[dict], query: str | None = None) -> str:
+    if query is not None:
+        return extractive_answer(query, chunks)
     if not chunks:
         return "I don't know based on current city documents."
     text = chunks[0].get("text", "").strip()
@@ -36,52 +101,106 @@ def fallback_extractive(chunks: list[dict]) -> str:
     return ". ".join(parts[:2])[:600]
 
 
-def _needs_fallback(answer: str) -> bool:
-    lower = answer.lower()
-    bad = [
-        "return a concise answer",
-        "sources:",
-        "statement",
-        "question:",
-        "questions:",
-        "you are a municipal information assistant",
-        "skips to main content",
-    ]
-    return any(b in lower for b in bad)
+def _generation_stats(data: dict) -> dict:
+    # Ollama reports durations in nanoseconds; TTFT is model load plus prompt prefill.
+    out: dict = {}
+    if isinstance(data.get("prompt_eval_count"), int):
+        out["prompt_tokens"] = data["prompt_eval_count"]
+    load_ns = data.get("load_duration") or 0
+    prefill_ns = data.get("prompt_eval_duration") or 0
+    if load_ns or prefill_ns:
+        out["ttft_ms"] = int((load_ns + prefill_ns) / 1_000_000)
+    return out
 
 
-def generate_answer(query: str, chunks: list[dict]) -> str:
+def generate_answer(
+    query: str,
+    chunks: list[dict],
+    stats: dict | None = None,
+    deadline: Deadline | None = None,
+    conf: Settings | None = None,
+    history: list[dict] | None = None,
+) -> str:
+    """``history`` holds earlier turns of the session; see ``sessions.history_block``."""
     if not chunks:
         return "I don't know based on current city documents."
 
-    prompt = build_prompt(query, chunks)
-
-    try:
-        r = requests.post(
-            f"{settings.ollama_base_url}/api/generate",
-            json={
-                "model": settings.ollama_model,
-                "system": "You are a municipal information assistant. Use only the provided sources. "
-                "If the answer is not supported by sources, reply exactly: I don't know based on current city documents.",
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,
-                    "num_predict": 120,
-                    "stop": ["Sources:", "Statement", "Question:"],
-                },
-            },
-            timeout=settings.ollama_timeout_sec,
-        )
-        r.raise_for_status()
-        data = r.json()
-        text = (data.get("response") or "").strip()
-        if not text or _needs_fallback(text):
-            return fallback_extractive(chunks)
-        if answer_coverage(query, text) < 0.2:
-            return fallback_extractive(chunks)
-        if groundedness_score(text, chunks) < 0.3:
-            return fallback_extractive(chunks)
-        return text
-    except Exception:
-        return fallback_extractive(chunks)
+    stats = {} if stats is None else stats
+    # Context selection and guardrails see the follow-up together with the question it follows.
+    focus = followup_query(query, history)
+    tier = deadline.tier() if deadline is not None else TIER_FULL
+    stats["degradation_tier"] = tier
+    if tier == TIER_EXTRACTIVE:
+        stats["fallback_reason"] = "deadline"
+        return fallback_extractive(chunks, focus)
+
+    context_chunks, context_stats = assemble_context(
+        focus, chunks, budget=deadline.context_budget(tier) if deadline is not None else None
+    )
+    stats.update(context_stats)
+    prompt = build_prompt(query, context_chunks, history)
+    pool = get_backends()
+    tried: set[str] = set()
+    while True:
+        if tried and deadline is not None and deadline.expired:
+            stats["fallback_reason"] = "deadline"
+            return fallback_extractive(chunks, focus)
+        backend = pool.acquire(exclude=tried)
+        if backend is None:
+            stats["fallback_reason"] = "llm_error" if tried else "llm_unavailable"
+            return fallback_extractive(chunks, focus)
+        tried.add(backend.url)
+        stats["llm_backend"] = backend.url
+        guard = StreamGuard(focus, chunks, conf)
+        started = time.perf_counter()
+        ttft_sec: float | None = None
+        deadline_hit = False
+
+        try:
+            # Stream even on the blocking path so a failing answer can be cut off mid-generation;
+            # leaving the context manager closes the connection and Ollama stops generating.
+            with requests.post(
+                f"{backend.url}/api/generate",
+                json=ollama_payload(prompt, stream=True, model=(conf or settings).ollama_model),
+                timeout=deadline.timeout(settings.ollama_timeout_sec) if deadline else settings.ollama_timeout_sec,
+                stream=True,
+            ) as r:
+                r.raise_for_status()
+                for line in r.iter_lines():
+                    if not line:
+                        continue
+                    try:
+                        payload = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    token = payload.get("response")
+                    if token:
+                        if ttft_sec is None:
+                            ttft_sec = time.perf_counter() - started
+                            stats.setdefault("ttft_ms", int(ttft_sec * 1000))
+                        if not guard.feed(token):
+                            break
+                    if payload.get("done") is True:
+                        for key, value in _generation_stats(payload).items():
+                            stats.setdefault(key, value)
+                        break
+                    if deadline is not None and deadline.expired:
+                        deadline_hit = True
+                        break
+        except Exception as exc:
+            pool.release(backend, error=repr(exc))
+            if ttft_sec is None and is_failover_error(exc):
+                # Nothing was generated yet, so another backend can take the request.
+                continue
+            stats["fallback_reason"] = "llm_error"
+            return fallback_extractive(chunks, focus)
+        pool.release(backend, ttft_sec=ttft_sec, duration_sec=time.perf_counter() - started)
+        break
+
+    if deadline_hit:
+        stats["fallback_reason"] = "deadline"
+        return fallback_extractive(chunks, focus)
+    if not guard.finish():
+        stats["fallback_reason"] = guard.failed_reason
+        return fallback_extractive(chunks, focus)
+    return guard.text.strip()
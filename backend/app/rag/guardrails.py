@@ -1,6 +1,7 @@
 import re
+from functools import lru_cache
 
-from backend.app.config import get_settings
+from backend.app.config import Settings, get_settings
 
 settings = get_settings()
 
@@ -31,25 +32,56 @@ _STOPWORDS = {
 }
 
 
+BANNED_PHRASES = (
+    "return a concise answer",
+    "sources:",
+    "statement",
+    "question:",
+    "questions:",
+    "you are a municipal information assistant",
+    "skips to main content",
+)
+_BANNED_MAX_LEN = max(len(p) for p in BANNED_PHRASES)
+_WORD_RE = re.compile(r"[a-zA-Z]{4,}")
+
+
 def _keywords(text: str) -> set[str]:
-    words = re.findall(r"[a-zA-Z]{4,}", text.lower())
+    words = _WORD_RE.findall(text.lower())
     return {w for w in words if w not in _STOPWORDS}
 
 
-def coverage_score(query: str, chunks: list[dict]) -> float:
-    terms = _keywords(query)
-    if len(terms) < settings.min_keyword_count:
+def chunk_keywords(text: str) -> list[str]:
+    # Stored in the vector payload at sync time so guardrails never re-tokenize chunk text.
+    return sorted(_keywords(text))
+
+
+@lru_cache(maxsize=2048)
+def query_keywords(query: str) -> frozenset[str]:
+    return frozenset(_keywords(query))
+
+
+def chunk_terms(chunks: list[dict]) -> set[str]:
+    out: set[str] = set()
+    for c in chunks:
+        kw = c.get("keywords")
+        # Points synced before keywords were stored fall back to tokenizing the text.
+        out |= kw if kw is not None else _keywords(c.get("text", ""))
+    return out
+
+
+def coverage_score(query: str, chunks: list[dict], conf: Settings | None = None) -> float:
+    terms = query_keywords(query)
+    if len(terms) < (conf or settings).min_keyword_count:
         return 1.0
 
-    combined = " ".join(c.get("text", "") for c in chunks[:3])
-    hay = _keywords(combined)
+    hay = chunk_terms(chunks[:3])
     if not terms:
         return 0.0
     return len(terms & hay) / len(terms)
 
 
 def answer_coverage(query: str, answer: str) -> float:
-    terms = _keywords(query)
+    terms = query_keywords(query)
     if not terms:
         return 0.0
     ans_terms = _keywords(answer)
@@ -60,23 +92,93 @@ def groundedness_score(answer: str, chunks: list[dict]) -> float:
     ans_terms = _keywords(answer)
     if not ans_terms:
         return 0.0
-    context = " ".join(c.get("text", "") for c in chunks[:3])
-    ctx_terms = _keywords(context)
+    ctx_terms = chunk_terms(chunks[:3])
     if not ctx_terms:
         return 0.0
     return len(ans_terms & ctx_terms) / len(ans_terms)
 
 
-def should_refuse(query: str, chunks: list[dict]) -> tuple[bool, str | None, dict]:
+def should_refuse(query: str, chunks: list[dict], conf: Settings | None = None) -> tuple[bool, str | None, dict]:
+    """``conf`` carries per-city threshold overrides (see ``city_settings``)."""
+    conf = conf or settings
     if not chunks:
         return True, "no_retrieval_hits", {"coverage": 0.0}
 
     top_score = float(chunks[0].get("score", 0.0))
-    if top_score < settings.similarity_threshold:
+    if top_score < conf.similarity_threshold:
         return True, "low_confidence", {"coverage": 0.0, "top_score": top_score}
 
-    coverage = coverage_score(query, chunks)
-    if coverage < settings.coverage_threshold:
+    coverage = coverage_score(query, chunks, conf)
+    if coverage < conf.coverage_threshold:
         return True, "low_coverage", {"coverage": coverage, "top_score": top_score}
 
     return False, None, {"coverage": coverage, "top_score": top_score}
+
+
+def contains_banned_phrase(text: str) -> bool:
+    lower = text.lower()
+    return any(p in lower for p in BANNED_PHRASES)
+
+
+class StreamGuard:
+    """Evaluates answer guardrails incrementally while tokens arrive.
+
+    ``feed`` returns False as soon as the partial answer fails, so callers can close the
+    upstream generation early; ``finish`` applies the checks that need the full answer.
+    """
+
+    def __init__(self, query: str, chunks: list[dict], conf: Settings | None = None) -> None:
+        self.query = query
+        self.conf = conf or settings
+        self.text = ""
+        self.failed_reason: str | None = None
+        self._ctx_terms = chunk_terms(chunks[:3])
+        self._checked_words = 0
+
+    @property
+    def word_count(self) -> int:
+        return len(self.text.split())
+
+    def _fail(self, reason: str) -> bool:
+        self.failed_reason = reason
+        return False
+
+    def _grounded(self, text: str) -> bool:
+        terms = _keywords(text)
+        if not terms:
+            return True
+        if not self._ctx_terms:
+            return False
+        return len(terms & self._ctx_terms) / len(terms) >= self.conf.groundedness_threshold
+
+    def feed(self, token: str) -> bool:
+        if self.failed_reason:
+            return False
+        self.text += token
+
+        tail = self.text[-(_BANNED_MAX_LEN + len(token)) :]
+        if contains_banned_phrase(tail):
+            return self._fail("banned_phrase")
+
+        # The last word may still be mid-token, so only score completed words.
+        words = self.text.split()[:-1]
+        window = settings.stream_guard_window_words
+        if len(words) >= window and len(words) - self._checked_words >= settings.stream_guard_check_every:
+            self._checked_words = len(words)
+            if not self._grounded(" ".join(words[-window:])):
+                return self._fail("low_groundedness")
+        return True
+
+    def finish(self) -> bool:
+        if self.failed_reason:
+            return False
+        text = self.text.strip()
+        if not text:
+            return self._fail("empty_answer")
+        if contains_banned_phrase(text):
+            return self._fail("banned_phrase")
+        if answer_coverage(self.query, text) < self.conf.answer_coverage_threshold:
+            return self._fail("low_answer_coverage")
+        if not _keywords(text) or not self._grounded(text):
+            return self._fail("low_groundedness")
+        return True
@@ -0,0 +1,200 @@
+"""Routing across several Ollama processes.
+
+Each generation goes to the healthy backend with the fewest outstanding requests. A backend
+that fails ``llm_breaker_failures`` requests in a row has its circuit opened: it gets no
+traffic for ``llm_breaker_cooldown_sec``, then a single probe request decides whether it
+closes again. A background thread polls ``/api/tags`` so a dead backend leaves the rotation
+before a user request has to find out. Callers fail over to the next backend when a request
+fails before its first token; after that the answer falls back to extractive.
+
+Thread callers (``generate_answer``) and event-loop callers (streaming) share one pool.
+"""
+
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import httpx
+import requests
+
+from backend.app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+_LATENCY_WINDOW = 256
+_HEALTH_TIMEOUT_SEC = 2.0
+
+
+@dataclass
+class Backend:
+    url: str
+    healthy: bool = True
+    outstanding: int = 0
+    breaker: str = BREAKER_CLOSED
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    probing: bool = False
+    requests: int = 0
+    errors: int = 0
+    failovers: int = 0
+    last_error: str | None = None
+    ttft_sec: deque = field(default_factory=lambda: deque(maxlen=_LATENCY_WINDOW))
+    duration_sec: deque = field(default_factory=lambda: deque(maxlen=_LATENCY_WINDOW))
+
+
+def _percentiles_ms(samples: deque) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {"p50": round(statistics.median(ordered) * 1000, 1), "p95": round(p95 * 1000, 1)}
+
+
+def is_failover_error(exc: BaseException) -> bool:
+    """True when the backend never started answering, so another one may safely be tried."""
+    if isinstance(exc, requests.ConnectionError):
+        return True
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return False
+
+
+class BackendPool:
+    def __init__(self, urls: list[str], breaker_failures: int, breaker_cooldown_sec: float) -> None:
+        self.backends = [Backend(url=u.rstrip("/")) for u in dict.fromkeys(urls)]
+        self.breaker_failures = max(1, breaker_failures)
+        self.breaker_cooldown_sec = breaker_cooldown_sec
+        self._lock = threading.Lock()
+        self._health_thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def _available(self, backend: Backend, now: float) -> bool:
+        """Whether the breaker lets a request through. Caller holds the lock."""
+        if backend.breaker == BREAKER_CLOSED:
+            return True
+        if backend.breaker == BREAKER_OPEN:
+            return now - backend.opened_at >= self.breaker_cooldown_sec
+        return not backend.probing
+
+    def acquire(self, exclude: set[str] | None = None) -> Backend | None:
+        """Picks the least-loaded usable backend, or None when every one is down or tried."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                b
+                for b in self.backends
+                if b.healthy and (not exclude or b.url not in exclude) and self._available(b, now)
+            ]
+            if not candidates:
+                return None
+            # Ties go to the backend with fewer requests so far, spreading load across idle ones.
+            backend = min(candidates, key=lambda b: (b.outstanding, b.requests))
+            if backend.breaker != BREAKER_CLOSED:
+                backend.breaker = BREAKER_HALF_OPEN
+                backend.probing = True
+            backend.outstanding += 1
+            backend.requests += 1
+            if exclude:
+                backend.failovers += 1
+            return backend
+
+    def release(
+        self,
+        backend: Backend,
+        error: str | None = None,
+        ttft_sec: float | None = None,
+        duration_sec: float | None = None,
+    ) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+            backend.probing = False
+            if error is None:
+                backend.consecutive_failures = 0
+                backend.breaker = BREAKER_CLOSED
+                if ttft_sec is not None:
+                    backend.ttft_sec.append(ttft_sec)
+                if duration_sec is not None:
+                    backend.duration_sec.append(duration_sec)
+                return
+            backend.errors += 1
+            backend.consecutive_failures += 1
+            backend.last_error = error[:200]
+            if backend.breaker == BREAKER_HALF_OPEN or backend.consecutive_failures >= self.breaker_failures:
+                if backend.breaker != BREAKER_OPEN:
+                    logger.warning("opening circuit for LLM backend %s: %s", backend.url, error)
+                backend.breaker = BREAKER_OPEN
+                backend.opened_at = time.monotonic()
+
+    def check_health(self) -> None:
+        for backend in self.backends:
+            try:
+                r = requests.get(f"{backend.url}/api/tags", timeout=_HEALTH_TIMEOUT_SEC)
+                healthy = r.status_code == 200
+            except requests.RequestException:
+                healthy = False
+            with self._lock:
+                if backend.healthy != healthy:
+                    logger.info("LLM backend %s is now %s", backend.url, "healthy" if healthy else "unhealthy")
+                backend.healthy = healthy
+
+    def start_health_checks(self, interval_sec: float) -> None:
+        if interval_sec <= 0 or self._health_thread is not None:
+            return
+
+        def _loop() -> None:
+            while not self._stop.wait(interval_sec):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=_loop, name="llm-health", daemon=True)
+        self._health_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                b.url: {
+                    "healthy": b.healthy,
+                    "breaker": b.breaker,
+                    "available": b.healthy and self._available(b, now),
+                    "outstanding": b.outstanding,
+                    "requests": b.requests,
+                    "errors": b.errors,
+                    "error_rate": round(b.errors / b.requests, 4) if b.requests else 0.0,
+                    "failovers_in": b.failovers,
+                    "last_error": b.last_error,
+                    "ttft_ms": _percentiles_ms(b.ttft_sec),
+                    "duration_ms": _percentiles_ms(b.duration_sec),
+                }
+                for b in self.backends
+            }
+
+
+def backend_urls() -> list[str]:
+    return settings.ollama_base_urls or [settings.ollama_base_url]
+
+
+@lru_cache(maxsize=1)
+def get_backends() -> BackendPool:
+    pool = BackendPool(
+        backend_urls(),
+        breaker_failures=settings.llm_breaker_failures,
+        breaker_cooldown_sec=settings.llm_breaker_cooldown_sec,
+    )
+    pool.start_health_checks(settings.llm_health_interval_sec)
+    return pool
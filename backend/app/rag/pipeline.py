@@ -1,15 +1,73 @@
-from backend.app.config import get_settings
-from backend.app.rag.generate import generate_answer
+import copy
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backend.app.cities import city_settings
+from backend.app.config import Settings, get_settings
+from backend.app.rag.deadline import TIER_EXTRACTIVE, Deadline
+from backend.app.rag.generate import fallback_extractive, generate_answer
+from backend.app.rag.extractive import extractive_answer
 from backend.app.rag.guardrails import should_refuse
-from backend.app.rag.retrieve import retrieve_chunks
+from backend.app.rag.retrieve import retrieve_chunks, retrieve_chunks_batch, retrieve_in_session
+from backend.app.rag.routing import ROUTE_EXTRACTIVE, route_answer
+from backend.app.rag.scheduler import get_scheduler
+from backend.app.rag.sessions import Session, followup_query, load_session, remember
+from backend.app.rag.singleflight import SingleFlight, coalesce_key
 
 settings = get_settings()
 
+_flights = SingleFlight()
+
+
+def _answer(city_id: str, query: str, deadline: Deadline) -> dict:
+    chunks = retrieve_chunks(city_id=city_id, query=query, deadline=deadline)
+    return _answer_from_chunks(city_id, query, chunks, deadline=deadline)
 
-def run_rag(city_id: str, query: str, session_id: str | None = None) -> dict:
-    chunks = retrieve_chunks(city_id=city_id, query=query)
 
-    refused, reason, guard_meta = should_refuse(query, chunks)
+def _answer_in_session(city_id: str, query: str, deadline: Deadline, session_id: str, session: Session) -> dict:
+    chunks, qv, session_meta = retrieve_in_session(city_id=city_id, query=query, session=session, deadline=deadline)
+    result = _answer_from_chunks(city_id, query, chunks, deadline=deadline, history=session.turns)
+    # A refused turn is still history, but its chunks are not worth offering to the next one.
+    remember(session_id, session, query, result["answer"], [] if result["meta"]["refused"] else chunks, qv)
+    result["meta"].update(session_meta, session_turn=len(session.turns) + 1)
+    return result
+
+
+def _generate(
+    city_id: str,
+    query: str,
+    chunks: list[dict],
+    stats: dict,
+    deadline: Deadline | None,
+    conf: Settings,
+    history: list[dict] | None = None,
+) -> str:
+    if not settings.scheduler_enabled:
+        return generate_answer(
+            query=query, chunks=chunks, stats=stats, deadline=deadline, conf=conf, history=history
+        )
+    # Interactive requests never wait past the point where generation could still finish in time.
+    max_wait = deadline.queue_budget(settings.scheduler_max_wait_sec) if deadline is not None else None
+    with get_scheduler().slot(city_id, max_wait) as admitted:
+        if admitted:
+            return generate_answer(
+                query=query, chunks=chunks, stats=stats, deadline=deadline, conf=conf, history=history
+            )
+    stats["fallback_reason"] = "shed"
+    stats["degradation_tier"] = TIER_EXTRACTIVE
+    return fallback_extractive(chunks, followup_query(query, history))
+
+
+def _answer_from_chunks(
+    city_id: str,
+    query: str,
+    chunks: list[dict],
+    deadline: Deadline | None = None,
+    history: list[dict] | None = None,
+) -> dict:
+    conf = city_settings(city_id)
+    focus = followup_query(query, history)
+    refused, reason, guard_meta = should_refuse(focus, chunks, conf)
 
     if refused:
         return {
@@ -20,12 +78,17 @@ def run_rag(city_id: str, query: str, session_id: str | None = None) -> dict:
                 "retrieved_k": len(chunks),
                 "refused": True,
                 "reason": reason,
-                "session_id": session_id,
                 **guard_meta,
             },
         }
 
-    answer = generate_answer(query=query, chunks=chunks)
+    route, route_signals = route_answer(focus, chunks, conf)
+    gen_stats: dict = {"route": route, **route_signals}
+    if route == ROUTE_EXTRACTIVE:
+        # The top hit already answers the query; skip the LLM entirely.
+        answer = extractive_answer(focus, chunks)
+    else:
+        answer = _generate(city_id, query, chunks, gen_stats, deadline, conf, history)
 
     citations = []
     for c in chunks[:3]:
@@ -45,7 +108,54 @@ def run_rag(city_id: str, query: str, session_id: str | None = None) -> dict:
             "city_id": city_id,
             "retrieved_k": len(chunks),
             "refused": False,
-            "model": settings.ollama_model,
-            "session_id": session_id,
+            "model": conf.ollama_model,
+            **gen_stats,
         },
     }
+
+
+def run_rag(city_id: str, query: str, session_id: str | None = None, deadline_ms: int | None = None) -> dict:
+    deadline = Deadline(deadline_ms)
+    coalesced = False
+    session = load_session(session_id, city_id)
+    if session is not None:
+        # The answer depends on the conversation, so session requests are never coalesced.
+        result = _answer_in_session(city_id, query, deadline, session_id, session)
+    elif settings.coalesce_queries:
+        # Identical in-flight queries share one retrieval and generation (and the leader's deadline).
+        shared, coalesced = _flights.do(coalesce_key(city_id, query), lambda: _answer(city_id, query, deadline))
+        result = copy.deepcopy(shared)
+    else:
+        result = _answer(city_id, query, deadline)
+
+    result["meta"]["session_id"] = session_id
+    result["meta"]["coalesced"] = coalesced
+    return result
+
+
+def run_rag_batch(items: list[tuple[str, str]], concurrency: int | None = None) -> Iterator[dict]:
+    """Answers many (city_id, query) pairs, yielding results as they complete.
+
+    Retrieval is batched; refusals are yielded straight away and only the remaining
+    queries are scheduled for generation with bounded concurrency.
+    """
+    all_chunks = retrieve_chunks_batch(items)
+
+    pending: list[tuple[int, str, str, list[dict]]] = []
+    for index, ((city_id, query), chunks) in enumerate(zip(items, all_chunks)):
+        refused, _, _ = should_refuse(query, chunks, city_settings(city_id))
+        if refused:
+            yield {"index": index, "query": query, **_answer_from_chunks(city_id, query, chunks)}
+        else:
+            pending.append((index, city_id, query, chunks))
+
+    workers = max(1, concurrency or settings.batch_generation_concurrency)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            # Batch items have no deadline: they queue fairly behind interactive traffic but are never shed.
+            pool.submit(_answer_from_chunks, city_id, query, chunks): (index, query)
+            for index, city_id, query, chunks in pending
+        }
+        for future in as_completed(futures):
+            index, query = futures[future]
+            yield {"index": index, "query": query, **future.result()}
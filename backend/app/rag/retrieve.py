@@ -1,41 +1,220 @@
+import asyncio
 from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from fastembed import TextEmbedding
+import numpy as np
 
+from backend.app.cities import city_settings
 from backend.app.config import get_settings
-from backend.app.vector.qdrant import ensure_collection, search
+from backend.app.rag.deadline import Deadline
+from backend.app.rag.sessions import Session, looks_like_followup
+from backend.app.vector.qdrant import ensure_collection, hydrate_payloads, search, search_async, search_batch
+
+if TYPE_CHECKING:
+    from fastembed import TextEmbedding
 
 settings = get_settings()
 
 
 @lru_cache(maxsize=1)
-def _embedder() -> TextEmbedding:
+def _embedder() -> "TextEmbedding":
+    # qdrant_client already imports fastembed when it is installed, so importing it here saves no
+    # startup time; the expensive part is loading the model, which the lifespan preload does.
+    from fastembed import TextEmbedding
+
     return TextEmbedding(model_name=settings.embedding_model)
 
 
+def warm_up_embedder() -> dict:
+    embed_text("warm up")
+    return {"model": settings.embedding_model}
+
+
+def _embed(texts: list[str], priority: str, batch_size: int):
+    if settings.embedding_workers > 0:
+        # Imported lazily so single-process deployments never start the pool machinery.
+        from backend.app.embedding.pool import get_pool
+
+        return get_pool().embed(texts, priority=priority, timeout=settings.embedding_timeout_sec)
+    return _embedder().embed(texts, batch_size=batch_size)
+
+
 def embed_text(text: str) -> list[float]:
     if not text.strip():
         return [0.0] * settings.vector_size
-    vec = next(_embedder().embed([text]))
+    vec = next(iter(_embed([text], "interactive", 1)))
     return vec.tolist()
 
 
-def retrieve_chunks(city_id: str, query: str, top_k: int | None = None) -> list[dict]:
-    ensure_collection()
-    qv = embed_text(query)
-    hits = search(city_id=city_id, query_embedding=qv, top_k=top_k or settings.retrieval_top_k)
+def embed_texts(texts: list[str], batch_size: int = 64, priority: str = "bulk") -> list[list[float]]:
+    out: list[list[float]] = [[0.0] * settings.vector_size for _ in texts]
+    idx = [i for i, t in enumerate(texts) if t.strip()]
+    if not idx:
+        return out
+    vectors = _embed([texts[i] for i in idx], priority, batch_size)
+    for i, vec in zip(idx, vectors):
+        out[i] = vec.tolist()
+    return out
 
+
+def _to_chunks(hits) -> list[dict]:
+    hits = list(hits)
+    hydrated = hydrate_payloads([str(h.id) for h in hits if not h.payload])
     out = []
     for h in hits:
-        payload = h.payload or {}
-        out.append(
-            {
-                "score": float(h.score),
-                "text": payload.get("text", ""),
-                "title": payload.get("title", "Untitled"),
-                "uri": payload.get("uri", ""),
-                "chunk_id": payload.get("chunk_id", ""),
-                "doc_id": payload.get("doc_id", ""),
-            }
+        payload = h.payload or hydrated.get(str(h.id), {})
+        chunk = {
+            "score": float(h.score),
+            "text": payload.get("text", ""),
+            "title": payload.get("title", "Untitled"),
+            "uri": payload.get("uri", ""),
+            "chunk_id": payload.get("chunk_id", ""),
+            "doc_id": payload.get("doc_id", ""),
+            "keywords": set(payload["keywords"]) if "keywords" in payload else None,
+            "point_id": str(h.id),
+        }
+        if isinstance(h.vector, list):
+            chunk["vector"] = h.vector
+        out.append(chunk)
+    return out
+
+
+def _search_limits(deadline: Deadline | None) -> dict:
+    if deadline is None:
+        return {}
+    return {"timeout": deadline.timeout_whole_sec(settings.qdrant_timeout_sec), "budget_sec": deadline.remaining_sec()}
+
+
+def retrieve_chunks(
+    city_id: str, query: str, top_k: int | None = None, deadline: Deadline | None = None
+) -> list[dict]:
+    ensure_collection()
+    qv = embed_text(query)
+    hits = search(
+        city_id=city_id,
+        query_embedding=qv,
+        top_k=top_k or city_settings(city_id).retrieval_top_k,
+        **_search_limits(deadline),
+    )
+    return _to_chunks(hits)
+
+
+async def retrieve_chunks_async(
+    city_id: str, query: str, top_k: int | None = None, deadline: Deadline | None = None
+) -> list[dict]:
+    """Event-loop friendly retrieve: embedding runs in a thread, the search on the async client."""
+    qv = await asyncio.to_thread(embed_text, query)
+    hits = await search_async(
+        city_id=city_id,
+        query_embedding=qv,
+        top_k=top_k or city_settings(city_id).retrieval_top_k,
+        **_search_limits(deadline),
+    )
+    if any(not h.payload for h in hits):
+        # Slim payloads are hydrated from SQLite, which blocks.
+        return await asyncio.to_thread(_to_chunks, hits)
+    return _to_chunks(hits)
+
+
+def _followup_vector(query: str, qv: list[float], session: Session) -> list[float]:
+    # Blending in the conversation's vector keeps "what about for businesses?" on topic; a
+    # question on a new topic is searched as asked.
+    if not session.turns or session.query_vector is None:
+        return qv
+    q = np.asarray(qv, dtype=np.float32)
+    if not looks_like_followup(query, session.turns):
+        s = session.query_vector
+        similarity = float(q @ s / (np.linalg.norm(q) * np.linalg.norm(s) + 1e-9))
+        if similarity < settings.session_followup_min_similarity:
+            return qv
+    w = settings.session_followup_weight
+    v = (1 - w) * q + w * session.query_vector
+    norm = float(np.linalg.norm(v))
+    return (v / norm).tolist() if norm else qv
+
+
+def _rescore(session: Session, qv: list[float]) -> list[dict]:
+    """Cosine scores of earlier turns' chunks against the new query vector, best first."""
+    m = session.candidate_vectors
+    if m is None or not session.candidates:
+        return []
+    q = np.asarray(qv, dtype=np.float32)
+    scores = m @ q / (np.linalg.norm(m, axis=1) * np.linalg.norm(q) + 1e-9)
+    return sorted(
+        ({**c, "score": float(s)} for c, s in zip(session.candidates, scores)), key=lambda c: -c["score"]
+    )
+
+
+def _merge(fresh: list[dict], prior: list[dict], top_k: int) -> list[dict]:
+    best: dict[str, dict] = {}
+    for c in fresh + prior:
+        key = c.get("point_id") or c.get("chunk_id", "")
+        if key not in best or c["score"] > best[key]["score"]:
+            best[key] = c
+    return sorted(best.values(), key=lambda c: -c["score"])[:top_k]
+
+
+def _session_plan(
+    city_id: str, query: str, qv: list[float], session: Session, top_k: int | None
+) -> tuple[int, list[float], list[dict], bool]:
+    top_k = top_k or city_settings(city_id).retrieval_top_k
+    qv = _followup_vector(query, qv, session)
+    prior = _rescore(session, qv) if session.turns else []
+    reuse = bool(prior) and prior[0]["score"] >= settings.session_reuse_min_score
+    return top_k, qv, prior, reuse
+
+
+def retrieve_in_session(
+    city_id: str, query: str, session: Session, top_k: int | None = None, deadline: Deadline | None = None
+) -> tuple[list[dict], list[float], dict]:
+    """Follow-up aware retrieval; returns the chunks, the vector to keep for the session, and meta.
+
+    If an earlier turn's chunk already matches well, those candidates are answered from
+    without a search; otherwise a search with the blended vector is merged with them.
+    """
+    ensure_collection()
+    top_k, qv, prior, reuse = _session_plan(city_id, query, embed_text(query), session, top_k)
+    if reuse:
+        return prior[:top_k], qv, {"session_reused": True}
+    hits = search(
+        city_id=city_id, query_embedding=qv, top_k=top_k, with_vectors=True, **_search_limits(deadline)
+    )
+    return _merge(_to_chunks(hits), prior, top_k), qv, {"session_reused": False}
+
+
+async def retrieve_in_session_async(
+    city_id: str, query: str, session: Session, top_k: int | None = None, deadline: Deadline | None = None
+) -> tuple[list[dict], list[float], dict]:
+    qv = await asyncio.to_thread(embed_text, query)
+    top_k, qv, prior, reuse = _session_plan(city_id, query, qv, session, top_k)
+    if reuse:
+        return prior[:top_k], qv, {"session_reused": True}
+    hits = await search_async(
+        city_id=city_id, query_embedding=qv, top_k=top_k, with_vectors=True, **_search_limits(deadline)
+    )
+    if any(not h.payload for h in hits):
+        chunks = await asyncio.to_thread(_to_chunks, hits)
+    else:
+        chunks = _to_chunks(hits)
+    return _merge(chunks, prior, top_k), qv, {"session_reused": False}
+
+
+def retrieve_chunks_batch(items: list[tuple[str, str]], top_k: int | None = None) -> list[list[dict]]:
+    """Retrieves chunks for many (city_id, query) pairs with one embedding batch and one search per city."""
+    ensure_collection()
+    vectors = embed_texts([q for _, q in items])
+
+    by_city: dict[str, list[int]] = {}
+    for i, (city_id, _) in enumerate(items):
+        by_city.setdefault(city_id, []).append(i)
+
+    out: list[list[dict]] = [[] for _ in items]
+    for city_id, idx in by_city.items():
+        results = search_batch(
+            city_id=city_id,
+            query_embeddings=[vectors[i] for i in idx],
+            top_k=top_k or city_settings(city_id).retrieval_top_k,
         )
+        for i, hits in zip(idx, results):
+            out[i] = _to_chunks(hits)
     return out
@@ -0,0 +1,36 @@
+from backend.app.config import Settings, get_settings
+from backend.app.rag.guardrails import coverage_score
+
+settings = get_settings()
+
+ROUTE_LLM = "llm"
+ROUTE_EXTRACTIVE = "extractive"
+
+
+def answer_confidence(query: str, chunks: list[dict], conf: Settings | None = None) -> dict:
+    """Cheap signal for whether the top hit alone already answers the query.
+
+    ``confidence = top_score * top_coverage * margin_factor``, where ``top_coverage`` is the
+    share of query keywords in the top chunk and ``margin_factor`` grows from 0.5 to 1.0 as
+    the lead over the second hit reaches 0.1, so near-ties never skip the LLM.
+    """
+    top_score = float(chunks[0].get("score", 0.0)) if chunks else 0.0
+    second = float(chunks[1].get("score", 0.0)) if len(chunks) > 1 else 0.0
+    margin = max(0.0, top_score - second)
+    top_coverage = coverage_score(query, chunks[:1], conf) if chunks else 0.0
+    confidence = top_score * top_coverage * min(1.0, 0.5 + margin * 5)
+    return {
+        "confidence": round(confidence, 4),
+        "top_score": round(top_score, 4),
+        "score_margin": round(margin, 4),
+        "top_coverage": round(top_coverage, 4),
+    }
+
+
+def route_answer(query: str, chunks: list[dict], conf: Settings | None = None) -> tuple[str, dict]:
+    """Runs after ``should_refuse``: high-confidence queries are answered extractively."""
+    conf = conf or settings
+    signals = answer_confidence(query, chunks, conf)
+    if conf.route_extractive_enabled and signals["confidence"] >= conf.route_confidence_threshold:
+        return ROUTE_EXTRACTIVE, signals
+    return ROUTE_LLM, signals
@@ -0,0 +1,235 @@
+"""Admission control in front of generation.
+
+Every city gets its own FIFO queue. Free Ollama slots go to the waiting city with the lowest
+virtual time (stride scheduling), so a city's share of slots follows its weight no matter how
+much traffic it sends, and a per-city cap bounds how many slots one tenant can hold. When the
+estimated wait for a new request exceeds the deadline it is shed straight to the extractive
+answer instead of queueing into an Ollama timeout.
+
+Thread callers (``run_rag``, batches) and event-loop callers (streaming) share one scheduler.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from backend.app.config import get_settings
+from backend.app.rag.llm_backends import backend_urls
+
+settings = get_settings()
+
+# Used to estimate waits until the first generations complete.
+_INITIAL_SERVICE_SEC = 3.0
+_SERVICE_EWMA_ALPHA = 0.2
+
+
+@dataclass
+class _Waiter:
+    city_id: str
+    notify: Callable[[], None]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+
+
+@dataclass
+class _CityState:
+    queue: deque = field(default_factory=deque)
+    running: int = 0
+    vtime: float = 0.0
+    admitted: int = 0
+    shed: int = 0
+    wait_ms_total: float = 0.0
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        concurrency: int,
+        default_cap: int,
+        caps: dict[str, int] | None = None,
+        weights: dict[str, float] | None = None,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.default_cap = max(1, default_cap)
+        self.caps = caps or {}
+        self.weights = weights or {}
+        self._lock = threading.Lock()
+        self._cities: dict[str, _CityState] = {}
+        self._running = 0
+        self._service_sec = _INITIAL_SERVICE_SEC
+
+    def _cap(self, city_id: str) -> int:
+        return max(1, self.caps.get(city_id, self.default_cap))
+
+    def _weight(self, city_id: str) -> float:
+        return max(0.01, self.weights.get(city_id, 1.0))
+
+    def _city(self, city_id: str) -> _CityState:
+        state = self._cities.get(city_id)
+        if state is None:
+            state = self._cities[city_id] = _CityState()
+        return state
+
+    def _min_active_vtime(self) -> float | None:
+        active = [s.vtime for s in self._cities.values() if s.queue or s.running]
+        return min(active) if active else None
+
+    def _admit(self, city_id: str, state: _CityState) -> None:
+        state.running += 1
+        state.admitted += 1
+        state.vtime += 1.0 / self._weight(city_id)
+        self._running += 1
+
+    def _dispatch(self) -> list[_Waiter]:
+        """Hands free slots to waiting cities in virtual-time order. Caller holds the lock."""
+        granted = []
+        while self._running < self.concurrency:
+            eligible = [(s.vtime, cid) for cid, s in self._cities.items() if s.queue and s.running < self._cap(cid)]
+            if not eligible:
+                break
+            _, cid = min(eligible)
+            state = self._cities[cid]
+            waiter = state.queue.popleft()
+            waiter.granted = True
+            state.wait_ms_total += (time.monotonic() - waiter.enqueued_at) * 1000
+            self._admit(cid, state)
+            granted.append(waiter)
+        return granted
+
+    def estimated_wait(self, city_id: str) -> float:
+        with self._lock:
+            return self._estimate(city_id, self._city(city_id))
+
+    def _estimate(self, city_id: str, state: _CityState) -> float:
+        if not state.queue and state.running < self._cap(city_id) and self._running < self.concurrency:
+            return 0.0
+        active_weight = sum(
+            self._weight(c) for c, s in self._cities.items() if s.queue or s.running or c == city_id
+        )
+        share = self.concurrency * self._weight(city_id) / active_weight
+        slots = max(1.0, min(float(self._cap(city_id)), share))
+        return (len(state.queue) + 1) / slots * self._service_sec
+
+    def _enqueue(self, city_id: str, notify: Callable[[], None], max_wait: float | None) -> _Waiter | None:
+        """Admits immediately, queues, or sheds (returns None). Caller holds the lock."""
+        state = self._city(city_id)
+        if not state.queue and not state.running:
+            # A city returning from idle must not spend credit saved up while it was away.
+            floor = self._min_active_vtime()
+            if floor is not None:
+                state.vtime = max(state.vtime, floor)
+        if max_wait is not None and self._estimate(city_id, state) > max_wait:
+            state.shed += 1
+            return None
+        waiter = _Waiter(city_id=city_id, notify=notify)
+        state.queue.append(waiter)
+        for w in self._dispatch():
+            if w is not waiter:
+                w.notify()
+        return waiter
+
+    def _abandon(self, waiter: _Waiter, shed: bool = True) -> bool:
+        """Drops a waiter that gave up; returns True if it was granted in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            state = self._cities[waiter.city_id]
+            state.queue.remove(waiter)
+            if shed:
+                state.shed += 1
+            return False
+
+    def acquire(self, city_id: str, max_wait: float | None) -> bool:
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(city_id, event.set, max_wait)
+        if waiter is None:
+            return False
+        if waiter.granted or event.wait(max_wait):
+            return True
+        return self._abandon(waiter)
+
+    async def acquire_async(self, city_id: str, max_wait: float | None) -> bool:
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def _notify() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with self._lock:
+            waiter = self._enqueue(city_id, _notify, max_wait)
+        if waiter is None:
+            return False
+        if waiter.granted:
+            return True
+        try:
+            await asyncio.wait_for(granted, timeout=max_wait)
+            return True
+        except TimeoutError:
+            return self._abandon(waiter)
+        except asyncio.CancelledError:
+            # The client went away; that is not a shed.
+            if self._abandon(waiter, shed=False):
+                self.release(city_id, None)
+            raise
+
+    def release(self, city_id: str, service_sec: float | None) -> None:
+        with self._lock:
+            state = self._cities[city_id]
+            state.running -= 1
+            self._running -= 1
+            if service_sec is not None:
+                self._service_sec += _SERVICE_EWMA_ALPHA * (service_sec - self._service_sec)
+            granted = self._dispatch()
+        for w in granted:
+            w.notify()
+
+    @contextmanager
+    def slot(self, city_id: str, max_wait: float | None) -> Iterator[bool]:
+        """Yields whether generation may run; False means the request was shed."""
+        if not self.acquire(city_id, max_wait):
+            yield False
+            return
+        started = time.perf_counter()
+        try:
+            yield True
+        finally:
+            self.release(city_id, time.perf_counter() - started)
+
+    def stats(self, city_id: str | None = None) -> dict:
+        with self._lock:
+            cities = {
+                cid: {
+                    "queue_depth": len(s.queue),
+                    "running": s.running,
+                    "admitted": s.admitted,
+                    "shed": s.shed,
+                    "avg_queue_wait_ms": round(s.wait_ms_total / s.admitted, 1) if s.admitted else 0.0,
+                    "weight": self._weight(cid),
+                    "cap": self._cap(cid),
+                }
+                for cid, s in self._cities.items()
+                if city_id is None or cid == city_id
+            }
+            return {
+                "concurrency": self.concurrency,
+                "running": self._running,
+                "avg_service_ms": round(self._service_sec * 1000, 1),
+                "cities": cities,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> FairScheduler:
+    # Every Ollama backend adds its own slots; a single global cap would leave extra backends idle.
+    return FairScheduler(
+        concurrency=settings.generation_concurrency_per_backend * len(backend_urls()),
+        default_cap=settings.scheduler_city_cap,
+        caps=settings.scheduler_city_caps,
+        weights=settings.scheduler_city_weights,
+    )
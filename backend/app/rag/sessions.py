@@ -0,0 +1,318 @@
+"""Conversation state per ``session_id`` so follow-up questions are answered in context.
+
+A session keeps the last few turns (question, short answer, cited chunk ids), a running
+query vector and the chunks retrieved so far together with their vectors. A question counts
+as a follow-up when it is short, leans on the earlier turn ("is it free?", "what about
+businesses?", a trailing "..."), or its embedding is close to the session vector; anything
+else starts from the raw question. A follow-up is searched with the new question's
+embedding blended with the session vector, and the prior candidates are re-scored against
+it first: if one of them is already a strong match the Qdrant search is skipped. The
+prompt carries a compact history within ``SESSION_HISTORY_TOKEN_BUDGET``.
+
+Sessions live in an in-process LRU with a TTL, bounded by count and by estimated size
+(``SESSION_BACKEND=memory``), or in a SQLite file under ``state_dir`` that every worker process
+on the host shares (``SESSION_BACKEND=sqlite``). Vectors are kept as float32 arrays: as lists
+of Python floats a session's 25 vectors would take about 300 KB instead of about 40 KB.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+from backend.app.config import get_settings
+from backend.app.rag.context import estimate_tokens
+
+settings = get_settings()
+
+_ANSWER_CHARS = 280
+# Chunk fields worth keeping for re-scoring and answering; everything else is recomputed.
+_CANDIDATE_KEYS = ("point_id", "text", "title", "uri", "chunk_id", "doc_id", "keywords")
+# Rough per-entry overhead of the dicts, strings and sets around the text, for size estimates.
+_ENTRY_BYTES = 600
+# Words and openings that only make sense against an earlier question.
+_FOLLOWUP_WORDS = frozenset({"it", "its", "this", "these", "those", "they", "them", "their", "same", "else"})
+_FOLLOWUP_LEADS = ("and ", "also ", "but ", "or ", "what about", "how about")
+
+
+@dataclass
+class Session:
+    city_id: str
+    turns: list[dict] = field(default_factory=list)
+    query_vector: np.ndarray | None = None
+    candidates: list[dict] = field(default_factory=list)
+    # One float32 row per candidate, in the same order.
+    candidate_vectors: np.ndarray | None = None
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory held by the session."""
+        vectors = sum(v.nbytes for v in (self.query_vector, self.candidate_vectors) if v is not None)
+        texts = sum(len(c.get("text") or "") for c in self.candidates)
+        texts += sum(len(t["query"]) + len(t["answer"]) for t in self.turns)
+        return vectors + texts + _ENTRY_BYTES * (len(self.candidates) + len(self.turns))
+
+
+class SessionStore(Protocol):
+    def get(self, session_id: str) -> Session | None: ...
+
+    def put(self, session_id: str, session: Session) -> None: ...
+
+    def stats(self) -> dict: ...
+
+
+class MemorySessionStore:
+    """LRU of at most ``max_sessions`` sessions and ``max_bytes`` of estimated size; idle ones
+    expire after ``ttl_sec``."""
+
+    def __init__(self, max_sessions: int, ttl_sec: float, max_bytes: int) -> None:
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[float, Session, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, session_id: str) -> Session | None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None or now - item[0] > self.ttl_sec:
+                if item is not None:
+                    del self._items[session_id]
+                    self._bytes -= item[2]
+                self.misses += 1
+                return None
+            self._items.move_to_end(session_id)
+            self.hits += 1
+            return item[1]
+
+    def put(self, session_id: str, session: Session) -> None:
+        size = session.nbytes
+        with self._lock:
+            old = self._items.pop(session_id, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._items[session_id] = (time.monotonic(), session, size)
+            self._bytes += size
+            while len(self._items) > 1 and (len(self._items) > self.max_sessions or self._bytes > self.max_bytes):
+                _, (_, _, dropped) = self._items.popitem(last=False)
+                self._bytes -= dropped
+                self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._items),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    city_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    vectors BLOB,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+"""
+
+_PRUNE_EVERY = 100
+
+
+class SqliteSessionStore:
+    """Same contract as MemorySessionStore, in SQLite (WAL) so all workers on a host share sessions.
+
+    Vectors are stored as one float32 blob (session vector first, then one row per candidate).
+    Expired and least recently used rows are pruned every ``_PRUNE_EVERY`` writes.
+    """
+
+    def __init__(self, max_sessions: int, ttl_sec: float, path: Path | None = None) -> None:
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_sec = ttl_sec
+        settings.state_dir.mkdir(parents=True, exist_ok=True)
+        self.path = path or settings.state_dir / "sessions.db"
+        self._puts = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, session_id: str) -> Session | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT city_id, data, vectors FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_sec),
+            ).fetchone()
+        if row is None:
+            return None
+        city_id, data, blob = row
+        state = json.loads(data)
+        session = Session(city_id=city_id, turns=state["turns"], candidates=state["candidates"])
+        for cand in session.candidates:
+            cand["keywords"] = set(cand["keywords"]) if cand.get("keywords") is not None else None
+        if blob:
+            rows = np.frombuffer(blob, dtype=np.float32).reshape(len(session.candidates) + 1, -1)
+            session.query_vector = rows[0]
+            session.candidate_vectors = rows[1:] if session.candidates else None
+        return session
+
+    def put(self, session_id: str, session: Session) -> None:
+        candidates = [
+            {**c, "keywords": sorted(c["keywords"]) if c.get("keywords") is not None else None}
+            for c in session.candidates
+        ]
+        blob = None
+        if session.query_vector is not None:
+            # Session vector first, then one row per candidate.
+            parts = [session.query_vector[None, :]]
+            if session.candidate_vectors is not None:
+                parts.append(session.candidate_vectors)
+            blob = np.concatenate(parts).astype(np.float32).tobytes()
+        data = json.dumps({"turns": session.turns, "candidates": candidates})
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, city_id, data, vectors, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, session.city_id, data, blob, now),
+            )
+            self._puts += 1
+            if self._puts % _PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_sec,))
+                conn.execute(
+                    "DELETE FROM sessions WHERE session_id IN "
+                    "(SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                )
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (time.time() - self.ttl_sec,)
+            ).fetchone()[0]
+        return {"backend": "sqlite", "sessions": count}
+
+
+@lru_cache(maxsize=1)
+def get_session_store() -> SessionStore:
+    if settings.session_backend == "sqlite":
+        return SqliteSessionStore(settings.session_max_sessions, settings.session_ttl_sec)
+    return MemorySessionStore(
+        settings.session_max_sessions, settings.session_ttl_sec, settings.session_store_max_mb << 20
+    )
+
+
+def load_session(session_id: str | None, city_id: str) -> Session | None:
+    """The caller's session (a fresh one if it expired or belongs to another city); None when sessions are off."""
+    if not session_id or not settings.session_enabled:
+        return None
+    session = get_session_store().get(session_id)
+    if session is None or session.city_id != city_id:
+        return Session(city_id=city_id)
+    return session
+
+
+def looks_like_followup(query: str, turns: list[dict] | None) -> bool:
+    """Text-only guess whether ``query`` continues the conversation rather than changing topic."""
+    if not turns:
+        return False
+    text = query.strip().lower()
+    words = re.findall(r"[a-z0-9']+", text)
+    return (
+        len(words) <= settings.session_followup_max_words
+        or text.startswith(_FOLLOWUP_LEADS)
+        or "..." in text
+        or "\u2026" in text
+        or any(w in _FOLLOWUP_WORDS for w in words)
+    )
+
+
+def followup_query(query: str, turns: list[dict] | None) -> str:
+    """Question text for keyword checks: a follow-up like "what about businesses?" inherits
+    the previous question's terms; a new topic keeps its own."""
+    if not looks_like_followup(query, turns):
+        return query
+    return f"{turns[-1]['query']} {query}"
+
+
+def history_block(turns: list[dict] | None, budget: int | None = None) -> str:
+    """Most recent turns that fit the token budget, oldest first."""
+    budget = settings.session_history_token_budget if budget is None else budget
+    lines: list[str] = []
+    used = 0
+    for turn in reversed(turns or []):
+        entry = f"Q: {turn['query']}\nA: {turn['answer']}"
+        cost = estimate_tokens(entry)
+        if used + cost > budget:
+            break
+        lines.insert(0, entry)
+        used += cost
+    return "\n".join(lines)
+
+
+def remember(
+    session_id: str,
+    session: Session,
+    query: str,
+    answer: str,
+    chunks: list[dict],
+    query_vector: list[float] | None,
+) -> None:
+    """Appends the turn and folds this turn's chunks into the candidate set, newest first.
+
+    Searched chunks bring their vector; chunks reused from the session take theirs from it.
+    """
+    turn = {
+        "query": query,
+        "answer": " ".join(answer.split())[:_ANSWER_CHARS],
+        "chunk_ids": [c.get("chunk_id", "") for c in chunks[:3]],
+    }
+    prior = {
+        c["point_id"]: (c, session.candidate_vectors[i])
+        for i, c in enumerate(session.candidates)
+        if session.candidate_vectors is not None
+    }
+    ordered = [
+        ({k: c.get(k) for k in _CANDIDATE_KEYS}, c["vector"]) if c.get("vector") is not None else prior[c["point_id"]]
+        for c in chunks
+        if c.get("vector") is not None or c.get("point_id") in prior
+    ]
+    seen: set[str] = set()
+    candidates: list[dict] = []
+    vectors: list = []
+    for cand, vec in ordered + list(prior.values()):
+        if cand["point_id"] and cand["point_id"] not in seen and len(candidates) < settings.session_max_candidates:
+            seen.add(cand["point_id"])
+            candidates.append(cand)
+            vectors.append(vec)
+    updated = Session(
+        city_id=session.city_id,
+        turns=(session.turns + [turn])[-max(1, settings.session_max_turns) :],
+        query_vector=(
+            np.asarray(query_vector, dtype=np.float32) if query_vector is not None else session.query_vector
+        ),
+        candidates=candidates,
+        candidate_vectors=np.asarray(vectors, dtype=np.float32) if vectors else None,
+    )
+    get_session_store().put(session_id, updated)
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+from typing import Any
+
+_CLOSED = object()
+
+
+def coalesce_key(city_id: str, query: str) -> tuple[str, str]:
+    normalized = " ".join(query.lower().split()).rstrip("?!. ")
+    return city_id, normalized
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+
+class Broadcast:
+    """In-process fan-out of one producer's events to any number of subscribers.
+
+    Late subscribers replay everything published so far. When the last subscriber leaves
+    before the producer finishes, the producer task is cancelled.
+    """
+
+    def __init__(self) -> None:
+        self.task: asyncio.Task | None = None
+        self.closed = False
+        self._history: list[Any] = []
+        self._queues: list[asyncio.Queue] = []
+
+    def publish(self, item: Any) -> None:
+        self._history.append(item)
+        for q in self._queues:
+            q.put_nowait(item)
+
+    def close(self) -> None:
+        self.closed = True
+        for q in self._queues:
+            q.put_nowait(_CLOSED)
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        q: asyncio.Queue = asyncio.Queue()
+        for item in self._history:
+            q.put_nowait(item)
+        if self.closed:
+            q.put_nowait(_CLOSED)
+        self._queues.append(q)
+        try:
+            while True:
+                item = await q.get()
+                if item is _CLOSED:
+                    return
+                yield item
+        finally:
+            self._queues.remove(q)
+            if not self._queues and not self.closed and self.task is not None:
+                self.task.cancel()
+
+
+class StreamFlights:
+    def __init__(self) -> None:
+        self._flights: dict[Hashable, Broadcast] = {}
+
+    def join(self, key: Hashable, producer: Callable[[Broadcast], Awaitable[None]]) -> tuple[Broadcast, bool]:
+        existing = self._flights.get(key)
+        if existing is not None and not existing.closed:
+            return existing, True
+
+        broadcast = Broadcast()
+        self._flights[key] = broadcast
+
+        async def _run() -> None:
+            try:
+                await producer(broadcast)
+            except asyncio.CancelledError:
+                pass
+            except Exception as exc:  # noqa: BLE001
+                broadcast.publish(("error", {"error": str(exc)[:200]}))
+            finally:
+                broadcast.close()
+                if self._flights.get(key) is broadcast:
+                    del self._flights[key]
+
+        broadcast.task = asyncio.create_task(_run())
+        return broadcast, False
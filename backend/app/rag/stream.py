@@ -1,3 +1,4 @@
+import asyncio
 import json
 import time
 import uuid
@@ -6,17 +7,24 @@ from typing import AsyncGenerator
 import httpx
 
 from backend.app.analytics.store import record_query_event
+from backend.app.cities import city_settings
 from backend.app.config import get_settings
-from backend.app.rag.generate import build_prompt, fallback_extractive
-from backend.app.rag.guardrails import should_refuse
-from backend.app.rag.retrieve import retrieve_chunks
+from backend.app.rag.context import assemble_context
+from backend.app.rag.deadline import TIER_EXTRACTIVE, Deadline
+from backend.app.rag.extractive import extractive_answer
+from backend.app.rag.generate import build_prompt, fallback_extractive, ollama_payload
+from backend.app.rag.guardrails import StreamGuard, should_refuse
+from backend.app.rag.llm_backends import get_backends, is_failover_error
+from backend.app.rag.retrieve import retrieve_chunks_async, retrieve_in_session_async
+from backend.app.rag.routing import ROUTE_EXTRACTIVE, route_answer
+from backend.app.rag.scheduler import get_scheduler
+from backend.app.rag.sessions import Session, followup_query, load_session, remember
+from backend.app.rag.singleflight import Broadcast, StreamFlights, coalesce_key
+from backend.app.rag.sse import coalesce_tokens, format_meta, format_sse
 
 settings = get_settings()
 
-
-def _format_sse(event: str, data: dict) -> str:
-    payload = json.dumps(data, ensure_ascii=True)
-    return f"event: {event}\ndata: {payload}\n\n"
+_flights = StreamFlights()
 
 
 def _safe_record(**kwargs) -> None:
@@ -41,111 +49,300 @@ def _build_citations(chunks: list[dict]) -> list[dict]:
     return out
 
 
-async def stream_answer(
-    *,
+async def _produce(
     city_id: str,
     query: str,
-    session_id: str | None,
-) -> AsyncGenerator[str, None]:
-    query_id = uuid.uuid4().hex
-    started = time.perf_counter()
+    out: Broadcast,
+    deadline: Deadline,
+    session_id: str | None = None,
+    session: Session | None = None,
+) -> None:
+    """Runs retrieval and generation once, publishing (event, data) pairs.
 
-    chunks = retrieve_chunks(city_id=city_id, query=query)
+    Per-subscriber fields (query_id, session_id, latency) are added by ``stream_answer``.
+    """
+    conf = city_settings(city_id)
+    history = session.turns if session is not None else None
+    session_meta: dict = {}
+    if session is not None:
+        chunks, qv, session_meta = await retrieve_in_session_async(
+            city_id=city_id, query=query, session=session, deadline=deadline
+        )
+        session_meta["session_turn"] = len(session.turns) + 1
+    else:
+        chunks = await retrieve_chunks_async(city_id=city_id, query=query, deadline=deadline)
     citations = _build_citations(chunks)
+    focus = followup_query(query, history)
+
+    async def _remember(answer: str, used: list[dict]) -> None:
+        # Called before ``done``: a client may send its next question as soon as it sees it.
+        if session is not None:
+            # The SQLite session store blocks.
+            await asyncio.to_thread(remember, session_id, session, query, answer, used, qv)
 
-    refused, reason, guard_meta = should_refuse(query, chunks)
+    refused, reason, guard_meta = should_refuse(focus, chunks, conf)
 
     if refused:
-        meta = {
-            "city_id": city_id,
-            "retrieved_k": len(chunks),
-            "refused": True,
-            "reason": reason,
-            "model": settings.ollama_model,
-            "session_id": session_id,
-            "query_id": query_id,
-            "citations": citations,
-            **guard_meta,
-        }
-        yield _format_sse("meta", meta)
-        yield _format_sse(
-            "token", {"token": "I don't know based on current city documents."}
+        out.publish(
+            (
+                "meta",
+                {
+                    "city_id": city_id,
+                    "retrieved_k": len(chunks),
+                    "refused": True,
+                    "reason": reason,
+                    "model": conf.ollama_model,
+                    "citations": citations,
+                    **guard_meta,
+                    **session_meta,
+                },
+            )
+        )
+        refusal = "I don't know based on current city documents."
+        out.publish(("token", {"token": refusal}))
+        # A refused turn is still history, but its chunks are not worth offering to the next one.
+        await _remember(refusal, [])
+        out.publish(
+            (
+                "done",
+                {
+                    "refused": True,
+                    "refusal_reason": reason,
+                    "retrieved_k": len(chunks),
+                    "citations_count": len(citations),
+                },
+            )
         )
-        latency_ms = int((time.perf_counter() - started) * 1000)
-        _safe_record(
-            city_id=city_id,
-            query_id=query_id,
-            query_text=query,
-            session_id=session_id,
-            latency_ms=latency_ms,
-            refused=True,
-            refusal_reason=reason,
-            retrieved_k=len(chunks),
-            citations_count=len(citations),
-            model=settings.ollama_model,
+        return
+
+    route, route_signals = route_answer(focus, chunks, conf)
+    out.publish(
+        (
+            "meta",
+            {
+                "city_id": city_id,
+                "retrieved_k": len(chunks),
+                "refused": False,
+                "model": conf.ollama_model,
+                "citations": citations,
+                "route": route,
+                **route_signals,
+                **session_meta,
+            },
+        )
+    )
+
+    if route == ROUTE_EXTRACTIVE:
+        # The top hit already answers the query; skip the LLM entirely.
+        answer = extractive_answer(focus, chunks)
+        out.publish(("token", {"token": answer}))
+        await _remember(answer, chunks)
+        out.publish(
+            (
+                "done",
+                {
+                    "refused": False,
+                    "refusal_reason": None,
+                    "retrieved_k": len(chunks),
+                    "citations_count": len(citations),
+                    # Same keys as the LLM path's done event; stream_answer reads them unconditionally.
+                    "context_tokens": None,
+                    "context_tokens_raw": None,
+                    "prompt_tokens": None,
+                    "ttft_ms": None,
+                    "fallback_reason": None,
+                    "degradation_tier": None,
+                    "route": route,
+                    "llm_backend": None,
+                },
+            )
         )
-        yield _format_sse("done", {"latency_ms": latency_ms, "refused": True})
         return
 
-    meta = {
-        "city_id": city_id,
-        "retrieved_k": len(chunks),
-        "refused": False,
-        "model": settings.ollama_model,
-        "session_id": session_id,
-        "query_id": query_id,
-        "citations": citations,
-    }
-    yield _format_sse("meta", meta)
-
-    prompt = build_prompt(query, chunks)
+    context_stats: dict = {"context_tokens": None, "context_tokens_raw": None}
     token_count = 0
     stream_failed = False
+    ttft_ms: int | None = None
+    prompt_tokens: int | None = None
+    gen_started = time.perf_counter()
+    guard = StreamGuard(focus, chunks, conf)
+    held: list[str] = []
+    released = False
+    fallback_reason: str | None = None
+    deadline_hit = False
+    llm_backend: str | None = None
+    ttft_sec: float | None = None
+    tier = deadline.tier()
 
-    try:
-        async with httpx.AsyncClient(timeout=settings.ollama_timeout_sec) as client:
-            async with client.stream(
-                "POST",
-                f"{settings.ollama_base_url}/api/generate",
-                json={
-                    "model": settings.ollama_model,
-                    "prompt": prompt,
-                    "stream": True,
-                    "options": {"temperature": 0.1, "num_predict": 120},
-                },
-            ) as resp:
-                resp.raise_for_status()
-                async for line in resp.aiter_lines():
-                    if not line:
-                        continue
-                    try:
-                        payload = json.loads(line)
-                    except json.JSONDecodeError:
+    scheduler = get_scheduler() if settings.scheduler_enabled else None
+    admitted = tier != TIER_EXTRACTIVE and (
+        scheduler is None
+        or await scheduler.acquire_async(city_id, deadline.queue_budget(settings.scheduler_max_wait_sec))
+    )
+    if admitted:
+        # Queueing used part of the budget; pick the tier for what is left.
+        tier = deadline.tier()
+        if tier == TIER_EXTRACTIVE and scheduler is not None:
+            scheduler.release(city_id, None)
+            admitted = False
+
+    if not admitted:
+        fallback_reason = "deadline" if tier == TIER_EXTRACTIVE else "shed"
+        tier = TIER_EXTRACTIVE
+    else:
+        # Opened right after admission so the slot is released whatever fails from here on.
+        try:
+            context_chunks, context_stats = assemble_context(focus, chunks, budget=deadline.context_budget(tier))
+            prompt = build_prompt(query, context_chunks, history)
+            gen_started = time.perf_counter()
+            pool = get_backends()
+            tried: set[str] = set()
+            while True:
+                if tried and deadline.expired:
+                    deadline_hit = True
+                    break
+                backend = pool.acquire(exclude=tried)
+                if backend is None:
+                    fallback_reason = "llm_error" if tried else "llm_unavailable"
+                    break
+                tried.add(backend.url)
+                llm_backend = backend.url
+                attempt_started = time.perf_counter()
+                try:
+                    async with httpx.AsyncClient(timeout=deadline.timeout(settings.ollama_timeout_sec)) as client:
+                        async with client.stream(
+                            "POST",
+                            f"{backend.url}/api/generate",
+                            json=ollama_payload(prompt, stream=True, model=conf.ollama_model),
+                        ) as resp:
+                            resp.raise_for_status()
+                            async for line in resp.aiter_lines():
+                                if not line:
+                                    continue
+                                try:
+                                    payload = json.loads(line)
+                                except json.JSONDecodeError:
+                                    continue
+                                token = payload.get("response")
+                                if token:
+                                    if ttft_ms is None:
+                                        ttft_ms = int((time.perf_counter() - gen_started) * 1000)
+                                        ttft_sec = time.perf_counter() - attempt_started
+                                    token_count += 1
+                                    if not guard.feed(token):
+                                        # Leaving the stream context closes the upstream request.
+                                        break
+                                    if released:
+                                        out.publish(("token", {"token": token}))
+                                    else:
+                                        # Hold the opening words back so most aborts happen before anything is shown.
+                                        held.append(token)
+                                        if guard.word_count >= settings.stream_guard_holdback_words:
+                                            released = True
+                                            out.publish(("token", {"token": "".join(held)}))
+                                if payload.get("done") is True:
+                                    if isinstance(payload.get("prompt_eval_count"), int):
+                                        prompt_tokens = payload["prompt_eval_count"]
+                                    break
+                                if deadline.expired:
+                                    deadline_hit = True
+                                    break
+                except Exception as exc:
+                    pool.release(backend, error=repr(exc))
+                    if token_count == 0 and is_failover_error(exc):
+                        # Nothing was generated yet, so another backend can take the request.
                         continue
-                    token = payload.get("response")
-                    if token:
-                        token_count += 1
-                        yield _format_sse("token", {"token": token})
-                    if payload.get("done") is True:
-                        break
-    except Exception:
-        stream_failed = True
-
-    if stream_failed or token_count == 0:
-        fallback = fallback_extractive(chunks)
-        yield _format_sse("token", {"token": fallback})
-
-    latency_ms = int((time.perf_counter() - started) * 1000)
-    _safe_record(
-        city_id=city_id,
-        query_id=query_id,
-        query_text=query,
-        session_id=session_id,
-        latency_ms=latency_ms,
-        refused=False,
-        refusal_reason=None,
-        retrieved_k=len(chunks),
-        citations_count=len(citations),
-        model=settings.ollama_model,
+                    stream_failed = True
+                    break
+                pool.release(backend, ttft_sec=ttft_sec, duration_sec=time.perf_counter() - attempt_started)
+                break
+        finally:
+            if scheduler is not None:
+                scheduler.release(city_id, time.perf_counter() - gen_started)
+
+        if stream_failed:
+            fallback_reason = "llm_error"
+        elif deadline_hit:
+            fallback_reason = "deadline"
+        elif fallback_reason is None and not guard.finish():
+            fallback_reason = guard.failed_reason
+
+    if fallback_reason:
+        if released:
+            out.publish(("reset", {"reason": fallback_reason}))
+        answer = fallback_extractive(chunks, focus)
+        out.publish(("token", {"token": answer}))
+    else:
+        answer = guard.text
+        if not released:
+            out.publish(("token", {"token": "".join(held)}))
+
+    await _remember(answer, chunks)
+    out.publish(
+        (
+            "done",
+            {
+                "refused": False,
+                "refusal_reason": None,
+                "retrieved_k": len(chunks),
+                "citations_count": len(citations),
+                "context_tokens": context_stats["context_tokens"],
+                "context_tokens_raw": context_stats["context_tokens_raw"],
+                "prompt_tokens": prompt_tokens,
+                "ttft_ms": ttft_ms,
+                "fallback_reason": fallback_reason,
+                "degradation_tier": tier,
+                "route": route,
+                "llm_backend": llm_backend,
+            },
+        )
     )
-    yield _format_sse("done", {"latency_ms": latency_ms, "refused": False})
+
+
+async def stream_answer(
+    *,
+    city_id: str,
+    query: str,
+    session_id: str | None,
+    gzip_meta: bool = False,
+    deadline_ms: int | None = None,
+) -> AsyncGenerator[str, None]:
+    query_id = uuid.uuid4().hex
+    started = time.perf_counter()
+    deadline = Deadline(deadline_ms)
+
+    session = load_session(session_id, city_id)
+    key = coalesce_key(city_id, query)
+    if session is not None or not settings.coalesce_queries:
+        # The answer depends on the conversation, so session requests are never coalesced.
+        key = (key, query_id)
+    broadcast, coalesced = _flights.join(
+        key, lambda out: _produce(city_id, query, out, deadline, session_id, session)
+    )
+
+    async for event, data in coalesce_tokens(broadcast.subscribe()):
+        if event == "meta":
+            yield format_meta(
+                {**data, "session_id": session_id, "query_id": query_id, "coalesced": coalesced}, gzip_meta
+            )
+        elif event == "done":
+            latency_ms = int((time.perf_counter() - started) * 1000)
+            _safe_record(
+                city_id=city_id,
+                query_id=query_id,
+                query_text=query,
+                session_id=session_id,
+                latency_ms=latency_ms,
+                model=city_settings(city_id).ollama_model,
+                coalesced=coalesced,
+                **data,
+            )
+            done = {"latency_ms": latency_ms, "refused": data["refused"]}
+            if not data["refused"]:
+                done["ttft_ms"] = data["ttft_ms"]
+                done["fallback_reason"] = data["fallback_reason"]
+                done["degradation_tier"] = data["degradation_tier"]
+                done["route"] = data["route"]
+            yield format_sse("done", done)
+        else:
+            yield format_sse(event, data)
@@ -0,0 +1,81 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from backend.app.config import get_settings
+
+settings = get_settings()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_payloads (
+    point_id TEXT PRIMARY KEY,
+    city_id TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunk_payloads_uri ON chunk_payloads (city_id, uri);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized: set[Path] = set()
+
+
+def _path() -> Path:
+    settings.state_dir.mkdir(parents=True, exist_ok=True)
+    return settings.state_dir / "chunk_store.db"
+
+
+def _conn() -> sqlite3.Connection:
+    # One connection per thread; WAL lets query threads read while a sync writes.
+    path = _path()
+    conns: dict = getattr(_local, "conns", None) or {}
+    _local.conns = conns
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if path not in _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _initialized.add(path)
+        conns[path] = conn
+    return conn
+
+
+def put_many(items: list[tuple[str, dict]]) -> None:
+    if not items:
+        return
+    conn = _conn()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunk_payloads (point_id, city_id, uri, payload) VALUES (?, ?, ?, ?)",
+            [
+                (point_id, payload.get("city_id", ""), payload.get("uri", ""), json.dumps(payload, ensure_ascii=True))
+                for point_id, payload in items
+            ],
+        )
+
+
+def get_many(point_ids: list[str]) -> dict[str, dict]:
+    if not point_ids:
+        return {}
+    marks = ",".join("?" * len(point_ids))
+    rows = _conn().execute(
+        f"SELECT point_id, payload FROM chunk_payloads WHERE point_id IN ({marks})", point_ids
+    ).fetchall()
+    return {point_id: json.loads(payload) for point_id, payload in rows}
+
+
+def delete_uri(city_id: str, uri: str) -> None:
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM chunk_payloads WHERE city_id = ? AND uri = ?", (city_id, uri))
+
+
+def delete_many(point_ids: list[str]) -> None:
+    conn = _conn()
+    with conn:
+        conn.executemany("DELETE FROM chunk_payloads WHERE point_id = ?", [(pid,) for pid in point_ids])
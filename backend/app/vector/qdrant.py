@@ -1,54 +1,596 @@
-from qdrant_client import QdrantClient
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import UTC, datetime
+from typing import TypeVar
+
+import grpc
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException
 from qdrant_client.models import (
+    CollectionStatus,
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
     Distance,
     FieldCondition,
     Filter,
     FilterSelector,
     MatchValue,
+    OptimizersConfigDiff,
+    PayloadSchemaType,
     PointStruct,
+    SearchRequest,
     VectorParams,
 )
 
 from backend.app.config import get_settings
+from backend.app.vector import chunk_store
 
 settings = get_settings()
 
-client = QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port)
+# In slim mode Qdrant keeps only what filtering and deletes need; the rest lives in chunk_store.
+_SLIM_PAYLOAD_KEYS = ("city_id", "uri", "doc_id", "chunk_id")
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Connection failures and timeouts are worth retrying; 4xx/5xx responses and their gRPC
+# equivalents (NOT_FOUND, INVALID_ARGUMENT, ...) are not.
+_TRANSIENT_GRPC_CODES = frozenset(
+    {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.RESOURCE_EXHAUSTED}
+)
+
+
+def _transient(exc: Exception) -> bool:
+    if isinstance(exc, ResponseHandlingException):
+        return True
+    code = getattr(exc, "code", None)
+    return isinstance(exc, grpc.RpcError) and callable(code) and code() in _TRANSIENT_GRPC_CODES
+
+
+def _client_kwargs() -> dict:
+    return {
+        "host": settings.qdrant_host,
+        "port": settings.qdrant_port,
+        "grpc_port": settings.qdrant_grpc_port,
+        "prefer_grpc": settings.qdrant_prefer_grpc,
+        "timeout": settings.qdrant_timeout_sec,
+        # Pool sizing applies to REST; gRPC multiplexes concurrent calls over one HTTP/2 channel.
+        "limits": httpx.Limits(
+            max_connections=settings.qdrant_pool_size, max_keepalive_connections=settings.qdrant_pool_size
+        ),
+        "grpc_options": {"grpc.keepalive_time_ms": 30_000},
+    }
+
+
+client = QdrantClient(**_client_kwargs())
+_async_client: AsyncQdrantClient | None = None
+
+
+def _aclient() -> AsyncQdrantClient:
+    global _async_client
+    if _async_client is None:
+        # Created on first use so the gRPC channel binds to the serving event loop.
+        _async_client = AsyncQdrantClient(**_client_kwargs())
+    return _async_client
+
+
+def _retry_backoff(
+    attempt: int, exc: Exception, started: float, attempt_started: float, budget_sec: float | None
+) -> float | None:
+    """Seconds to sleep before the next attempt, or None if ``exc`` should be raised.
+
+    With a budget, the next attempt is assumed to take as long as the one that just failed;
+    if that plus the backoff no longer fits, retrying would only overrun the caller.
+    """
+    if attempt == settings.qdrant_retries or not _transient(exc):
+        return None
+    backoff = 0.1 * 2**attempt
+    if budget_sec is not None:
+        now = time.monotonic()
+        if (now - started) + backoff + (now - attempt_started) > budget_sec:
+            return None
+    return backoff
+
+
+def _retry(fn: Callable[[], T], budget_sec: float | None = None) -> T:
+    started = time.monotonic()
+    for attempt in range(settings.qdrant_retries + 1):
+        attempt_started = time.monotonic()
+        try:
+            return fn()
+        except (ResponseHandlingException, grpc.RpcError) as exc:
+            backoff = _retry_backoff(attempt, exc, started, attempt_started, budget_sec)
+            if backoff is None:
+                raise
+            time.sleep(backoff)
+    raise AssertionError("unreachable")
+
+
+async def _retry_async(fn: Callable[[], Awaitable[T]], budget_sec: float | None = None) -> T:
+    started = time.monotonic()
+    for attempt in range(settings.qdrant_retries + 1):
+        attempt_started = time.monotonic()
+        try:
+            return await fn()
+        except (ResponseHandlingException, grpc.RpcError) as exc:
+            backoff = _retry_backoff(attempt, exc, started, attempt_started, budget_sec)
+            if backoff is None:
+                raise
+            await asyncio.sleep(backoff)
+    raise AssertionError("unreachable")
+
+# settings.qdrant_collection is an alias; the data lives in versioned collections behind it.
+_ensured = False
+
+
+class UnversionedCollection(RuntimeError):
+    """A pre-versioning deployment still has a real collection under the alias name."""
+
+
+def alias_target() -> str | None:
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == settings.qdrant_collection:
+            return alias.collection_name
+    return None
+
+
+def list_versions() -> list[str]:
+    prefix = f"{settings.qdrant_collection}__"
+    return sorted(c.name for c in client.get_collections().collections if c.name.startswith(prefix))
+
+
+def create_versioned_collection(bulk: bool = False) -> str:
+    name = f"{settings.qdrant_collection}__{datetime.now(UTC).strftime('%Y%m%d%H%M%S%f')}"
+    client.create_collection(
+        collection_name=name,
+        vectors_config=VectorParams(size=settings.vector_size, distance=Distance.COSINE),
+        # indexing_threshold=0 defers HNSW construction until the bulk load is done.
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0) if bulk else None,
+    )
+    for key in ("city_id", "uri"):
+        client.create_payload_index(name, field_name=key, field_schema=PayloadSchemaType.KEYWORD)
+    return name
+
+
+def finish_bulk_load(collection: str, expected_points: int | None = None) -> None:
+    deadline = time.monotonic() + settings.qdrant_green_timeout_sec
+    if expected_points is not None:
+        # upload_points does not wait for batches to apply; don't swap until every point landed.
+        while client.count(collection, exact=True).count < expected_points:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{collection} is missing points after {settings.qdrant_green_timeout_sec}s")
+            time.sleep(1)
+    client.update_collection(
+        collection_name=collection,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=settings.qdrant_indexing_threshold),
+    )
+    while client.get_collection(collection).status != CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{collection} did not finish indexing in {settings.qdrant_green_timeout_sec}s")
+        time.sleep(2)
+
+
+def swap_alias(collection: str) -> str | None:
+    """Points the alias at `collection` in a single atomic alias update; returns the previous target."""
+    alias = settings.qdrant_collection
+    previous = alias_target()
+    ops: list = []
+    if previous:
+        ops.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    else:
+        require_versioned()
+    ops.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=ops)
+    return previous
+
+
+def require_versioned() -> None:
+    alias = settings.qdrant_collection
+    if alias_target() is None and client.collection_exists(alias):
+        raise UnversionedCollection(
+            f"{alias} is a collection, not an alias; move it behind the alias once with "
+            "`python -m backend.app.ingestion.rebuild migrate`"
+        )
+
+
+def migrate_unversioned() -> str | None:
+    """Copies a pre-versioning collection into a versioned one and puts the alias in its place.
+
+    The copy is verified by point count before the original is dropped; the alias is created
+    right after, so queries fail only for that one step. Writes made during the copy are lost,
+    so run it with syncs stopped. Returns the new version, or None if there was nothing to do.
+    """
+    alias = settings.qdrant_collection
+    if alias_target() is not None or not client.collection_exists(alias):
+        return None
+    expected = client.count(alias, exact=True).count
+    target = create_versioned_collection(bulk=True)
+
+    def _points():
+        offset = None
+        while True:
+            records, offset = _retry(
+                lambda: client.scroll(
+                    collection_name=alias, limit=1024, offset=offset, with_payload=True, with_vectors=True
+                )
+            )
+            # Payloads are copied as stored; in slim mode chunk_store is keyed by the same point ids.
+            yield from (PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records)
+            if offset is None:
+                return
 
-def ensure_collection() -> None:
     try:
-        client.get_collection(settings.qdrant_collection)
-    except Exception:  # noqa: BLE001
-        client.create_collection(
-            collection_name=settings.qdrant_collection,
-            vectors_config=VectorParams(size=settings.vector_size, distance=Distance.COSINE),
+        client.upload_points(
+            collection_name=target,
+            points=_points(),
+            batch_size=settings.qdrant_rebuild_batch_size,
+            parallel=settings.qdrant_rebuild_parallel,
+            wait=False,
         )
+        finish_bulk_load(target, expected_points=expected)
+    except Exception:
+        client.delete_collection(target)
+        raise
+    logger.warning("dropping unversioned collection %s; its points are now in %s", alias, target)
+    client.delete_collection(alias)
+    client.update_collection_aliases(
+        change_aliases_operations=[
+            CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=alias))
+        ]
+    )
+    return target
+
+
+def prune_versions(keep: int | None = None) -> list[str]:
+    keep = max(1, keep or settings.qdrant_keep_versions)
+    current = alias_target()
+    versions = list_versions()
+    if current in versions:
+        # Only versions older than the live one are candidates; a newer one may be a rebuild in progress.
+        versions = versions[: versions.index(current) + 1]
+    dropped = [name for name in versions[:-keep] if name != current]
+    for name in dropped:
+        client.delete_collection(name)
+    return dropped
+
+
+def ensure_collection() -> None:
+    global _ensured
+    if _ensured:
+        return
+    if alias_target() is None and not client.collection_exists(settings.qdrant_collection):
+        swap_alias(create_versioned_collection())
+    _ensured = True
+
+
+def _city_filter(city_id: str) -> Filter:
+    return Filter(must=[FieldCondition(key="city_id", match=MatchValue(value=city_id))])
+
 
+def _slim() -> bool:
+    return settings.qdrant_payload_mode == "slim"
 
-def search(city_id: str, query_embedding: list[float], top_k: int = 8):
+
+def search(
+    city_id: str,
+    query_embedding: list[float],
+    top_k: int = 8,
+    timeout: int | None = None,
+    with_vectors: bool = False,
+    budget_sec: float | None = None,
+):
+    """``budget_sec`` is the caller's remaining time; retries stop once they would overrun it."""
     ensure_collection()
-    return client.search(
-        collection_name=settings.qdrant_collection,
-        query_vector=query_embedding,
-        query_filter=Filter(
-            must=[FieldCondition(key="city_id", match=MatchValue(value=city_id))]
+    return _retry(
+        lambda: client.search(
+            collection_name=settings.qdrant_collection,
+            query_vector=query_embedding,
+            query_filter=_city_filter(city_id),
+            with_payload=not _slim(),
+            with_vectors=with_vectors,
+            limit=top_k,
+            timeout=timeout,
         ),
-        with_payload=True,
-        with_vectors=False,
-        limit=top_k,
+        budget_sec,
     )
 
 
-def upsert_points(points: list[PointStruct]) -> None:
+async def search_async(
+    city_id: str,
+    query_embedding: list[float],
+    top_k: int = 8,
+    timeout: int | None = None,
+    with_vectors: bool = False,
+    budget_sec: float | None = None,
+):
+    if not settings.qdrant_async_search:
+        return await asyncio.to_thread(search, city_id, query_embedding, top_k, timeout, with_vectors, budget_sec)
+    await asyncio.to_thread(ensure_collection)
+    return await _retry_async(
+        lambda: _aclient().search(
+            collection_name=settings.qdrant_collection,
+            query_vector=query_embedding,
+            query_filter=_city_filter(city_id),
+            with_payload=not _slim(),
+            with_vectors=with_vectors,
+            limit=top_k,
+            timeout=timeout,
+        ),
+        budget_sec,
+    )
+
+
+def search_batch(city_id: str, query_embeddings: list[list[float]], top_k: int = 8):
+    if not query_embeddings:
+        return []
+    ensure_collection()
+    city_filter = _city_filter(city_id)
+    return _retry(
+        lambda: client.search_batch(
+            collection_name=settings.qdrant_collection,
+            requests=[
+                SearchRequest(vector=qv, filter=city_filter, with_payload=not _slim(), with_vector=False, limit=top_k)
+                for qv in query_embeddings
+            ],
+        )
+    )
+
+
+def hydrate_payloads(point_ids: list[str]) -> dict[str, dict]:
+    found = chunk_store.get_many(point_ids)
+    missing = [pid for pid in point_ids if pid not in found]
+    if missing:
+        # Points written before slim mode was enabled still carry their payload in Qdrant.
+        records = _retry(
+            lambda: client.retrieve(
+                collection_name=settings.qdrant_collection, ids=missing, with_payload=True, with_vectors=False
+            )
+        )
+        for rec in records:
+            found[str(rec.id)] = rec.payload or {}
+    return found
+
+
+def stored_payloads(ids: list[str], payloads: list[dict]) -> list[dict]:
+    """The payloads as Qdrant should hold them; in slim mode the full ones go to chunk_store first."""
+    if not _slim():
+        return payloads
+    chunk_store.put_many(list(zip(ids, payloads)))
+    return [{k: v for k, v in p.items() if k in _SLIM_PAYLOAD_KEYS} for p in payloads]
+
+
+def _stored_points(points: list[PointStruct]) -> list[PointStruct]:
+    if not _slim():
+        return points
+    payloads = stored_payloads([str(p.id) for p in points], [p.payload or {} for p in points])
+    return [PointStruct(id=p.id, vector=p.vector, payload=payload) for p, payload in zip(points, payloads)]
+
+
+def upsert_points(points: list[PointStruct], collection: str | None = None) -> None:
     if not points:
         return
-    client.upsert(collection_name=settings.qdrant_collection, points=points)
+    points = _stored_points(points)
+    _retry(lambda: client.upsert(collection_name=collection or settings.qdrant_collection, points=points))
+
+
+def _estimated_bytes(point: PointStruct) -> int:
+    # JSON floats run ~12 bytes each; close enough to keep batches under Qdrant's request size limit.
+    vector_len = len(point.vector) if isinstance(point.vector, list) else settings.vector_size
+    return vector_len * 12 + len(json.dumps(point.payload or {}, default=str)) + 64
+
+
+class BulkWriter:
+    """Buffers points across sources and writes them in size-bounded batches without waiting.
+
+    Batches go out on a small thread pool (one pooled connection each) with `wait=False` and
+    are retried with backoff. `barrier()` drains everything and re-sends the last point with
+    `wait=True`; Qdrant applies updates in order, so once that returns every earlier write is
+    visible. Call it before recording anything that assumes the points are stored.
+    """
+
+    def __init__(self, collection: str | None = None) -> None:
+        self.collection = collection or settings.qdrant_collection
+        self._buffer: list[PointStruct] = []
+        self._buffer_bytes = 0
+        self._futures: list[Future] = []
+        self._pool = ThreadPoolExecutor(max_workers=max(1, settings.qdrant_bulk_parallel))
+        self._lock = threading.Lock()
+        self._last: PointStruct | None = None
+        self._started: float | None = None
+        self._elapsed = 0.0
+        self.points = 0
+        self.batches = 0
+        self.retries = 0
+
+    def add(self, points: list[PointStruct]) -> None:
+        if not points:
+            return
+        if self._started is None:
+            self._started = time.perf_counter()
+        for point in _stored_points(points):
+            size = _estimated_bytes(point)
+            if self._buffer and self._buffer_bytes + size > settings.qdrant_bulk_max_batch_bytes:
+                self._submit()
+            self._buffer.append(point)
+            self._buffer_bytes += size
+            if len(self._buffer) >= settings.qdrant_bulk_batch_points:
+                self._submit()
+
+    def _submit(self) -> None:
+        batch, self._buffer, self._buffer_bytes = self._buffer, [], 0
+        self._last = batch[-1]
+        self._futures.append(self._pool.submit(self._write, batch))
+
+    def _write(self, batch: list[PointStruct], wait: bool = False) -> None:
+        attempts = max(1, settings.qdrant_bulk_retries + 1)
+        for attempt in range(attempts):
+            try:
+                client.upsert(collection_name=self.collection, points=batch, wait=wait)
+                break
+            except Exception:  # noqa: BLE001
+                if attempt == attempts - 1:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(0.5 * 2**attempt)
+        with self._lock:
+            self.points += len(batch)
+            self.batches += 1
+
+    def barrier(self) -> None:
+        if self._buffer:
+            self._submit()
+        futures, self._futures = self._futures, []
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(futures)} qdrant batches failed: {errors[0]}")
+        if self._last is not None:
+            self._write([self._last], wait=True)
+            self.points -= 1
+            self.batches -= 1
+            self._last = None
+        if self._started is not None:
+            self._elapsed += time.perf_counter() - self._started
+            self._started = None
+
+    def discard(self) -> None:
+        """Drops points not yet sent and waits out in-flight batches, e.g. after the job that added them failed."""
+        self._buffer, self._buffer_bytes = [], 0
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.exception()
+        self._last = None
+        self._started = None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "qdrant_points": self.points,
+            "qdrant_batches": self.batches,
+            "qdrant_retries": self.retries,
+            "points_per_sec": round(self.points / self._elapsed, 1) if self._elapsed else 0.0,
+        }
+
+
+def _stored_stream(points: Iterable[PointStruct]) -> Iterator[PointStruct]:
+    if not _slim():
+        yield from points
+        return
+    batch: list[PointStruct] = []
+    for p in points:
+        batch.append(p)
+        if len(batch) >= settings.qdrant_rebuild_batch_size:
+            yield from _stored_points(batch)
+            batch = []
+    yield from _stored_points(batch)
+
+
+def upload_points(points: Iterable[PointStruct], collection: str) -> None:
+    """High-throughput load for rebuilds: large batches, parallel workers, no per-batch wait.
+
+    Each call starts its own worker pool, so pass everything to load as one iterable.
+    """
+    client.upload_points(
+        collection_name=collection,
+        points=_stored_stream(points),
+        batch_size=settings.qdrant_rebuild_batch_size,
+        parallel=settings.qdrant_rebuild_parallel,
+        wait=False,
+    )
+
+
+def upload_arrays(ids: Iterable[str], vectors: Iterable, payloads: Iterable[dict], collection: str) -> None:
+    """Like upload_points, but takes ids, vectors and payloads as parallel streams, not PointStructs.
+
+    Payloads must already be in stored form (see ``stored_payloads``). As with upload_points,
+    pass everything as one set of iterables: each call starts its own worker pool.
+    """
+    client.upload_collection(
+        collection_name=collection,
+        vectors=vectors,
+        payload=payloads,
+        ids=ids,
+        batch_size=settings.qdrant_rebuild_batch_size,
+        parallel=settings.qdrant_rebuild_parallel,
+        wait=False,
+    )
+
+
+def iter_city_points(city_id: str, batch: int = 1024, with_vectors: bool = True):
+    """Yields a city's points page by page, payloads hydrated from chunk_store in slim mode."""
+    offset = None
+    while True:
+        records, offset = _retry(
+            lambda: client.scroll(
+                collection_name=settings.qdrant_collection,
+                scroll_filter=_city_filter(city_id),
+                limit=batch,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+        )
+        if records and _slim():
+            full = chunk_store.get_many([str(r.id) for r in records])
+            for rec in records:
+                rec.payload = full.get(str(rec.id), rec.payload)
+        if records:
+            yield records
+        if offset is None:
+            return
+
+
+def count_city_points(city_id: str, collection: str | None = None) -> int:
+    return client.count(
+        collection_name=collection or settings.qdrant_collection, count_filter=_city_filter(city_id), exact=True
+    ).count
+
+
+def city_point_ids(city_id: str, batch: int = 4096) -> set[str]:
+    ids: set[str] = set()
+    offset = None
+    while True:
+        records, offset = _retry(
+            lambda: client.scroll(
+                collection_name=settings.qdrant_collection,
+                scroll_filter=_city_filter(city_id),
+                limit=batch,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+        )
+        ids.update(str(r.id) for r in records)
+        if offset is None:
+            return ids
+
+
+def delete_points(point_ids: list[str]) -> None:
+    """Deletes from the live collection; waits, so every earlier unwaited write has been applied too."""
+    if not point_ids:
+        return
+    if _slim():
+        chunk_store.delete_many(point_ids)
+    _retry(lambda: client.delete(collection_name=settings.qdrant_collection, points_selector=point_ids, wait=True))
 
 
-def delete_city_uri_points(city_id: str, uri: str) -> None:
+def delete_city_uri_points(city_id: str, uri: str, collection: str | None = None) -> None:
+    if _slim() and collection is None:
+        # The chunk store is shared across versions; only live deletes may drop rows.
+        chunk_store.delete_uri(city_id, uri)
     client.delete(
-        collection_name=settings.qdrant_collection,
+        collection_name=collection or settings.qdrant_collection,
         points_selector=FilterSelector(
             filter=Filter(
                 must=[
@@ -62,9 +604,11 @@ def delete_city_uri_points(city_id: str, uri: str) -> None:
 
 def collection_health() -> dict:
     try:
-        info = client.get_collection(settings.qdrant_collection)
+        collection = alias_target() or settings.qdrant_collection
+        info = client.get_collection(collection)
         return {
             "status": "ready",
+            "collection": collection,
             "points_count": int(info.points_count or 0),
             "indexed_vectors_count": int(info.indexed_vectors_count or 0),
         }
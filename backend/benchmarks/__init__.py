@@ -0,0 +1 @@
+"""Standalone latency and throughput benchmarks. Run modules with ``python -m``."""
@@ -0,0 +1,63 @@
+"""Guardrail cost per query, with and without precomputed chunk keywords.
+
+    python -m backend.benchmarks.guardrails --queries 2000
+"""
+
+import argparse
+import json
+import random
+import time
+
+from backend.app.rag.guardrails import StreamGuard, chunk_keywords, should_refuse
+
+_VOCAB = (
+    "permit parking streetlight garbage collection recycling residential business license renewal "
+    "application inspection building housing rental assistance library hours transit fares sidewalk "
+    "repair graffiti removal noise complaint water billing payment online office appointment"
+).split()
+
+
+def _chunk(rng: random.Random) -> str:
+    return " ".join(rng.choice(_VOCAB) for _ in range(220))
+
+
+def _time_queries(queries: list[str], chunks: list[dict], answer: str) -> float:
+    started = time.perf_counter()
+    for q in queries:
+        should_refuse(q, chunks)
+        guard = StreamGuard(q, chunks)
+        for token in answer.split(" "):
+            guard.feed(token + " ")
+        guard.finish()
+    return (time.perf_counter() - started) / len(queries) * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    texts = [_chunk(rng) for _ in range(args.chunks)]
+    raw = [{"score": 0.9 - i * 0.05, "text": t, "keywords": None} for i, t in enumerate(texts)]
+    pre = [{**c, "keywords": set(chunk_keywords(c["text"]))} for c in raw]
+    # Distinct queries so the query keyword memo only helps within a request.
+    queries = [" ".join(rng.sample(_VOCAB, 5)) + f" q{i}" for i in range(args.queries)]
+    answer = " ".join(rng.choice(_VOCAB) for _ in range(60))
+
+    print(
+        json.dumps(
+            {
+                "queries": args.queries,
+                "chunks": args.chunks,
+                "tokenize_per_query_us": round(_time_queries(queries, raw, answer), 1),
+                "precomputed_us": round(_time_queries(queries, pre, answer), 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Offline retrieval/answer quality and latency benchmark.
+
+Drives the real pipeline (``run_rag`` / ``stream_answer``) against an in-process Qdrant
+(``QdrantClient(":memory:")``) and a mock Ollama server, so runs are reproducible and the
+JSON report can be diffed between commits.
+
+    python -m backend.benchmarks.harness --out report.json
+    python -m backend.benchmarks.harness --embedder fastembed --clients 8 --tokens-per-sec 20
+
+Settings such as ``RETRIEVAL_TOP_K`` or ``SIMILARITY_THRESHOLD`` are read from the
+environment as usual, so variants can be compared without code changes.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+import backend.app.analytics.store as analytics_store
+import backend.app.rag.retrieve as retrieve
+import backend.app.vector.qdrant as vector
+from backend.app.config import get_settings
+from backend.app.ingestion.chunk import chunk_text
+from backend.app.ingestion.sync import build_points
+from backend.app.rag.generate import generate_answer
+from backend.app.rag.guardrails import _keywords, should_refuse
+from backend.app.rag.pipeline import run_rag
+from backend.app.rag.stream import stream_answer
+from backend.app.vector.qdrant import upsert_points
+from backend.benchmarks.mock_ollama import MockOllama
+
+settings = get_settings()
+
+DEFAULT_GOLDEN = Path(__file__).parent / "golden" / "sample.json"
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words embedder so offline runs need no model download."""
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+
+    def embed(self, texts, batch_size: int = 256):
+        for text in texts:
+            v = np.zeros(self.dim, dtype=np.float32)
+            for w in _keywords(text):
+                v[int(hashlib.blake2b(w.encode("utf-8"), digest_size=8).hexdigest(), 16) % self.dim] += 1.0
+            norm = float(np.linalg.norm(v))
+            yield v / norm if norm else v
+
+
+def _pct(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "mean": None}
+    s = sorted(values)
+    return {
+        "p50": round(s[int(0.5 * (len(s) - 1))], 2),
+        "p95": round(s[int(0.95 * (len(s) - 1))], 2),
+        "mean": round(sum(s) / len(s), 2),
+    }
+
+
+def _ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def load_index(documents: list[dict]) -> int:
+    vector.ensure_collection()
+    now = datetime.now(UTC).isoformat()
+    total = 0
+    for doc in documents:
+        chunks = chunk_text(doc["text"])
+        content_hash = hashlib.sha256(doc["text"].encode("utf-8")).hexdigest()
+        points = build_points(doc["city_id"], doc["uri"], doc.get("title", "Untitled"), chunks, content_hash, now)
+        upsert_points(points)
+        total += len(points)
+    return total
+
+
+def run_stages(cases: list[dict], k: int) -> tuple[dict, dict]:
+    stages: dict[str, list[float]] = {"embed": [], "search": [], "guardrails": [], "ttft": [], "generate": []}
+    hits = answerable = refused_total = false_refusals = correct_refusals = unanswerable = 0
+    per_case = []
+
+    for case in cases:
+        started = time.perf_counter()
+        qv = retrieve.embed_text(case["question"])
+        stages["embed"].append(_ms(started))
+
+        started = time.perf_counter()
+        chunks = retrieve._to_chunks(vector.search(case["city_id"], qv, top_k=settings.retrieval_top_k))
+        stages["search"].append(_ms(started))
+
+        started = time.perf_counter()
+        refused, reason, _ = should_refuse(case["question"], chunks)
+        stages["guardrails"].append(_ms(started))
+
+        gen_stats: dict = {}
+        if not refused:
+            started = time.perf_counter()
+            generate_answer(case["question"], chunks, stats=gen_stats)
+            stages["generate"].append(_ms(started))
+            if gen_stats.get("ttft_ms") is not None:
+                stages["ttft"].append(float(gen_stats["ttft_ms"]))
+
+        uris = [c["uri"] for c in chunks[:k]]
+        expected = case.get("expected_uri")
+        refused_total += int(refused)
+        if expected:
+            answerable += 1
+            hits += int(expected in uris)
+            false_refusals += int(refused)
+        else:
+            unanswerable += 1
+            correct_refusals += int(refused)
+        per_case.append(
+            {
+                "city_id": case["city_id"],
+                "question": case["question"],
+                "expected_uri": expected,
+                "hit": bool(expected and expected in uris),
+                "refused": refused,
+                "reason": reason,
+                "top_score": round(chunks[0]["score"], 4) if chunks else None,
+                "fallback_reason": gen_stats.get("fallback_reason"),
+            }
+        )
+
+    quality = {
+        f"recall_at_{k}": round(hits / answerable, 4) if answerable else None,
+        "refusal_rate": round(refused_total / len(cases), 4) if cases else None,
+        "false_refusal_rate": round(false_refusals / answerable, 4) if answerable else None,
+        "correct_refusal_rate": round(correct_refusals / unanswerable, 4) if unanswerable else None,
+        "fallback_rate": round(
+            sum(1 for c in per_case if c["fallback_reason"]) / max(1, sum(1 for c in per_case if not c["refused"])), 4
+        ),
+        "cases": per_case,
+    }
+    return quality, {name: _pct(values) for name, values in stages.items()}
+
+
+def run_end_to_end(cases: list[dict]) -> dict:
+    blocking = []
+    for case in cases:
+        started = time.perf_counter()
+        run_rag(case["city_id"], case["question"])
+        blocking.append(_ms(started))
+
+    async def _stream(case: dict) -> tuple[float | None, float]:
+        started = time.perf_counter()
+        first: float | None = None
+        async for frame in stream_answer(city_id=case["city_id"], query=case["question"], session_id=None):
+            if first is None and frame.startswith("event: token"):
+                first = _ms(started)
+        return first, _ms(started)
+
+    async def _all() -> list[tuple[float | None, float]]:
+        return [await _stream(case) for case in cases]
+
+    streamed = asyncio.run(_all())
+    return {
+        "run_rag_ms": _pct(blocking),
+        "stream_first_token_ms": _pct([f for f, _ in streamed if f is not None]),
+        "stream_total_ms": _pct([t for _, t in streamed]),
+    }
+
+
+def check_stream_routes(cases: list[dict]) -> dict:
+    """Streams every case with answer routing forced each way and checks each stream ends with ``done``."""
+    saved = settings.route_extractive_enabled, settings.route_confidence_threshold
+
+    async def _last_event(case: dict) -> tuple[str, dict]:
+        event, data = "", {}
+        async for frame in stream_answer(city_id=case["city_id"], query=case["question"], session_id=None):
+            lines = dict(line.split(": ", 1) for line in frame.strip().split("\n") if ": " in line)
+            event = lines.get("event", "")
+            data = json.loads(lines["data"]) if event == "done" else {}
+        return event, data
+
+    report: dict = {}
+    try:
+        for forced, enabled in (("extractive", True), ("llm", False)):
+            settings.route_extractive_enabled = enabled
+            settings.route_confidence_threshold = 0.0
+            routes: dict[str, int] = {}
+            for case in cases:
+                event, data = asyncio.run(_last_event(case))
+                if event != "done":
+                    raise RuntimeError(f"{forced} stream for {case['question']!r} ended with {event!r}, not done")
+                route = "refused" if data["refused"] else data["route"]
+                routes[route] = routes.get(route, 0) + 1
+            report[forced] = routes
+    finally:
+        settings.route_extractive_enabled, settings.route_confidence_threshold = saved
+    return report
+
+
+def run_throughput(cases: list[dict], clients: int, rounds: int) -> dict:
+    work = [case for _ in range(rounds) for case in cases]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(lambda c: run_rag(c["city_id"], c["question"]), work))
+    blocking_s = time.perf_counter() - started
+
+    async def _drain(case: dict) -> None:
+        async for _ in stream_answer(city_id=case["city_id"], query=case["question"], session_id=None):
+            pass
+
+    async def _clients() -> None:
+        sem = asyncio.Semaphore(clients)
+
+        async def _one(case: dict) -> None:
+            async with sem:
+                await _drain(case)
+
+        await asyncio.gather(*(_one(c) for c in work))
+
+    started = time.perf_counter()
+    asyncio.run(_clients())
+    stream_s = time.perf_counter() - started
+
+    return {
+        "clients": clients,
+        "requests": len(work),
+        "run_rag_qps": round(len(work) / blocking_s, 2),
+        "stream_qps": round(len(work) / stream_s, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN)
+    parser.add_argument("--embedder", choices=["hash", "fastembed"], default="hash")
+    parser.add_argument("--k", type=int, default=3, help="cutoff for recall@k")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--prefill-ms", type=int, default=30)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument(
+        "--similarity-threshold",
+        type=float,
+        default=None,
+        help="override SIMILARITY_THRESHOLD (defaults to 0.2 with the hash embedder, whose scores run lower)",
+    )
+    parser.add_argument("--out", type=Path, default=None)
+    args = parser.parse_args()
+
+    golden = json.loads(args.golden.read_text(encoding="utf-8"))
+    tracemalloc.start()
+
+    vector.client = QdrantClient(":memory:")
+    # The in-process index lives on the sync client; route async search through it too.
+    settings.qdrant_async_search = False
+    if args.embedder == "hash":
+        embedder = HashEmbedder(settings.vector_size)
+        retrieve._embedder = lambda: embedder
+        if args.similarity_threshold is None:
+            args.similarity_threshold = 0.2
+    if args.similarity_threshold is not None:
+        settings.similarity_threshold = args.similarity_threshold
+
+    mock = MockOllama(tokens_per_sec=args.tokens_per_sec, prefill_ms=args.prefill_ms)
+    settings.ollama_base_url = mock.start()
+    # Identical cases would be coalesced under concurrency; measure the uncoalesced cost.
+    settings.coalesce_queries = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        events_path = Path(tmp) / "analytics_events.jsonl"
+        analytics_store._events_path = lambda: events_path
+        try:
+            started = time.perf_counter()
+            points = load_index(golden["documents"])
+            index_ms = _ms(started)
+
+            quality, stages = run_stages(golden["cases"], args.k)
+            end_to_end = run_end_to_end(golden["cases"])
+            stream_routes = check_stream_routes(golden["cases"])
+            throughput = run_throughput(golden["cases"], args.clients, args.rounds)
+        finally:
+            mock.stop()
+
+    _, peak = tracemalloc.get_traced_memory()
+    report = {
+        "commit": _git_commit(),
+        "generated_at": datetime.now(UTC).isoformat(),
+        "config": {
+            "golden": str(args.golden),
+            "embedder": args.embedder if args.embedder == "hash" else settings.embedding_model,
+            "retrieval_top_k": settings.retrieval_top_k,
+            "similarity_threshold": settings.similarity_threshold,
+            "coverage_threshold": settings.coverage_threshold,
+            "context_token_budget": settings.context_token_budget,
+            "tokens_per_sec": args.tokens_per_sec,
+            "prefill_ms": args.prefill_ms,
+        },
+        "index": {"points": points, "load_ms": round(index_ms, 2)},
+        "quality": quality,
+        "stage_latency_ms": stages,
+        "end_to_end": end_to_end,
+        "stream_routes": stream_routes,
+        "throughput": throughput,
+        "memory": {
+            "python_peak_mb": round(peak / 1_048_576, 2),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        },
+    }
+
+    out = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(out + "\n", encoding="utf-8")
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
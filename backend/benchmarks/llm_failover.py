@@ -0,0 +1,112 @@
+"""LLM backend routing: load spread, failover and breaker recovery across several mock Ollamas.
+
+Runs the golden questions through ``run_rag`` (in-process Qdrant, hash embedder) against
+``--backends`` mock Ollama servers in three phases: all healthy, one backend failing every
+request, and after it recovers. Reports per-phase fallbacks and how requests were spread.
+
+    python -m backend.benchmarks.llm_failover --backends 3 --clients 12 --slow 0
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from qdrant_client import QdrantClient
+
+import backend.app.analytics.store as analytics_store
+import backend.app.rag.retrieve as retrieve
+import backend.app.vector.qdrant as vector
+from backend.app.config import get_settings
+from backend.app.rag.llm_backends import get_backends
+from backend.app.rag.pipeline import run_rag
+from backend.benchmarks.harness import DEFAULT_GOLDEN, HashEmbedder, load_index
+from backend.benchmarks.mock_ollama import MockOllama
+
+settings = get_settings()
+
+
+def _phase(cases: list[dict], clients: int, rounds: int, mocks: list[MockOllama]) -> dict:
+    before = [m.requests for m in mocks]
+    work = [cases[i % len(cases)] for i in range(len(cases) * rounds)]
+
+    def _one(case: dict) -> tuple[float, dict]:
+        started = time.perf_counter()
+        meta = run_rag(case["city_id"], case["question"])["meta"]
+        return time.perf_counter() - started, meta
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(_one, work))
+
+    latencies = [r[0] for r in results]
+    return {
+        "queries": len(results),
+        "fallback_reasons": dict(Counter(str(m.get("fallback_reason")) for _, m in results)),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "served_by": {m.base_url: m.requests - b for m, b in zip(mocks, before)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN)
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=12)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--slow", type=int, default=None, help="index of a backend that runs at a quarter speed")
+    args = parser.parse_args()
+
+    golden = json.loads(args.golden.read_text(encoding="utf-8"))
+    vector.client = QdrantClient(":memory:")
+    settings.qdrant_async_search = False
+    embedder = HashEmbedder(settings.vector_size)
+    retrieve._embedder = lambda: embedder
+    settings.similarity_threshold = 0.2
+    settings.coalesce_queries = False
+    # Measure the backends themselves: no admission control, every query goes to the LLM.
+    settings.scheduler_enabled = False
+    settings.route_extractive_enabled = False
+    settings.llm_health_interval_sec = 0.5
+    settings.llm_breaker_cooldown_sec = 1.0
+
+    mocks = [
+        MockOllama(tokens_per_sec=args.tokens_per_sec / (4 if i == args.slow else 1), prefill_ms=10)
+        for i in range(args.backends)
+    ]
+    settings.ollama_base_urls = [m.start() for m in mocks]
+    get_backends.cache_clear()
+    pool = get_backends()
+
+    report: dict = {"backends": args.backends, "clients": args.clients, "slow": args.slow}
+    with tempfile.TemporaryDirectory() as tmp:
+        events_path = Path(tmp) / "analytics_events.jsonl"
+        analytics_store._events_path = lambda: events_path
+        try:
+            load_index(golden["documents"])
+            report["healthy"] = _phase(golden["cases"], args.clients, args.rounds, mocks)
+
+            mocks[-1].fail = True
+            report["one_failing"] = _phase(golden["cases"], args.clients, args.rounds, mocks)
+            report["one_failing"]["breaker"] = pool.stats()[mocks[-1].base_url]["breaker"]
+
+            mocks[-1].fail = False
+            # One health-check interval plus the breaker cooldown.
+            time.sleep(settings.llm_health_interval_sec + settings.llm_breaker_cooldown_sec + 0.2)
+            report["recovered"] = _phase(golden["cases"], args.clients, args.rounds, mocks)
+            report["backend_stats"] = pool.stats()
+        finally:
+            pool.stop()
+            for m in mocks:
+                m.stop()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Local stand-in for the Ollama HTTP API that streams canned tokens at a fixed rate.
+
+The answer echoes the opening words of ``[Source 1]`` in the prompt, so it passes the
+groundedness guardrails the same way a well-behaved model would.
+
+    python -m backend.benchmarks.mock_ollama --port 11434 --tokens-per-sec 20
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_SOURCE_RE = re.compile(r"\[Source 1\][^\n]*\n([^\n]+)")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients closing idle keep-alive connections is normal here.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def canned_answer(prompt: str, max_words: int = 40) -> str:
+    m = _SOURCE_RE.search(prompt)
+    if not m:
+        return "I don't know based on current city documents."
+    words = m.group(1).split()[:max_words]
+    return " ".join(words) + " [1]."
+
+
+class MockOllama:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tokens_per_sec: float = 30.0,
+        prefill_ms: int = 50,
+        answer: str | None = None,
+    ) -> None:
+        self.tokens_per_sec = tokens_per_sec
+        self.prefill_ms = prefill_ms
+        self.answer = answer
+        self.requests = 0
+        self.in_flight = 0
+        self.fail = False
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                return
+
+            def _json(self, status: int, body: dict) -> None:
+                raw = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self) -> None:
+                if mock.fail:
+                    self._json(503, {"error": "unavailable"})
+                elif self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": "mock"}]})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                if mock.fail:
+                    self._json(503, {"error": "unavailable"})
+                    return
+                with mock._lock:
+                    mock.requests += 1
+                    mock.in_flight += 1
+                try:
+                    self._generate(body)
+                finally:
+                    with mock._lock:
+                        mock.in_flight -= 1
+
+            def _generate(self, body: dict) -> None:
+                prompt = body.get("prompt") or ""
+                answer = mock.answer or canned_answer(prompt)
+                tokens = [w + " " for w in answer.split()]
+                prompt_tokens = len(prompt.split())
+                time.sleep(mock.prefill_ms / 1000)
+                stats = {
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": mock.prefill_ms * 1_000_000,
+                    "load_duration": 0,
+                    "eval_count": len(tokens),
+                }
+
+                if not body.get("stream", True):
+                    time.sleep(len(tokens) / mock.tokens_per_sec)
+                    self._json(200, {"response": "".join(tokens).strip(), **stats})
+                    return
+
+                self.send_response(200)
+                self.send_header("content-type", "application/x-ndjson")
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        self._chunk({"response": token, "done": False})
+                        time.sleep(1 / mock.tokens_per_sec)
+                    self._chunk({"response": "", **stats})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client aborted the generation early.
+                    return
+
+            def _chunk(self, data: dict) -> None:
+                raw = (json.dumps(data) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens-per-sec", type=float, default=30.0)
+    parser.add_argument("--prefill-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    mock = MockOllama(args.host, args.port, args.tokens_per_sec, args.prefill_ms)
+    print(f"mock ollama listening on {mock.base_url}")
+    mock._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Search response size and decode cost: full Qdrant payloads vs slim + local chunk store.
+
+Needs a running Qdrant (QDRANT_HOST/QDRANT_PORT); uses a throwaway collection.
+
+    python -m backend.benchmarks.payload --points 2000 --queries 200
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from qdrant_client.models import Distance, PointStruct, ScoredPoint, VectorParams
+
+import backend.app.vector.chunk_store as chunk_store
+from backend.app.config import get_settings
+from backend.app.vector.qdrant import client
+
+settings = get_settings()
+
+_COLLECTION = "opencity_bench_payload"
+_WORDS = "permit parking streetlight garbage recycling license renewal inspection housing transit repair".split()
+
+
+def _vec(rng: random.Random) -> list[float]:
+    return [rng.uniform(-1, 1) for _ in range(settings.vector_size)]
+
+
+def _payload(i: int, rng: random.Random) -> dict:
+    return {
+        "city_id": "bench",
+        "uri": f"https://bench.example.gov/page/{i // 5}",
+        "doc_id": f"doc{i // 5}",
+        "chunk_id": f"https://bench.example.gov/page/{i // 5}#{i % 5}",
+        "chunk_index": i % 5,
+        "title": f"Bench page {i // 5}",
+        "text": " ".join(rng.choice(_WORDS) for _ in range(220)),
+        "keywords": sorted(set(_WORDS)),
+        "content_hash": "0" * 64,
+        "updated_at": "2026-01-01T00:00:00+00:00",
+    }
+
+
+def _run(queries: list[list[float]], top_k: int, with_payload: bool) -> dict:
+    url = f"http://{settings.qdrant_host}:{settings.qdrant_port}/collections/{_COLLECTION}/points/search"
+    sizes, decode_ms, hydrate_ms = [], [], []
+    for qv in queries:
+        r = requests.post(url, json={"vector": qv, "limit": top_k, "with_payload": with_payload})
+        r.raise_for_status()
+        sizes.append(len(r.content))
+        started = time.perf_counter()
+        hits = [ScoredPoint.model_validate(h) for h in json.loads(r.content)["result"]]
+        decode_ms.append((time.perf_counter() - started) * 1000)
+        if not with_payload:
+            started = time.perf_counter()
+            chunk_store.get_many([str(h.id) for h in hits])
+            hydrate_ms.append((time.perf_counter() - started) * 1000)
+    out = {
+        "avg_response_bytes": round(sum(sizes) / len(sizes)),
+        "avg_decode_ms": round(sum(decode_ms) / len(decode_ms), 3),
+    }
+    if hydrate_ms:
+        out["avg_hydrate_ms"] = round(sum(hydrate_ms) / len(hydrate_ms), 3)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=settings.retrieval_top_k)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        chunk_store._path = lambda: Path(tmp) / "chunk_store.db"
+        if client.collection_exists(_COLLECTION):
+            client.delete_collection(_COLLECTION)
+        client.create_collection(
+            _COLLECTION, vectors_config=VectorParams(size=settings.vector_size, distance=Distance.COSINE)
+        )
+        try:
+            points = [PointStruct(id=i, vector=_vec(rng), payload=_payload(i, rng)) for i in range(args.points)]
+            for i in range(0, len(points), 256):
+                client.upsert(_COLLECTION, points=points[i : i + 256])
+            chunk_store.put_many([(str(p.id), p.payload) for p in points])
+
+            queries = [_vec(rng) for _ in range(args.queries)]
+            report = {
+                "points": args.points,
+                "top_k": args.top_k,
+                "full_payload": _run(queries, args.top_k, with_payload=True),
+                "slim_with_local_store": _run(queries, args.top_k, with_payload=False),
+            }
+        finally:
+            client.delete_collection(_COLLECTION)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Search and upsert latency over REST vs gRPC, sync and async clients.
+
+Needs a running Qdrant with both ports reachable (QDRANT_HOST, QDRANT_PORT, QDRANT_GRPC_PORT);
+uses a throwaway collection.
+
+    python -m backend.benchmarks.qdrant_transport --points 5000 --queries 300
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from backend.app.config import get_settings
+from backend.app.vector.qdrant import _client_kwargs
+
+settings = get_settings()
+
+_COLLECTION = "opencity_bench_transport"
+
+
+def _vec(rng: random.Random) -> list[float]:
+    return [rng.uniform(-1, 1) for _ in range(settings.vector_size)]
+
+
+def _pct(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        "p50": round(values[len(values) // 2], 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "mean": round(sum(values) / len(values), 3),
+    }
+
+
+def _payload(i: int) -> dict:
+    return {"city_id": "bench", "uri": f"https://bench.example.gov/{i // 5}", "text": "lorem ipsum " * 80}
+
+
+def _bench_sync(c: QdrantClient, queries: list[list[float]], batches: list[list[PointStruct]], top_k: int) -> dict:
+    search_ms, upsert_ms = [], []
+    for qv in queries:
+        started = time.perf_counter()
+        c.search(_COLLECTION, query_vector=qv, limit=top_k, with_payload=True)
+        search_ms.append((time.perf_counter() - started) * 1000)
+    for batch in batches:
+        started = time.perf_counter()
+        c.upsert(_COLLECTION, points=batch, wait=True)
+        upsert_ms.append((time.perf_counter() - started) * 1000)
+    return {"search_ms": _pct(search_ms), "upsert_batch_ms": _pct(upsert_ms)}
+
+
+async def _bench_async(prefer_grpc: bool, queries: list[list[float]], top_k: int, concurrency: int) -> dict:
+    c = AsyncQdrantClient(**{**_client_kwargs(), "prefer_grpc": prefer_grpc})
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def _one(qv: list[float]) -> None:
+        async with sem:
+            started = time.perf_counter()
+            await c.search(_COLLECTION, query_vector=qv, limit=top_k, with_payload=True)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(qv) for qv in queries))
+    elapsed = time.perf_counter() - started
+    await c.close()
+    return {"search_ms": _pct(latencies), "qps": round(len(queries) / elapsed, 1), "concurrency": concurrency}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=settings.retrieval_top_k)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    rest = QdrantClient(**{**_client_kwargs(), "prefer_grpc": False})
+    grpc_client = QdrantClient(**{**_client_kwargs(), "prefer_grpc": True})
+
+    if rest.collection_exists(_COLLECTION):
+        rest.delete_collection(_COLLECTION)
+    rest.create_collection(_COLLECTION, vectors_config=VectorParams(size=settings.vector_size, distance=Distance.COSINE))
+    try:
+        points = [PointStruct(id=i, vector=_vec(rng), payload=_payload(i)) for i in range(args.points)]
+        batches = [points[i : i + args.batch] for i in range(0, len(points), args.batch)]
+        for batch in batches:
+            rest.upsert(_COLLECTION, points=batch, wait=True)
+        queries = [_vec(rng) for _ in range(args.queries)]
+
+        report = {
+            "points": args.points,
+            "top_k": args.top_k,
+            "upsert_batch": args.batch,
+            "rest": _bench_sync(rest, queries, batches, args.top_k),
+            "grpc": _bench_sync(grpc_client, queries, batches, args.top_k),
+            "rest_async": asyncio.run(_bench_async(False, queries, args.top_k, args.concurrency)),
+            "grpc_async": asyncio.run(_bench_async(True, queries, args.top_k, args.concurrency)),
+        }
+    finally:
+        rest.delete_collection(_COLLECTION)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""SSE framing cost: frames and bytes per answer, and server CPU per stream under concurrency.
+
+Streams the golden questions through the ASGI app (in-process Qdrant, hash embedder, mock
+Ollama) once per framing config: one frame per token vs coalesced flushes.
+
+    python -m backend.benchmarks.sse --clients 64 --tokens-per-sec 400
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from qdrant_client import QdrantClient
+
+import backend.app.analytics.store as analytics_store
+import backend.app.rag.retrieve as retrieve
+import backend.app.vector.qdrant as vector
+from backend.app.cities import get_registry
+from backend.app.config import get_settings
+from backend.app.main import app
+from backend.benchmarks.harness import DEFAULT_GOLDEN, HashEmbedder, load_index
+from backend.benchmarks.mock_ollama import MockOllama
+
+settings = get_settings()
+
+
+async def _stream(client: httpx.AsyncClient, case: dict, gzip_meta: bool) -> tuple[int, int, int]:
+    resp = await client.post(
+        "/v1/query/stream", json={"city_id": case["city_id"], "query": case["question"], "gzip_meta": gzip_meta}
+    )
+    frames = [f for f in resp.text.split("\n\n") if f]
+    meta = next((f for f in frames if f.startswith("event: meta")), "")
+    return len(frames), len(resp.content), len(meta.encode())
+
+
+async def _run(cases: list[dict], clients: int, gzip_meta: bool) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        sem = asyncio.Semaphore(clients)
+
+        async def _one(case: dict) -> tuple[int, int, int]:
+            async with sem:
+                return await _stream(client, case, gzip_meta)
+
+        work = [cases[i % len(cases)] for i in range(clients * 2)]
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        results = await asyncio.gather(*(_one(c) for c in work))
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+
+    n = len(results)
+    return {
+        "streams": n,
+        "frames_per_answer": round(sum(r[0] for r in results) / n, 1),
+        "bytes_per_answer": round(sum(r[1] for r in results) / n),
+        "meta_bytes": round(sum(r[2] for r in results) / n),
+        "cpu_ms_per_stream": round(cpu * 1000 / n, 2),
+        "wall_s": round(wall, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--tokens-per-sec", type=float, default=400.0)
+    args = parser.parse_args()
+
+    golden = json.loads(args.golden.read_text(encoding="utf-8"))
+    vector.client = QdrantClient(":memory:")
+    settings.qdrant_async_search = False
+    embedder = HashEmbedder(settings.vector_size)
+    retrieve._embedder = lambda: embedder
+    settings.similarity_threshold = 0.2
+    settings.coalesce_queries = False
+
+    mock = MockOllama(tokens_per_sec=args.tokens_per_sec, prefill_ms=5)
+    settings.ollama_base_url = mock.start()
+    configs = {
+        "per_token": {"sse_flush_ms": 0, "sse_flush_bytes": 0, "gzip_meta": False},
+        "coalesced": {
+            "sse_flush_ms": settings.sse_flush_ms,
+            "sse_flush_bytes": settings.sse_flush_bytes,
+            "gzip_meta": False,
+        },
+        "coalesced_gzip_meta": {
+            "sse_flush_ms": settings.sse_flush_ms,
+            "sse_flush_bytes": settings.sse_flush_bytes,
+            "gzip_meta": True,
+        },
+    }
+    report: dict = {"clients": args.clients, "tokens_per_sec": args.tokens_per_sec}
+    with tempfile.TemporaryDirectory() as tmp:
+        events_path = Path(tmp) / "analytics_events.jsonl"
+        analytics_store._events_path = lambda: events_path
+        # The query API only serves registered cities.
+        settings.city_config_dir = str(Path(tmp) / "cities")
+        for city_id in sorted({c["city_id"] for c in golden["cases"]}):
+            get_registry().create(city_id, city_id)
+        try:
+            load_index(golden["documents"])
+            for name, cfg in configs.items():
+                settings.sse_flush_ms = cfg["sse_flush_ms"]
+                settings.sse_flush_bytes = cfg["sse_flush_bytes"]
+                report[name] = asyncio.run(_run(golden["cases"], args.clients, cfg["gzip_meta"]))
+        finally:
+            mock.stop()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
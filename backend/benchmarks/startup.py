@@ -0,0 +1,59 @@
+"""API import time and first-request embedding latency, each in a fresh interpreter.
+
+    python -m backend.benchmarks.startup --runs 3
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+_IMPORT_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import backend.app.main
+ms = (time.perf_counter() - t) * 1000
+heavy = ["fastembed", "onnxruntime", "qdrant_client", "bs4", "lxml", "backend.app.ingestion.sync"]
+print(json.dumps({"import_ms": ms, "loaded": [m for m in heavy if m in sys.modules]}))
+"""
+
+_EMBED_PROBE = """
+import json, time
+from backend.app.rag.retrieve import embed_text
+t = time.perf_counter()
+embed_text("How do I report a broken streetlight?")
+cold = (time.perf_counter() - t) * 1000
+t = time.perf_counter()
+embed_text("How do I renew a parking permit?")
+warm = (time.perf_counter() - t) * 1000
+print(json.dumps({"first_embed_ms": cold, "warm_embed_ms": warm}))
+"""
+
+
+def _probe(code: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip-embed", action="store_true", help="skip the probe that needs the embedding model")
+    args = parser.parse_args()
+
+    imports = [_probe(_IMPORT_PROBE) for _ in range(args.runs)]
+    report: dict = {
+        "import_ms": [round(r["import_ms"], 1) for r in imports],
+        "heavy_modules_loaded_at_import": imports[-1]["loaded"],
+    }
+    if not args.skip_embed:
+        embeds = [_probe(_EMBED_PROBE) for _ in range(args.runs)]
+        # The cold/warm gap is what the lifespan preload moves off the first user request.
+        report["first_embed_ms"] = [round(r["first_embed_ms"], 1) for r in embeds]
+        report["warm_embed_ms"] = [round(r["warm_embed_ms"], 1) for r in embeds]
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Sync worker scaling: sources/sec with 1..N worker processes sharing one Postgres queue.
+
+Serves a synthetic site from this process and, for each worker count, enqueues it as a
+fresh city and starts that many ``--once`` worker processes. Each worker embeds with a
+single thread, so throughput should grow linearly until the cores are saturated. The report
+also checks that no job ran twice. Needs the Postgres and Qdrant from ``DATABASE_URL`` /
+``QDRANT_HOST``:
+
+    docker compose up -d postgres qdrant
+    python -m backend.benchmarks.sync_workers --pages 400 --workers 1 2 4 8
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from qdrant_client.models import FieldCondition, Filter, MatchValue
+from sqlalchemy import delete, func, select
+
+from backend.app.config import get_settings
+from backend.app.db.jobs import enqueue_city
+from backend.app.db.models import Chunk, City, Source, SyncJob
+from backend.app.db.postgres import engine, init_db
+from backend.app.vector.qdrant import client, ensure_collection
+
+settings = get_settings()
+
+_WORDS = (
+    "permit parking street permit renewal resident zone library hours branch tax property assessment "
+    "recycling collection schedule bulky item pickup council meeting agenda minutes park reservation "
+    "building inspection license business fee payment online office appointment transit pass fare"
+).split()
+
+
+def _page(i: int, paragraphs: int) -> bytes:
+    rng = random.Random(i)
+    body = "".join(
+        f"<p>{' '.join(rng.choice(_WORDS) for _ in range(60)).capitalize()}.</p>" for _ in range(paragraphs)
+    )
+    return f"<html><head><title>Page {i}</title></head><body>{body}</body></html>".encode()
+
+
+def _serve(pages: int, paragraphs: int) -> ThreadingHTTPServer:
+    cache = {f"/p/{i}.html": _page(i, paragraphs) for i in range(pages)}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args) -> None:
+            return
+
+        def do_GET(self) -> None:
+            body = cache.get(self.path)
+            self.send_response(200 if body else 404)
+            self.send_header("content-type", "text/html")
+            self.send_header("content-length", str(len(body or b"")))
+            self.end_headers()
+            self.wfile.write(body or b"")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _cleanup(city_id: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(delete(SyncJob).where(SyncJob.city_id == city_id))
+        conn.execute(delete(Source).where(Source.city_id == city_id))
+        conn.execute(delete(Chunk).where(Chunk.city_id == city_id))
+        conn.execute(delete(City).where(City.city_id == city_id))
+    client.delete(
+        collection_name=settings.qdrant_collection,
+        points_selector=Filter(must=[FieldCondition(key="city_id", match=MatchValue(value=city_id))]),
+    )
+
+
+def _run(workers: int, base_url: str, pages: int, embedder: str) -> dict:
+    city_id = f"bench_sync_w{workers}"
+    _cleanup(city_id)
+    sources = [{"type": "url", "uri": f"{base_url}/p/{i}.html"} for i in range(pages)]
+    enqueue_city(city_id, city_id, sources)
+
+    cmd = [sys.executable, "-m", "backend.benchmarks.sync_workers", "--worker", city_id, "--embedder", embedder]
+    env = {**os.environ, "OMP_NUM_THREADS": "1"}
+    started = time.perf_counter()
+    procs = [subprocess.Popen(cmd, env=env) for _ in range(workers)]
+    for p in procs:
+        p.wait()
+    wall = time.perf_counter() - started
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(SyncJob.status, SyncJob.worker_id, SyncJob.attempts).where(SyncJob.city_id == city_id)
+        ).all()
+        chunks = conn.scalar(select(func.count()).select_from(Chunk).where(Chunk.city_id == city_id))
+    per_worker: dict[str, int] = {}
+    for _, worker_id, _ in rows:
+        per_worker[worker_id] = per_worker.get(worker_id, 0) + 1
+    _cleanup(city_id)
+    return {
+        "workers": workers,
+        "wall_s": round(wall, 2),
+        "sources_per_sec": round(pages / wall, 2),
+        "done": sum(1 for r in rows if r.status == "done"),
+        "jobs_run_twice": sum(1 for r in rows if r.attempts > 1),
+        "jobs_per_worker": sorted(per_worker.values()),
+        "chunks": chunks,
+    }
+
+
+def _worker(city_id: str, embedder: str) -> None:
+    import backend.app.rag.retrieve as retrieve
+    from backend.app.ingestion.worker import SyncWorker
+
+    if embedder == "hash":
+        from backend.benchmarks.harness import HashEmbedder
+
+        model = HashEmbedder(settings.vector_size)
+    else:
+        from fastembed import TextEmbedding
+
+        model = TextEmbedding(model_name=settings.embedding_model, threads=1)
+    retrieve._embedder = lambda: model
+    SyncWorker(city_id=city_id).run(once=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--paragraphs", type=int, default=6)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--embedder", choices=["hash", "fastembed"], default="fastembed")
+    parser.add_argument("--worker", metavar="CITY_ID", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker, args.embedder)
+        return
+
+    init_db()
+    ensure_collection()
+    server = _serve(args.pages, args.paragraphs)
+    base_url = "http://{}:{}".format(*server.server_address[:2])
+    report: dict = {"cpus": os.cpu_count(), "pages": args.pages, "embedder": args.embedder, "runs": []}
+    try:
+        for n in args.workers:
+            report["runs"].append(_run(n, base_url, args.pages, args.embedder))
+    finally:
+        server.shutdown()
+
+    base = report["runs"][0]["sources_per_sec"] / report["runs"][0]["workers"]
+    for run in report["runs"]:
+        run["speedup"] = round(run["sources_per_sec"] / base, 2)
+        run["efficiency"] = round(run["speedup"] / run["workers"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
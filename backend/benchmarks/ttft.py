@@ -0,0 +1,87 @@
+"""Cold vs warm time-to-first-token against a running Ollama.
+
+    python -m backend.benchmarks.ttft --runs 5
+"""
+
+import argparse
+import json
+import time
+
+import requests
+
+from backend.app.config import get_settings
+from backend.app.rag.generate import build_prompt, ollama_payload
+
+settings = get_settings()
+
+_SAMPLE_CHUNKS = [
+    {
+        "title": "Streetlight repair",
+        "uri": "https://example.org/streetlights",
+        "text": "To report a broken streetlight, call 311 or use the 311 app. Repairs usually take five business days.",
+    },
+    {
+        "title": "Parking permits",
+        "uri": "https://example.org/parking",
+        "text": "Residential parking permits can be renewed online. Renewal requires proof of residency.",
+    },
+]
+
+_QUESTIONS = [
+    "How do I report a broken streetlight?",
+    "How long do streetlight repairs take?",
+    "How do I renew a parking permit?",
+    "What do I need to renew a residential permit?",
+]
+
+
+def _unload() -> None:
+    requests.post(
+        f"{settings.ollama_base_url}/api/generate",
+        json={"model": settings.ollama_model, "keep_alive": 0},
+        timeout=settings.ollama_timeout_sec,
+    )
+
+
+def _first_token_ms(prompt: str) -> int:
+    started = time.perf_counter()
+    with requests.post(
+        f"{settings.ollama_base_url}/api/generate",
+        json=ollama_payload(prompt, stream=True),
+        timeout=settings.ollama_timeout_sec,
+        stream=True,
+    ) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line and json.loads(line).get("response"):
+                return int((time.perf_counter() - started) * 1000)
+    return int((time.perf_counter() - started) * 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    prompts = [build_prompt(q, _SAMPLE_CHUNKS) for q in _QUESTIONS]
+
+    _unload()
+    cold = _first_token_ms(prompts[0])
+    warm = [_first_token_ms(prompts[i % len(prompts)]) for i in range(1, args.runs + 1)]
+
+    print(
+        json.dumps(
+            {
+                "model": settings.ollama_model,
+                "keep_alive": settings.ollama_keep_alive,
+                "cold_ttft_ms": cold,
+                "warm_ttft_ms": warm,
+                "warm_ttft_ms_min": min(warm) if warm else None,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
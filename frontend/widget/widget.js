@@ -32,6 +32,48 @@ function appendCitations(citations) {
   answerEl.textContent += `\n\nSources:\n${lines.join('\n')}`;
 }
 
+// Large meta events (citations) may arrive gzipped and base64-encoded.
+const canInflate = typeof DecompressionStream !== 'undefined';
+
+async function inflateMeta(data) {
+  if (data.encoding !== 'gzip') return data;
+  const bytes = Uint8Array.from(atob(data.data), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+  return JSON.parse(await new Response(stream).text());
+}
+
+// Tokens arrive in coalesced frames; paint them into one text node once per animation frame.
+function createAnswerWriter(el) {
+  let node = null;
+  let pending = '';
+  let scheduled = false;
+  const paint = () => {
+    scheduled = false;
+    if (!pending) return;
+    if (!node) {
+      node = document.createTextNode('');
+      el.appendChild(node);
+    }
+    node.appendData(pending);
+    pending = '';
+  };
+  return {
+    append(text) {
+      pending += text;
+      if (!scheduled) {
+        scheduled = true;
+        requestAnimationFrame(paint);
+      }
+    },
+    flush: paint,
+    reset() {
+      pending = '';
+      node = null;
+      el.textContent = '';
+    }
+  };
+}
+
 async function readSSE(response, onEvent) {
   const reader = response.body.getReader();
   const decoder = new TextDecoder();
@@ -52,11 +94,14 @@ async function readSSE(response, onEvent) {
         if (line.startsWith('data:')) dataStr += line.slice(5).trim();
       }
       if (!dataStr) continue;
+      let data;
       try {
-        onEvent(event, JSON.parse(dataStr));
+        data = JSON.parse(dataStr);
       } catch (_) {
         // ignore malformed lines
+        continue;
       }
+      await onEvent(event, data);
     }
   }
 }
@@ -100,20 +145,27 @@ async function runQuery() {
     const res = await fetch('http://localhost:8000/v1/query/stream', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ city_id: cityId, query })
+      body: JSON.stringify({ city_id: cityId, query, gzip_meta: canInflate })
     });
 
-    answerEl.textContent = '';
-    await readSSE(res, (event, data) => {
+    const writer = createAnswerWriter(answerEl);
+    writer.reset();
+    await readSSE(res, async (event, data) => {
       if (event === 'meta') {
-        lastQueryMeta = data;
-        lastCitations = data.citations || [];
-        setMeta(data);
+        const meta = await inflateMeta(data);
+        lastQueryMeta = meta;
+        lastCitations = meta.citations || [];
+        setMeta(meta);
       } else if (event === 'token') {
-        answerEl.textContent += data.token || '';
+        writer.append(data.token || '');
+      } else if (event === 'reset') {
+        // Server aborted a failing answer; a fallback follows.
+        writer.reset();
       } else if (event === 'done') {
+        writer.flush();
         appendCitations(lastCitations);
       } else if (event === 'error') {
+        writer.reset();
         answerEl.textContent = data.error || 'Streaming error.';
       }
     });